@@ -0,0 +1,196 @@
+"""
+Banc d'essai des moteurs de combat (`manage.py bench_battle`).
+
+Armées synthétiques en `ArmySpec` (aucune base de données) : taille,
+composition (mêlée, distance, zone) et placement varient ; chaque
+configuration est jouée une fois sous tracemalloc pour le pic mémoire,
+puis plusieurs fois par moteur, chronométrée de bout en bout
+(préparation puis combat), et une dernière fois instrumentée
+(`BattleProfile`) pour le détail par phase et les compteurs.
+"""
+
+import math
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .services import (
+    BATTLE_ENGINES,
+    GRID_SIZE,
+    LOG_FULL,
+    ArmySpec,
+    BattleStream,
+    UnitSpec,
+    UnitTypeSpec,
+    board_for,
+)
+
+SIZES = (1, 5, 10, 25, 50, 100, 200)
+PLACEMENTS = ("random", "formation")
+
+# Types d'unités du banc : profils proches du catalogue war3.
+BENCH_UNIT_TYPES = (
+    UnitTypeSpec(name="melee", defense=2, health=420, attack_speed=0.74, range=1, damage_min=12, damage_max=13,
+                 armor_type="heavy"),
+    UnitTypeSpec(name="ranged", defense=0, health=310, attack_speed=0.67, range=5, damage_min=17, damage_max=19,
+                 attack_type="piercing", armor_type="medium"),
+    UnitTypeSpec(name="aoe", defense=0, health=360, attack_speed=0.29, move_speed=0.5, range=6, damage_min=51,
+                 damage_max=60, aoe_radius=1, attack_type="siege", armor_type="heavy"),
+)
+
+# Part de chaque type d'unité, dans l'ordre de BENCH_UNIT_TYPES.
+MIXES: Dict[str, Tuple[float, float, float]] = {
+    "melee": (1.0, 0.0, 0.0),
+    "ranged": (0.0, 1.0, 0.0),
+    "aoe": (0.0, 0.0, 1.0),
+    "mixed": (0.5, 0.35, 0.15),
+}
+
+
+def bench_board(size: int) -> Tuple[int, int]:
+    """
+    Plateau assez grand pour déployer `size` stacks par camp avec du jeu :
+    zone de déploiement (un cinquième de la largeur) d'au moins 1,5 × size
+    cases, plateau deux fois plus large que haut, 10 × 10 au minimum.
+    """
+    depth = max(2, math.ceil(math.sqrt(0.6 * size)))
+    width = max(GRID_SIZE, 5 * depth)
+    return width, max(GRID_SIZE, math.ceil(width / 2))
+
+
+def synthetic_army(name: str, size: int, mix: str, placement: str, side: str, board: Tuple[int, int]) -> ArmySpec:
+    """
+    `size` stacks répartis selon `MIXES[mix]`. En "formation", mêlée devant,
+    distance et zone derrière, colonne par colonne depuis la ligne de front ;
+    en "random", positions laissées au placement aléatoire du combat.
+    """
+    counts = [math.floor(size * share) for share in MIXES[mix]]
+    counts[max(range(3), key=lambda i: MIXES[mix][i])] += size - sum(counts)
+    unit_types = [ut.name for ut, count in zip(BENCH_UNIT_TYPES, counts) for _ in range(count)]
+
+    width, height = board
+    positions: List[Tuple[Optional[int], Optional[int]]] = [(None, None)] * size
+    if placement == "formation":
+        columns = board_for(width, height).deployment_columns(side)
+        if side == "attacker":
+            columns = columns[::-1]  # front d'abord
+        # le combat recale le défenseur sur le bord droit (`_fit_to_board`)
+        shift = width - GRID_SIZE if side == "defender" else 0
+        for idx in range(size):
+            column, y = divmod(idx, height)
+            positions[idx] = (columns[column] - shift, y)
+
+    units = tuple(UnitSpec(unit_type, x, y, None) for unit_type, (x, y) in zip(unit_types, positions))
+    return ArmySpec(name=name, unit_types=BENCH_UNIT_TYPES, units=units)
+
+
+def _percentile(values: Sequence[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def _timed_battle(attacker: ArmySpec, defender: ArmySpec, options: Dict) -> Tuple[float, float, int, Dict]:
+    start = time.perf_counter()
+    stream = BattleStream(attacker, defender, **options)
+    prepared = time.perf_counter()
+    events = sum(len(round_events) for round_events in stream)
+    done = time.perf_counter()
+    return prepared - start, done - prepared, events, stream.outcome
+
+
+def bench_config(
+    size: int,
+    mix: str,
+    placement: str,
+    engine: str,
+    battles: int = 3,
+    seed: int = 0,
+    verbosity: str = LOG_FULL,
+    max_rounds: int = 60,
+    board: Optional[Tuple[int, int]] = None,
+) -> Dict:
+    """
+    Joue `battles` combats semés d'une configuration et rend ses mesures :
+    un combat de mise en route, une passe mémoire (tracemalloc) à part, puis
+    les combats chronométrés, sans traçage. `board` impose le plateau
+    (par défaut `bench_board(size)`) : (100, 100) pour l'échelle guerre, où
+    les stacks partent à plus de `FLOW_DEPTH_CAP` cases de l'ennemi.
+    """
+    board = tuple(board) if board else bench_board(size)
+    attacker = synthetic_army("A", size, mix, placement, "attacker", board)
+    defender = synthetic_army("D", size, mix, placement, "defender", board)
+    options = {
+        "engine": engine,
+        "width": board[0],
+        "height": board[1],
+        "verbosity": verbosity,
+        "max_rounds": max_rounds,
+        "profile": False,
+    }
+
+    # mise en route (imports, caches) hors mesure : ni tracemalloc ni chronomètre
+    _timed_battle(attacker, defender, {**options, "seed": seed})
+    # passe mémoire à part : tracemalloc ralentit chaque allocation
+    tracemalloc.start()
+    try:
+        _timed_battle(attacker, defender, {**options, "seed": seed})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    setup, combat, events, rounds = [], [], 0, 0
+    for idx in range(battles):
+        setup_time, combat_time, battle_events, outcome = _timed_battle(attacker, defender, {**options, "seed": seed + idx})
+        setup.append(setup_time)
+        combat.append(combat_time)
+        events += battle_events
+        rounds += outcome["rounds"]
+    # détail par phase : un combat de plus, instrumenté (l'instrumentation a un coût)
+    profiled = _timed_battle(attacker, defender, {**options, "seed": seed, "profile": True})[3]["profile"]
+
+    latency = [s + c for s, c in zip(setup, combat)]
+    total = sum(latency)
+    return {
+        "size": size,
+        "mix": mix,
+        "placement": placement,
+        "engine": engine,
+        "board": list(board),
+        "battles": battles,
+        "rounds": rounds,
+        "events": events,
+        "battles_per_sec": battles / total if total else None,
+        "events_per_sec": events / total if total else None,
+        "latency_ms": {
+            "p50": _percentile(latency, 0.5) * 1000,
+            "p95": _percentile(latency, 0.95) * 1000,
+            "max": max(latency) * 1000,
+        },
+        "phases_ms": {
+            "setup_p50": _percentile(setup, 0.5) * 1000,
+            "combat_p50": _percentile(combat, 0.5) * 1000,
+            **profiled["timings_ms"],
+        },
+        "counters": profiled["counters"],
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def run_bench(
+    sizes: Sequence[int] = SIZES,
+    mixes: Sequence[str] = tuple(MIXES),
+    placements: Sequence[str] = PLACEMENTS,
+    engines: Sequence[str] = tuple(BATTLE_ENGINES),
+    **options,
+) -> List[Dict]:
+    return [
+        bench_config(size, mix, placement, engine, **options)
+        for size in sizes
+        for mix in mixes
+        for placement in placements
+        for engine in engines
+    ]
+
+
+def bench_key(result: Dict) -> Tuple:
+    return result["size"], result["mix"], result["placement"], result["engine"], tuple(result["board"])
@@ -0,0 +1,91 @@
+"""
+Combats de référence (« golden ») du moteur de combat.
+
+`fixtures/golden_battles.json` fige des affrontements semés — armées en
+`ArmySpec` tirées de `fixtures/sample_data.json` et du catalogue war3
+(`import_war3_units`), paramètres du combat — et leur résultat attendu :
+issue, résumé, empreinte du journal et empreintes courtes de chaque
+événement, tour par tour. Toute optimisation du moteur doit les retrouver
+à l'identique ; sinon `explain_divergence` dit quel est le premier
+événement qui a changé. `manage.py golden_battles` vérifie ou régénère.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .services import ArmySpec, BattleStream
+
+GOLDEN_PATH = Path(__file__).resolve().parent / "fixtures" / "golden_battles.json"
+
+# Champs du résultat comparés tels quels.
+OUTCOME_FIELDS = ("winner", "rounds", "end_reason", "attacker_remaining", "defender_remaining", "summary")
+
+
+def _canonical(data) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+
+def event_digest(event: Dict) -> str:
+    return hashlib.sha1(_canonical(event)).hexdigest()[:8]
+
+
+def load_golden(path: Path = GOLDEN_PATH) -> Dict:
+    """`{"matchups": {nom: {source, attacker, defender}}, "cases": [{name, matchup, params, expected}]}`."""
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_golden(golden: Dict, path: Path = GOLDEN_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(golden, fh, indent=1, ensure_ascii=False)
+        fh.write("\n")
+
+
+def run_golden_case(case: Dict, matchup: Dict) -> Tuple[List[List[Dict]], Dict]:
+    """Rejoue un cas : événements par tour et résultat (sans journal)."""
+    attacker, defender = ArmySpec.from_dict(matchup["attacker"]), ArmySpec.from_dict(matchup["defender"])
+    stream = BattleStream(attacker, defender, **case["params"])
+    rounds = list(stream)
+    return rounds, stream.outcome
+
+
+def golden_expectation(rounds: List[List[Dict]], outcome: Dict) -> Dict:
+    """Ce que `golden_battles.json` retient d'un combat."""
+    expected = {name: outcome[name] for name in OUTCOME_FIELDS}
+    # aller-retour JSON : mêmes types que le fichier relu (tuples, clés None…)
+    expected = json.loads(json.dumps(expected))
+    expected["log_digest"] = hashlib.sha256(_canonical([event for events in rounds for event in events])).hexdigest()
+    expected["events"] = [" ".join(event_digest(event) for event in events) for events in rounds]
+    return expected
+
+
+def explain_divergence(case: Dict, rounds: List[List[Dict]], outcome: Dict) -> Optional[str]:
+    """None si le combat rejoué est conforme, sinon le premier écart en clair."""
+    expected = case["expected"]
+    actual = golden_expectation(rounds, outcome)
+    if actual == expected:
+        return None
+
+    previous = None
+    for idx, (want, got) in enumerate(zip(expected["events"], actual["events"])):
+        want, got = want.split(), got.split()
+        for pos, (want_digest, got_digest) in enumerate(zip(want, got)):
+            if want_digest != got_digest:
+                return (
+                    f"{case['name']} : premier écart au tour {idx + 1}, événement {pos + 1} ; "
+                    f"obtenu {rounds[idx][pos]!r}, après {previous!r}"
+                )
+            previous = rounds[idx][pos]
+        if len(want) != len(got):
+            extra = rounds[idx][len(want)] if len(got) > len(want) else None
+            return (
+                f"{case['name']} : le tour {idx + 1} compte {len(got)} événements au lieu de {len(want)}"
+                + (f" ; en trop : {extra!r}" if extra else f" ; le dernier conforme : {previous!r}")
+            )
+    if len(expected["events"]) != len(actual["events"]):
+        return f"{case['name']} : {len(actual['events'])} tours joués au lieu de {len(expected['events'])}"
+
+    changed = [name for name in (*OUTCOME_FIELDS, "log_digest") if expected.get(name) != actual.get(name)]
+    return f"{case['name']} : journal identique mais résultat différent ({', '.join(changed)})"
@@ -0,0 +1,84 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from armies.bench import MIXES, PLACEMENTS, SIZES, bench_key, run_bench
+from armies.services import BATTLE_ENGINES, LOG_FULL, LOG_LEVELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les moteurs de combat sur des armées synthétiques (1 à 200 stacks, plus avec --board) : "
+        "combats/s, événements/s, latences p50/p95, pic mémoire. Sortie JSON comparable d'un run à l'autre."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="Stacks par camp.")
+        parser.add_argument("--mixes", nargs="+", choices=MIXES, default=list(MIXES))
+        parser.add_argument("--placements", nargs="+", choices=PLACEMENTS, default=list(PLACEMENTS))
+        parser.add_argument("--engines", nargs="+", choices=BATTLE_ENGINES, default=list(BATTLE_ENGINES))
+        parser.add_argument("--battles", type=int, default=3, help="Combats chronométrés par configuration.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--max-rounds", type=int, default=60)
+        parser.add_argument(
+            "--board", nargs=2, type=int, metavar=("LARGEUR", "HAUTEUR"),
+            help="Plateau imposé à toutes les tailles (ex. 100 100 pour l'échelle guerre).",
+        )
+        parser.add_argument("--log-level", choices=LOG_LEVELS, default=LOG_FULL)
+        parser.add_argument("--output", help="Fichier JSON où écrire les résultats.")
+        parser.add_argument("--compare", help="Résultats JSON d'un run précédent : affiche le rapport des latences p50.")
+
+    def handle(self, *args, **options):
+        if options["battles"] < 1:
+            raise CommandError("--battles doit valoir au moins 1")
+        previous = {}
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as fh:
+                    previous = {bench_key(row): row for row in json.load(fh)["results"]}
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Résultats illisibles ({options['compare']}) : {exc}")
+
+        results = run_bench(
+            sizes=options["sizes"],
+            mixes=options["mixes"],
+            placements=options["placements"],
+            engines=options["engines"],
+            battles=options["battles"],
+            seed=options["seed"],
+            verbosity=options["log_level"],
+            max_rounds=options["max_rounds"],
+            board=options["board"],
+        )
+
+        for row in results:
+            line = (
+                f"{row['size']:>4} {row['mix']:<6} {row['placement']:<9} {row['engine']:<7} "
+                f"{row['battles_per_sec']:8.1f} combats/s {row['events_per_sec']:10.0f} év./s "
+                f"p50 {row['latency_ms']['p50']:8.1f} ms p95 {row['latency_ms']['p95']:8.1f} ms "
+                f"{row['peak_memory_kb']:8.0f} Ko"
+            )
+            before = previous.get(bench_key(row))
+            if before:
+                line += f"  ×{before['latency_ms']['p50'] / row['latency_ms']['p50']:.2f} vs précédent"
+            self.stdout.write(line)
+
+        if options["output"]:
+            report = {
+                "meta": {
+                    "created_at": timezone.now().isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "battles": options["battles"],
+                    "seed": options["seed"],
+                    "max_rounds": options["max_rounds"],
+                    "board": options["board"],
+                    "log_level": options["log_level"],
+                },
+                "results": results,
+            }
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=1)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from armies.models import Battle
+from armies.services import compact_battle_log, decode_log, encode_log
+
+
+class Command(BaseCommand):
+    help = (
+        "Convertit les journaux de combat enregistrés au format compact (services.encode_log). "
+        "Avec --freeze, enregistre aussi le journal des combats stockés sans journal joués par ce moteur : "
+        "à lancer avant d'incrémenter la version d'un moteur ou de le retirer, sans quoi ils ne se rejouent plus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Compte seulement, sans rien enregistrer.")
+        parser.add_argument(
+            "--freeze", metavar="ENGINE", help="Régénère et enregistre le journal des combats joués par ENGINE."
+        )
+
+    def handle(self, *args, **options):
+        compacted = 0
+        frozen = 0
+        skipped = 0
+        for battle in Battle.objects.only("id", "log", "metadata").iterator():
+            # dict : déjà compact
+            if not isinstance(battle.log, list):
+                continue
+            if not battle.log:
+                # vide : régénéré depuis la graine, tant que le moteur garde sa version
+                replay = (battle.metadata or {}).get("replay") or {}
+                if not options["freeze"] or replay.get("engine") != options["freeze"]:
+                    continue
+                try:
+                    encoded = compact_battle_log(battle.log, battle.metadata)
+                except ValueError:  # version déjà changée : plus rejouable
+                    skipped += 1
+                    continue
+                frozen += 1
+            else:
+                # journal ancien : réécrit seulement s'il s'encode sans perte
+                try:
+                    encoded = encode_log(battle.log, battle.metadata or {})
+                except (KeyError, ValueError):
+                    encoded = None
+                if encoded is None or decode_log(encoded, battle.metadata) != battle.log:
+                    skipped += 1
+                    continue
+                compacted += 1
+            if not options["dry_run"]:
+                battle.log = encoded
+                battle.save(update_fields=["log"])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Journaux compactés: {compacted}, figés: {frozen}, laissés tels quels: {skipped}")
+        )
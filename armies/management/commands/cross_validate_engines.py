@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from armies.models import Army
+from armies.services import BATTLE_ENGINES, REFERENCE_ENGINE, TARGET_POLICIES
+from armies.validation import EngineDivergence, cross_validate_engines
+
+from .simulate_army_specs import load_spec
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare un moteur de combat à la référence sur N combats semés "
+        "(vainqueur, durée, survivants) ; échoue si les distributions divergent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("engine", choices=BATTLE_ENGINES, help="Moteur à valider.")
+        parser.add_argument("--reference", choices=BATTLE_ENGINES, default=REFERENCE_ENGINE)
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument("--armies", nargs=2, type=int, metavar=("ATTAQUANT", "DEFENSEUR"), help="Ids d'armées en base.")
+        source.add_argument("--specs", nargs=2, metavar=("ATTAQUANT", "DEFENSEUR"), help="Fichiers JSON ArmySpec.")
+        parser.add_argument("--battles", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0, help="Première graine ; les suivantes s'en déduisent.")
+        parser.add_argument("--alpha", type=float, default=0.001, help="Risque global de fausse alerte.")
+        parser.add_argument("--targeting", choices=TARGET_POLICIES, default="nearest")
+        parser.add_argument("--max-rounds", type=int, default=60)
+
+    def handle(self, *args, **options):
+        if options["armies"]:
+            try:
+                attacker, defender = (Army.objects.get(pk=pk) for pk in options["armies"])
+            except Army.DoesNotExist:
+                raise CommandError("Armée introuvable")
+        else:
+            attacker, defender = (load_spec(path) for path in options["specs"])
+
+        try:
+            report = cross_validate_engines(
+                attacker,
+                defender,
+                options["engine"],
+                reference=options["reference"],
+                battles=options["battles"],
+                seed=options["seed"],
+                alpha=options["alpha"],
+                targeting=options["targeting"],
+                max_rounds=options["max_rounds"],
+            )
+        except EngineDivergence as exc:
+            self._write_report(exc.report)
+            raise CommandError(str(exc))
+        self._write_report(report)
+        self.stdout.write(self.style.SUCCESS(f"{options['engine']} conforme à {options['reference']}"))
+
+    def _write_report(self, report):
+        for metric, row in report.items():
+            flag = "DIVERGE" if row["diverges"] else "ok"
+            self.stdout.write(
+                f"  {metric}: p={row['p_value']:.3g} {flag}  référence={row['reference']}  candidat={row['candidate']}"
+            )
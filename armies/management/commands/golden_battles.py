@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from armies.golden import explain_divergence, golden_expectation, load_golden, run_golden_case, save_golden
+
+
+class Command(BaseCommand):
+    help = (
+        "Rejoue les combats de référence (fixtures/golden_battles.json) et signale le premier "
+        "événement qui diverge ; --update enregistre les nouveaux résultats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Remplace les résultats attendus (changement de comportement voulu).",
+        )
+
+    def handle(self, *args, **options):
+        golden = load_golden()
+        failures = []
+        for case in golden["cases"]:
+            rounds, outcome = run_golden_case(case, golden["matchups"][case["matchup"]])
+            explanation = explain_divergence(case, rounds, outcome)
+            if explanation is None:
+                self.stdout.write(f"  {case['name']}: ok")
+                continue
+            self.stdout.write(f"  {explanation}")
+            failures.append(case["name"])
+            if options["update"]:
+                case["expected"] = golden_expectation(rounds, outcome)
+
+        if options["update"]:
+            save_golden(golden)
+            self.stdout.write(self.style.SUCCESS(f"Cas mis à jour: {len(failures)}"))
+        elif failures:
+            raise CommandError(f"Combats divergents : {', '.join(failures)}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(golden['cases'])} combats conformes"))
@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from armies.services import (
+    BATTLE_ENGINES,
+    GRID_SIZE,
+    LOG_FULL,
+    LOG_LEVELS,
+    TARGET_POLICIES,
+    ArmySpec,
+    simulate_battle,
+)
+
+
+def load_spec(path: str) -> ArmySpec:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return ArmySpec.from_dict(json.load(fh))
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        raise CommandError(f"Spec d'armée illisible ({path}) : {exc}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule un combat entre deux armées décrites en JSON (format ArmySpec.to_dict), "
+        "sans lire la base de données."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("attacker", help="Fichier JSON de l'armée attaquante.")
+        parser.add_argument("defender", help="Fichier JSON de l'armée défenseuse.")
+        parser.add_argument("--engine", choices=BATTLE_ENGINES, help="Défaut : settings.ARMIES_BATTLE_ENGINE.")
+        parser.add_argument("--targeting", choices=TARGET_POLICIES, default="nearest")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--max-rounds", type=int, default=60)
+        parser.add_argument("--width", type=int, default=GRID_SIZE)
+        parser.add_argument("--height", type=int, default=GRID_SIZE)
+        parser.add_argument("--aggregate", action="store_true", help="Regroupe les unités identiques adjacentes.")
+        parser.add_argument("--log-level", choices=LOG_LEVELS, default=LOG_FULL, help="Détail du journal écrit.")
+        parser.add_argument("--output", help="Écrit le résultat complet (journal compris) dans ce fichier JSON.")
+
+    def handle(self, *args, **options):
+        attacker = load_spec(options["attacker"])
+        defender = load_spec(options["defender"])
+        try:
+            outcome = simulate_battle(
+                attacker,
+                defender,
+                max_rounds=options["max_rounds"],
+                engine=options["engine"],
+                aggregate=options["aggregate"],
+                width=options["width"],
+                height=options["height"],
+                targeting=options["targeting"],
+                seed=options["seed"],
+                verbosity=options["log_level"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(outcome, fh)
+
+        winner = {"attacker": attacker.name, "defender": defender.name}.get(outcome["winner"], "égalité")
+        self.stdout.write(
+            f"Vainqueur: {winner} ({outcome['end_reason']}, {outcome['rounds']} tours, graine {outcome['replay']['seed']})"
+        )
+        for side, spec in (("attacker", attacker), ("defender", defender)):
+            total = outcome["summary"][side]["total"]
+            self.stdout.write(
+                f"  {spec.name}: {total['survivors']}/{total['engaged']} survivants, "
+                f"{total['damage_dealt']:.0f} dégâts infligés, {total['kills']} tués"
+            )
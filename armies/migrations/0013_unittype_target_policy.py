@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("armies", "0012_army_elo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="unittype",
+            name="target_policy",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "Défaut du combat"),
+                    ("nearest", "Plus proche"),
+                    ("lowest_hp", "PV les plus bas"),
+                    ("highest_threat", "Menace la plus forte"),
+                    ("focus_fire", "Tir concentré"),
+                ],
+                default="",
+                help_text="Choix de la cible en combat",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("armies", "0013_unittype_target_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="battle",
+            name="summary",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -52,8 +52,18 @@ class UnitType(models.Model):
         ("hero", "Hero"),
         ("divine", "Divine"),
     ]
+    TARGET_POLICY_CHOICES = [
+        ("", "Défaut du combat"),
+        ("nearest", "Plus proche"),
+        ("lowest_hp", "PV les plus bas"),
+        ("highest_threat", "Menace la plus forte"),
+        ("focus_fire", "Tir concentré"),
+    ]
     attack_type = models.CharField(max_length=20, choices=ATTACK_TYPE_CHOICES, default="normal")
     armor_type = models.CharField(max_length=20, choices=ARMOR_TYPE_CHOICES, default="unarmored")
+    target_policy = models.CharField(
+        max_length=20, choices=TARGET_POLICY_CHOICES, default="", blank=True, help_text="Choix de la cible en combat"
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -147,6 +157,8 @@ class Battle(models.Model):
     )
     log = models.JSONField(default=list, blank=True)
     metadata = models.JSONField(default=dict, blank=True)
+    # agrégats calculés pendant la simulation (services.BattleStats), lus sans charger log/metadata
+    summary = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
 
@@ -1,11 +1,17 @@
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, fields, replace
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import bisect
+import heapq
+import math
 import random
+import time
 from collections import deque
 
+from django.conf import settings
 from django.db import ProgrammingError
 
-from .models import Army, ArmyUnit, UnitType
+from .models import Army
 
 
 # Multipliers tirés du modèle WC3 (The Frozen Throne)
@@ -76,11 +82,33 @@ ATTACK_ARMOR_MULTIPLIERS: Dict[str, Dict[str, float]] = {
 }
 
 
+ATTACK_TYPES: Tuple[str, ...] = tuple(ATTACK_ARMOR_MULTIPLIERS)
+ARMOR_TYPES: Tuple[str, ...] = tuple(ATTACK_ARMOR_MULTIPLIERS["normal"])
+_ATTACK_CODES = {name: code for code, name in enumerate(ATTACK_TYPES)}
+_ARMOR_CODES = {name: code for code, name in enumerate(ARMOR_TYPES)}
+# Type inconnu = dernier code (len(table)), multiplicateur neutre.
+TYPE_MULTIPLIERS: List[List[float]] = [
+    [ATTACK_ARMOR_MULTIPLIERS[atk].get(arm, 1.0) for arm in ARMOR_TYPES] + [1.0] for atk in ATTACK_TYPES
+] + [[1.0] * (len(ARMOR_TYPES) + 1)]
+
+
+# Politiques de ciblage (UnitType.target_policy ou défaut du combat), codées par leur index.
+TARGET_POLICIES: Tuple[str, ...] = ("nearest", "lowest_hp", "highest_threat", "focus_fire")
+_NEAREST, _LOWEST_HP, _HIGHEST_THREAT, _FOCUS_FIRE = range(len(TARGET_POLICIES))
+_POLICY_CODES = {name: code for code, name in enumerate(TARGET_POLICIES)}
+
+
+def _policy_code(value: Optional[str]) -> Optional[int]:
+    """Code d'une politique de ciblage ; None (défaut du combat) si vide ou inconnue."""
+    return _POLICY_CODES.get(value or "")
+
+
+def _type_code(value: str, codes: Dict[str, int]) -> int:
+    return codes.get((value or "").lower(), len(codes))
+
+
 def _attack_vs_armor_multiplier(attack_type: str, armor_type: str) -> float:
-    atk = (attack_type or "").lower()
-    arm = (armor_type or "").lower()
-    table = ATTACK_ARMOR_MULTIPLIERS.get(atk, {})
-    return table.get(arm, 1.0)
+    return TYPE_MULTIPLIERS[_type_code(attack_type, _ATTACK_CODES)][_type_code(armor_type, _ARMOR_CODES)]
 
 
 def _armor_multiplier(armor: float) -> float:
@@ -88,25 +116,55 @@ def _armor_multiplier(armor: float) -> float:
     return 1 - (0.06 * armor) / (1 + 0.06 * abs(armor))
 
 
-@dataclass
+@lru_cache(maxsize=256)
+def _multiplier_table(
+    attack_codes: Tuple[int, ...], armor_profiles: Tuple[Tuple[int, float], ...]
+) -> Tuple[Tuple[float, ...], ...]:
+    """Multiplicateurs des types d'attaque distincts × profils d'armure distincts (type, défense)."""
+    armor = [(code, _armor_multiplier(defense)) for code, defense in armor_profiles]
+    return tuple(
+        tuple(TYPE_MULTIPLIERS[attack][code] * factor for code, factor in armor) for attack in attack_codes
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class StackLabel:
+    """Données froides d'un stack (noms, champs legacy), partagées entre copies."""
+
+    army_name: str
+    unit_name: str
+    attack_type: str
+    armor_type: str
+    speed: float = 0.0  # legacy
+    residual_hp: float = 0.0  # legacy, unused but kept for compatibility
+
+
+@dataclass(slots=True)
 class StackState:
+    """
+    État d'un stack pendant un combat.
+
+    Seuls les champs lus dans les boucles de combat sont stockés ici (slots,
+    types d'attaque/armure codés en petits entiers) ; les noms et champs
+    legacy vivent dans `label` et restent accessibles en lecture via les
+    propriétés du même nom. Construire avec `StackState.create`.
+    """
+
     stack_id: int
     army_unit_id: Optional[int]
     army_id: int
-    army_name: str
-    unit_name: str
+    label: StackLabel
     attack: float
     defense: float
     health: float
     current_hp: float
-    speed: float  # legacy
     attack_speed: float
     move_speed: float
     range: int
     damage_min: float
     damage_max: float
-    attack_type: str
-    armor_type: str
+    attack_code: int
+    armor_code: int
     crit_chance: float
     crit_multiplier: float
     dodge_chance: float
@@ -115,7 +173,85 @@ class StackState:
     position_y: Optional[int]
     attack_meter: float = 0.0
     alive: bool = True
-    residual_hp: float = 0.0  # legacy, unused but kept for compatibility
+    count: int = 1  # unités regroupées (mode agrégé), PV mis en commun dans current_hp
+    target_policy: Optional[int] = None  # code TARGET_POLICIES, None = défaut du combat
+
+    @classmethod
+    def create(
+        cls,
+        *,
+        army_name: str,
+        unit_name: str,
+        attack_type: str,
+        armor_type: str,
+        speed: float = 0.0,
+        residual_hp: float = 0.0,
+        **values,
+    ) -> "StackState":
+        label = StackLabel(army_name, unit_name, attack_type, armor_type, speed, residual_hp)
+        return cls(
+            label=label,
+            attack_code=_type_code(attack_type, _ATTACK_CODES),
+            armor_code=_type_code(armor_type, _ARMOR_CODES),
+            **values,
+        )
+
+    @property
+    def army_name(self) -> str:
+        return self.label.army_name
+
+    @property
+    def unit_name(self) -> str:
+        return self.label.unit_name
+
+    @property
+    def attack_type(self) -> str:
+        return self.label.attack_type
+
+    @property
+    def armor_type(self) -> str:
+        return self.label.armor_type
+
+    @property
+    def speed(self) -> float:
+        return self.label.speed
+
+    @property
+    def residual_hp(self) -> float:
+        return self.label.residual_hp
+
+    @property
+    def units(self) -> int:
+        """Unités encore debout : 1 pour un stack simple, jusqu'à `count` pour un groupe."""
+        if not self.alive:
+            return 0
+        if self.count == 1 or self.health <= 0:
+            return self.count
+        return min(self.count, math.ceil(self.current_hp / self.health))
+
+    @property
+    def threat(self) -> float:
+        """Dégâts moyens par seconde, avant armure (clé de la politique highest_threat)."""
+        return (self.damage_min + self.damage_max) / 2 * self.attack_speed * self.units
+
+
+def damage_multiplier_matrix(
+    attackers: Sequence["StackState"], defenders: Sequence["StackState"]
+) -> Tuple[Tuple[float, ...], ...]:
+    """
+    Multiplicateurs de dégâts attaquant × défenseur (type d'attaque/armure et
+    armure du défenseur), `matrix[i][j]` pour `attackers[i]` frappant
+    `defenders[j]`. Seule la petite table types d'attaque × profils d'armure
+    distincts est mise en cache (`_multiplier_table`) ; les stacks d'un même
+    type d'attaque partagent la même ligne.
+    """
+    attack_codes = sorted({s.attack_code for s in attackers})
+    armor_profiles = sorted({(s.armor_code, s.defense) for s in defenders})
+    table = _multiplier_table(tuple(attack_codes), tuple(armor_profiles))
+    columns = {profile: idx for idx, profile in enumerate(armor_profiles)}
+    columns = [columns[(s.armor_code, s.defense)] for s in defenders]
+    rows = {code: tuple(row[idx] for idx in columns) for code, row in zip(attack_codes, table)}
+    return tuple(rows[s.attack_code] for s in attackers)
 
 
 BASE_BONUS = {
@@ -129,41 +265,174 @@ BASE_BONUS = {
 }
 
 
-def _upgrade_bonus_for_army(army: Army) -> Dict[object, Dict[str, float]]:
-    bonuses: Dict[object, Dict[str, float]] = {"all": BASE_BONUS.copy()}
-    for link in army.upgrades.select_related("upgrade", "upgrade__unit_type").prefetch_related("upgrade__unit_types"):
-        upgrade = link.upgrade
-        try:
-            targets = {ut.id for ut in upgrade.unit_types.all()}
-        except ProgrammingError:
-            targets = set()
-        if upgrade.unit_type_id:
-            targets.add(upgrade.unit_type_id)
-        if not targets:
-            targets = {"all"}
-        attack_pct_value = getattr(upgrade, "attack_bonus_pct", 0.0) or 0.0
-        dodge_pct_value = getattr(upgrade, "dodge_bonus_pct", 0.0) or 0.0
-        crit_bonus_value = getattr(upgrade, "crit_bonus", 0.0) or 0.0
-        for target in targets:
-            bonus = bonuses.get(target, BASE_BONUS.copy())
-            bonus["attack"] += upgrade.attack_bonus * link.level
-            bonus["attack_pct"] += attack_pct_value * link.level
-            bonus["defense"] += upgrade.defense_bonus * link.level
-            bonus["health"] += upgrade.health_bonus * link.level
-            bonus["speed"] += upgrade.speed_bonus * link.level
-            bonus["dodge_pct"] += dodge_pct_value * link.level
-            bonus["crit"] += crit_bonus_value * link.level
-            bonuses[target] = bonus
+@dataclass(frozen=True)
+class UnitTypeSpec:
+    """Caractéristiques d'un type d'unité (mêmes champs et défauts que `UnitType`)."""
+
+    name: str
+    defense: float = 1
+    health: float = 5
+    speed: int = 1  # legacy
+    attack_speed: float = 1.0
+    move_speed: float = 1.0
+    range: int = 1
+    damage_min: float = 0.9
+    damage_max: float = 1.1
+    crit_chance: float = 0.1
+    crit_multiplier: float = 2.0
+    dodge_chance: float = 0.0
+    aoe_radius: int = 0
+    attack_type: str = "normal"
+    armor_type: str = "unarmored"
+    target_policy: str = ""
+
+
+@dataclass(frozen=True)
+class UpgradeSpec:
+    """Upgrade acheté par une armée : bonus par niveau, `unit_types` vide = bonus global."""
+
+    level: int = 1
+    unit_types: Tuple[str, ...] = ()
+    attack: float = 0
+    attack_pct: float = 0.0
+    defense: float = 0
+    health: float = 0
+    speed: float = 0
+    dodge_pct: float = 0.0
+    crit: float = 0.0
+
+
+@dataclass(frozen=True)
+class UnitSpec:
+    """Une unité de l'armée : nom de son type et position enregistrée (None = placée au hasard)."""
+
+    unit_type: str
+    x: Optional[int] = None
+    y: Optional[int] = None
+    id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class ArmySpec:
+    """
+    Armée en données simples, sans ORM : c'est ce que consomment les moteurs.
+
+    `from_army` lit une `Army` en base une seule fois ; une spec se
+    sérialise en JSON (`to_dict` / `from_dict`), passe d'un processus à
+    l'autre et se simule sans base de données. Les unités sans `id`
+    (specs écrites à la main) sont numérotées à la construction du combat.
+    """
+
+    name: str
+    unit_types: Tuple[UnitTypeSpec, ...] = ()
+    units: Tuple[UnitSpec, ...] = ()
+    upgrades: Tuple[UpgradeSpec, ...] = ()
+    id: int = 0
+
+    @classmethod
+    def from_army(cls, army: Army, preset: Optional[str] = None) -> "ArmySpec":
+        """`preset` : nom d'un `AttackPreset` dont les positions remplacent celles des unités."""
+        override: Dict[int, Tuple[Optional[int], Optional[int]]] = {}
+        if preset is not None:
+            found = army.attack_presets.filter(name=preset).order_by("-created_at").first()
+            for p in found.positions if found else ():
+                if p.get("army_unit_id") is not None:
+                    override[int(p["army_unit_id"])] = (p.get("x"), p.get("y"))
+
+        unit_types: Dict[str, UnitTypeSpec] = {}
+        units: List[UnitSpec] = []
+        for stack in army.units.select_related("unit_type"):
+            ut = stack.unit_type
+            if ut.name not in unit_types:
+                unit_types[ut.name] = UnitTypeSpec(
+                    name=ut.name,
+                    defense=ut.defense,
+                    health=ut.health,
+                    speed=ut.speed,
+                    attack_speed=ut.attack_speed,
+                    move_speed=ut.move_speed,
+                    range=ut.range,
+                    damage_min=ut.damage_min,
+                    damage_max=ut.damage_max,
+                    crit_chance=ut.crit_chance,
+                    crit_multiplier=ut.crit_multiplier,
+                    dodge_chance=ut.dodge_chance,
+                    aoe_radius=ut.aoe_radius,
+                    attack_type=ut.attack_type or "normal",
+                    armor_type=ut.armor_type or "unarmored",
+                    target_policy=ut.target_policy or "",
+                )
+            x, y = override.get(stack.id, (stack.position_x, stack.position_y))
+            units.append(UnitSpec(ut.name, x, y, stack.id))
+
+        upgrades: List[UpgradeSpec] = []
+        for link in army.upgrades.select_related("upgrade", "upgrade__unit_type").prefetch_related("upgrade__unit_types"):
+            upgrade = link.upgrade
+            try:
+                targets = {ut.name for ut in upgrade.unit_types.all()}
+            except ProgrammingError:
+                targets = set()
+            if upgrade.unit_type_id:
+                targets.add(upgrade.unit_type.name)
+            upgrades.append(
+                UpgradeSpec(
+                    level=link.level,
+                    unit_types=tuple(sorted(targets)),
+                    attack=upgrade.attack_bonus,
+                    attack_pct=getattr(upgrade, "attack_bonus_pct", 0.0) or 0.0,
+                    defense=upgrade.defense_bonus,
+                    health=upgrade.health_bonus,
+                    speed=upgrade.speed_bonus,
+                    dodge_pct=getattr(upgrade, "dodge_bonus_pct", 0.0) or 0.0,
+                    crit=getattr(upgrade, "crit_bonus", 0.0) or 0.0,
+                )
+            )
+        return cls(army.name, tuple(unit_types.values()), tuple(units), tuple(upgrades), army.id)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ArmySpec":
+        return cls(
+            name=data["name"],
+            unit_types=tuple(UnitTypeSpec(**ut) for ut in data.get("unit_types", ())),
+            units=tuple(UnitSpec(**u) for u in data.get("units", ())),
+            upgrades=tuple(
+                UpgradeSpec(**{**u, "unit_types": tuple(u.get("unit_types", ()))}) for u in data.get("upgrades", ())
+            ),
+            id=data.get("id", 0),
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _army_spec(army: Union[Army, ArmySpec], preset: Optional[str] = None) -> ArmySpec:
+    return army if isinstance(army, ArmySpec) else ArmySpec.from_army(army, preset)
+
+
+def _upgrade_bonus(spec: ArmySpec) -> Dict[Optional[str], Dict[str, float]]:
+    """Bonus cumulés par nom de type d'unité ; clé None = bonus global."""
+    bonuses: Dict[Optional[str], Dict[str, float]] = {None: BASE_BONUS.copy()}
+    for upgrade in spec.upgrades:
+        for target in upgrade.unit_types or (None,):
+            bonus = bonuses.setdefault(target, BASE_BONUS.copy())
+            for key in BASE_BONUS:
+                bonus[key] += getattr(upgrade, key) * upgrade.level
     return bonuses
 
 
-def build_stack_states(army: Army, positions_override: Optional[Dict[int, Tuple[int, int]]] = None) -> List[StackState]:
-    bonuses = _upgrade_bonus_for_army(army)
-    global_bonus = bonuses.get("all", {})
+def build_stack_states(
+    army: Union[Army, ArmySpec], positions_override: Optional[Dict[int, Tuple[int, int]]] = None
+) -> List[StackState]:
+    spec = _army_spec(army)
+    unit_types = {ut.name: ut for ut in spec.unit_types}
+    bonuses = _upgrade_bonus(spec)
+    global_bonus = bonuses[None]
     stacks: List[StackState] = []
-    for stack in army.units.select_related("unit_type"):
-        type_bonus = bonuses.get(stack.unit_type_id, {})
-        ut = stack.unit_type
+    for unit in spec.units:
+        ut = unit_types.get(unit.unit_type)
+        if ut is None:
+            raise ValueError(f"Type d'unité inconnu : {unit.unit_type}")
+        type_bonus = bonuses.get(ut.name, {})
         attack_flat = global_bonus.get("attack", 0) + type_bonus.get("attack", 0)
         attack_pct = global_bonus.get("attack_pct", 0.0) + type_bonus.get("attack_pct", 0.0)
         dodge_pct = min(0.5, (global_bonus.get("dodge_pct", 0.0) + type_bonus.get("dodge_pct", 0.0)))
@@ -173,13 +442,14 @@ def build_stack_states(army: Army, positions_override: Optional[Dict[int, Tuple[
         speed = ut.speed + global_bonus.get("speed", 0) + type_bonus.get("speed", 0)
         dmg_min = ut.damage_min * (1 + attack_pct) + attack_flat
         dmg_max = ut.damage_max * (1 + attack_pct) + attack_flat
+        x, y = positions_override.get(unit.id, (unit.x, unit.y)) if positions_override else (unit.x, unit.y)
         stacks.append(
-            StackState(
-                stack_id=stack.id,
-                army_id=army.id,
-                army_unit_id=stack.id,
-                army_name=army.name,
-                unit_name=stack.unit_type.name,
+            StackState.create(
+                stack_id=unit.id,
+                army_id=spec.id,
+                army_unit_id=unit.id,
+                army_name=spec.name,
+                unit_name=ut.name,
                 attack=(dmg_min + dmg_max) / 2,
                 defense=defense,
                 health=health,
@@ -196,12 +466,9 @@ def build_stack_states(army: Army, positions_override: Optional[Dict[int, Tuple[
                 crit_multiplier=ut.crit_multiplier,
                 dodge_chance=min(0.5, ut.dodge_chance + dodge_pct),
                 aoe_radius=ut.aoe_radius,
-                position_x=positions_override.get(stack.id, (stack.position_x, stack.position_y))[0]
-                if positions_override
-                else stack.position_x,
-                position_y=positions_override.get(stack.id, (stack.position_x, stack.position_y))[1]
-                if positions_override
-                else stack.position_y,
+                target_policy=_policy_code(ut.target_policy),
+                position_x=x,
+                position_y=y,
             )
         )
     return stacks
@@ -248,141 +515,537 @@ def _distance(a: Tuple[int, int], b: Tuple[int, int]) -> int:
     return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
 
 
-def _neighbors(x: int, y: int) -> List[Tuple[int, int]]:
+GRID_SIZE = 10  # côté du champ de bataille par défaut
+# Sur les grands plateaux (au-delà de 32 cases de côté), profondeur max de la
+# propagation incrémentale (`FlowField.vacate`) ; le BFS de phase, lui, couvre
+# tout le plateau.
+FLOW_DEPTH_CAP = 48
+# Au-delà, les masques de portée ne sont plus mis en cache (trop de paires case × rayon).
+_CACHED_BOARD_CELLS = 1024
+
+
+def _neighbors(x: int, y: int, width: int = GRID_SIZE, height: int = GRID_SIZE) -> List[Tuple[int, int]]:
     coords = []
     for dx in (-1, 0, 1):
         for dy in (-1, 0, 1):
             if dx == 0 and dy == 0:
                 continue
             nx, ny = x + dx, y + dy
-            if 0 <= nx < 10 and 0 <= ny < 10:
+            if 0 <= nx < width and 0 <= ny < height:
                 coords.append((nx, ny))
     return coords
 
 
-def _find_target(stack: StackState, enemies: List[StackState], in_range_only: bool = False) -> Optional[StackState]:
-    in_range = []
-    for e in enemies:
-        if not e.alive or e.position_x is None or e.position_y is None:
-            continue
-        dist = _distance((stack.position_x, stack.position_y), (e.position_x, e.position_y))
-        if dist <= stack.range:
-            in_range.append((dist, e))
-    if in_range:
-        in_range.sort(key=lambda t: t[0])
-        return in_range[0][1]
-    if in_range_only:
-        return None
-    # otherwise pick closest overall
-    candidates = []
-    for e in enemies:
-        if not e.alive or e.position_x is None or e.position_y is None:
-            continue
-        dist = _distance((stack.position_x, stack.position_y), (e.position_x, e.position_y))
-        candidates.append((dist, e))
-    if not candidates:
+# --- Bitboards -----------------------------------------------------------------
+# La grille tient dans un entier : la case (x, y) est le bit y * width + x.
+
+
+class Board:
+    """
+    Géométrie d'un champ de bataille `width` × `height`, en bitboards.
+
+    Les masques de portée (carrés de Chebyshev) sont calculés à la demande
+    par arithmétique sur les lignes, et mis en cache sur les petits
+    plateaux seulement : pas de table cases × rayons, les grands plateaux
+    (100 × 100) restent abordables en mémoire.
+    Instances partagées via `board_for`.
+    """
+
+    def __init__(self, width: int, height: int, flow_depth: Optional[int] = None):
+        if width < 2 or height < 1:
+            raise ValueError(f"Champ de bataille trop petit : {width}x{height}")
+        self.width = width
+        self.height = height
+        self.span = max(width, height)
+        self.cells = width * height
+        self.mask = (1 << self.cells) - 1
+        self.coords: List[Tuple[int, int]] = [(c % width, c // width) for c in range(self.cells)]
+        # _stacked[n] : bit 0 de n lignes consécutives (un multiplicateur qui recopie une ligne)
+        self._stacked = [((1 << (n * width)) - 1) // ((1 << width) - 1) for n in range(height + 1)]
+        self.column_masks: List[int] = [self._stacked[height] << x for x in range(width)]
+        self._not_first_column = self.mask & ~self.column_masks[0]
+        self._not_last_column = self.mask & ~self.column_masks[-1]
+        # Voisines de chaque case, dans l'ordre de _neighbors (départage des égalités).
+        self.neighbors: List[List[int]] = [
+            [ny * width + nx for nx, ny in _neighbors(x, y, width, height)] for x, y in self.coords
+        ]
+        self.flow_depth = flow_depth
+        self._ranges: Optional[Dict[Tuple[int, int], int]] = {} if self.cells <= _CACHED_BOARD_CELLS else None
+
+    def index(self, pos: Tuple[int, int]) -> Optional[int]:
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
         return None
-    candidates.sort(key=lambda t: t[0])
-    return candidates[0][1]
 
+    def range_mask(self, cell: int, radius: int) -> int:
+        """Cases à distance de Chebyshev <= radius de `cell`."""
+        radius = min(radius, self.span - 1)
+        cache = self._ranges
+        if cache is not None:
+            mask = cache.get((cell, radius))
+            if mask is not None:
+                return mask
+        x, y = self.coords[cell]
+        x0, x1 = max(0, x - radius), min(self.width - 1, x + radius)
+        y0, y1 = max(0, y - radius), min(self.height - 1, y + radius)
+        row = ((1 << (x1 - x0 + 1)) - 1) << x0
+        mask = row * self._stacked[y1 - y0 + 1] << (y0 * self.width)
+        if cache is not None:
+            cache[(cell, radius)] = mask
+        return mask
+
+    def ring_mask(self, cell: int, distance: int) -> int:
+        """Cases à distance de Chebyshev exactement `distance` de `cell`."""
+        if distance == 0:
+            return 1 << cell
+        return self.range_mask(cell, distance) & ~self.range_mask(cell, distance - 1)
+
+    def dilate(self, bits: int) -> int:
+        """Étend chaque case à ses 8 voisines (décalages masqués pour ne pas déborder d'une ligne)."""
+        row = bits | ((bits << 1) & self._not_first_column) | ((bits >> 1) & self._not_last_column)
+        return (row | (row << self.width) | (row >> self.width)) & self.mask
+
+    def deployment_columns(self, side: str) -> List[int]:
+        """Colonnes de déploiement d'un camp : un cinquième de la largeur, au moins 2."""
+        depth = min(max(2, self.width // 5), self.width // 2)
+        if side == "attacker":
+            return list(range(depth))
+        return list(range(self.width - depth, self.width))
+
+
+@lru_cache(maxsize=8)
+def board_for(width: int = GRID_SIZE, height: int = GRID_SIZE) -> Board:
+    return Board(width, height, flow_depth=None if max(width, height) <= 32 else FLOW_DEPTH_CAP)
+
+
+DEFAULT_BOARD = board_for()
+
+
+# Au-delà, `_iter_bits` parcourt l'écriture binaire : isoler le bit faible
+# coûte la longueur de l'entier, soit un parcours quadratique sur les grands plateaux.
+_ITER_BITS_SCAN = 2048
+
+
+def _iter_bits(bits: int):
+    """Index des bits à 1, du plus faible au plus fort."""
+    if bits.bit_length() <= _ITER_BITS_SCAN:
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+        return
+    text = bin(bits)
+    last = len(text) - 1
+    pos = text.rfind("1")
+    while pos > 1:
+        yield last - pos
+        pos = text.rfind("1", 0, pos)
+
+
+class Occupancy:
+    """
+    Cases occupées (toutes armées confondues) : en bitboard pour les
+    opérations de masque, en ensemble pour les tests case par case (tester
+    un bit d'un grand entier coûte sa longueur).
+    """
+
+    __slots__ = ("bits", "cells")
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+        self.cells = set(_iter_bits(bits))
+
+    def __contains__(self, cell: int) -> bool:
+        return cell in self.cells
+
+    def add(self, cell: int):
+        self.bits |= 1 << cell
+        self.cells.add(cell)
+
+    def discard(self, cell: int):
+        self.bits &= ~(1 << cell)
+        self.cells.discard(cell)
+
+    def discard_bits(self, bits: int):
+        self.bits &= ~bits
+        self.cells.difference_update(_iter_bits(bits))
+
+
+class SpatialIndex:
+    """
+    Index case -> stacks vivants d'un camp, tenu à jour pendant le combat.
+
+    Un bitboard des cases occupées par le camp permet de tester « un ennemi
+    à portée ? » en une opération et de sauter les anneaux de Chebyshev
+    vides ; seules les cases réellement occupées sont visitées. À distance
+    égale, le premier stack du roster l'emporte (même départage que l'ancien
+    tri stable).
+    """
+
+    def __init__(self, stacks: List[StackState], board: Board = DEFAULT_BOARD):
+        self.board = board
+        self.cells: List[List[Tuple[int, StackState]]] = [[] for _ in range(board.cells)]
+        self.bits = 0
+        self.members: Dict[int, StackState] = {}
+        self.rank: Dict[int, int] = {}
+        self.off_grid = 0
+        # Structures de ciblage, créées à la première demande (cf. _choose_target).
+        self.heaps: Dict[int, TargetHeap] = {}
+        self.focus: Optional[StackState] = None
+        for rank, stack in enumerate(stacks):
+            self.rank[id(stack)] = rank
+            if stack.alive and stack.position_x is not None and stack.position_y is not None:
+                self.members[rank] = stack
+                self._place(rank, stack, (stack.position_x, stack.position_y))
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def _place(self, rank: int, stack: StackState, pos: Tuple[int, int]):
+        cell = self.board.index(pos)
+        if cell is None:
+            self.off_grid += 1
+        else:
+            self.cells[cell].append((rank, stack))
+            self.bits |= 1 << cell
+
+    def _unplace(self, stack: StackState, pos: Tuple[int, int]):
+        cell = self.board.index(pos)
+        if cell is None:
+            self.off_grid -= 1
+            return
+        bucket = self.cells[cell]
+        for i, (_, other) in enumerate(bucket):
+            if other is stack:
+                del bucket[i]
+                break
+        if not bucket:
+            self.bits &= ~(1 << cell)
+
+    def move(self, stack: StackState, old: Tuple[int, int], new: Tuple[int, int]):
+        self._unplace(stack, old)
+        self._place(self.rank[id(stack)], stack, new)
+
+    def discard(self, stack: StackState, pos: Tuple[int, int]):
+        rank = self.rank[id(stack)]
+        if self.members.pop(rank, None) is not None:
+            self._unplace(stack, pos)
 
-def _grid_occupancy(allies: List[StackState], enemies: List[StackState]) -> Dict[Tuple[int, int], str]:
-    occ = {}
-    for s in allies:
-        if s.alive and s.position_x is not None and s.position_y is not None:
-            occ[(s.position_x, s.position_y)] = "ally"
-    for s in enemies:
-        if s.alive and s.position_x is not None and s.position_y is not None:
-            occ[(s.position_x, s.position_y)] = "enemy"
-    return occ
+    def damaged(self, stack: StackState):
+        """Le stack a perdu des PV : nouvelle entrée dans chaque tas de ciblage."""
+        rank = self.rank[id(stack)]
+        for heap in self.heaps.values():
+            heap.push(rank, stack)
 
+    def target_heap(self, policy: int) -> "TargetHeap":
+        heap = self.heaps.get(policy)
+        if heap is None:
+            heap = self.heaps[policy] = TargetHeap(self, _TARGET_KEYS[policy])
+        return heap
 
-def _random_place(stacks: List[StackState], allowed_cols: List[int]):
-    # place randomly in allowed columns (rows 0-9)
-    import random
+    def any_within(self, origin: Tuple[int, int], radius: int) -> bool:
+        cell = self.board.index(origin)
+        if cell is None or self.off_grid:
+            return self.nearest(origin, radius) is not None
+        return bool(self.bits & self.board.range_mask(cell, radius))
 
-    occupied = set((s.position_x, s.position_y) for s in stacks if s.position_x is not None and s.position_y is not None)
+    def nearest(self, origin: Tuple[int, int], max_distance: Optional[int] = None) -> Optional[StackState]:
+        board = self.board
+        cell = board.index(origin)
+        if cell is None or self.off_grid:
+            best, best_dist = None, None
+            for stack in self.members.values():
+                dist = _distance(origin, (stack.position_x, stack.position_y))
+                if (max_distance is None or dist <= max_distance) and (best_dist is None or dist < best_dist):
+                    best, best_dist = stack, dist
+            return best
+        limit = board.span - 1 if max_distance is None else min(max_distance, board.span - 1)
+        if not self.bits & board.range_mask(cell, limit):
+            return None
+        # plus petit rayon touchant un stack, par dichotomie (les boules sont emboîtées)
+        low, high = 0, limit
+        while low < high:
+            middle = (low + high) // 2
+            if self.bits & board.range_mask(cell, middle):
+                high = middle
+            else:
+                low = middle + 1
+        hits = self.bits & board.ring_mask(cell, low)
+        return min((item for other in _iter_bits(hits) for item in self.cells[other]), key=lambda item: item[0])[1]
+
+    def within(self, origin: Tuple[int, int], radius: int) -> List[StackState]:
+        """Stacks à distance <= radius de `origin`, dans l'ordre du roster."""
+        cell = self.board.index(origin)
+        if cell is None or self.off_grid:
+            return [
+                stack
+                for stack in self.members.values()
+                if _distance(origin, (stack.position_x, stack.position_y)) <= radius
+            ]
+        found = [
+            item for other in _iter_bits(self.bits & self.board.range_mask(cell, radius)) for item in self.cells[other]
+        ]
+        found.sort(key=lambda item: item[0])
+        return [stack for _, stack in found]
+
+
+_TARGET_KEYS = {
+    _LOWEST_HP: lambda stack: stack.current_hp,
+    _HIGHEST_THREAT: lambda stack: -stack.threat,
+}
+
+
+class TargetHeap:
+    """
+    Tas des stacks vivants d'un camp selon une clé (PV, menace).
+
+    Invalidation paresseuse : chaque coup reçu empile une nouvelle entrée et
+    les entrées périmées (clé changée, stack mort) sont jetées quand elles
+    remontent au sommet. Si le meilleur stack est hors de portée, on se
+    rabat sur les seuls stacks à portée (bitboard de `SpatialIndex`).
+    À clé égale, le premier stack du roster l'emporte.
+    """
+
+    def __init__(self, index: SpatialIndex, key):
+        self.index = index
+        self.key = key
+        self.entries = [(key(stack), rank) for rank, stack in index.members.items()]
+        heapq.heapify(self.entries)
+
+    def push(self, rank: int, stack: StackState):
+        heapq.heappush(self.entries, (self.key(stack), rank))
+
+    def best(self, origin: Tuple[int, int], radius: int) -> Optional[StackState]:
+        entries, members = self.entries, self.index.members
+        while entries:
+            key, rank = entries[0]
+            stack = members.get(rank)
+            if stack is not None and self.key(stack) == key:
+                break
+            heapq.heappop(entries)
+        else:
+            return None
+        if _distance(origin, (stack.position_x, stack.position_y)) <= radius:
+            return stack
+        reachable = self.index.within(origin, radius)
+        return min(reachable, key=self.key, default=None)
+
+
+def _find_target(stack: StackState, enemies: SpatialIndex, in_range_only: bool = False) -> Optional[StackState]:
+    origin = (stack.position_x, stack.position_y)
+    if in_range_only:
+        return enemies.nearest(origin, stack.range)
+    # sinon le plus proche tout court (le plus proche à portée s'il existe)
+    return enemies.nearest(origin)
+
+
+def _choose_target(stack: StackState, enemies: SpatialIndex, policy: int) -> Optional[StackState]:
+    """Cible à portée selon la politique `policy` (code de TARGET_POLICIES)."""
+    if policy == _NEAREST:
+        return _find_target(stack, enemies, in_range_only=True)
+    origin = (stack.position_x, stack.position_y)
+    if policy == _FOCUS_FIRE:
+        # tout le camp frappe la même cible tant qu'elle vit et reste à portée
+        focus = enemies.focus
+        if focus is not None and focus.alive and _distance(origin, (focus.position_x, focus.position_y)) <= stack.range:
+            return focus
+        target = enemies.nearest(origin, stack.range)
+        if target is not None:
+            enemies.focus = target
+        return target
+    return enemies.target_heap(policy).best(origin, stack.range)
+
+
+def _grid_occupancy(*indexes: SpatialIndex) -> Occupancy:
+    bits = 0
+    for index in indexes:
+        bits |= index.bits
+    return Occupancy(bits)
+
+
+def _random_place(
+    stacks: List[StackState],
+    allowed_cols: List[int],
+    board: Board = DEFAULT_BOARD,
+    rng: Optional[random.Random] = None,
+):
+    # place randomly in allowed columns
+    rng = rng if rng is not None else random
+    occupied = 0
+    for s in stacks:
+        if s.position_x is not None and s.position_y is not None:
+            cell = board.index((s.position_x, s.position_y))
+            if cell is not None:
+                occupied |= 1 << cell
+    zone = 0
+    for x in allowed_cols:
+        zone |= board.column_masks[x]
     for s in stacks:
         if s.position_x is not None and s.position_y is not None:
             continue
-        tries = [(x, y) for x in allowed_cols for y in range(10)]
-        random.shuffle(tries)
-        for coord in tries:
-            if coord not in occupied:
-                s.position_x, s.position_y = coord
-                occupied.add(coord)
-                break
+        free = list(_iter_bits(zone & ~occupied))
+        if not free:
+            break
+        cell = rng.choice(free)
+        s.position_x, s.position_y = board.coords[cell]
+        occupied |= 1 << cell
 
 
-def _bfs_next_step(start: Tuple[int, int], goal: Tuple[int, int], occ: Dict[Tuple[int, int], str]) -> Optional[Tuple[int, int]]:
-    if start == goal:
-        return goal
-    q = deque()
-    q.append(start)
-    seen = {start: None}
-    while q:
-        cx, cy = q.popleft()
-        for nx, ny in _neighbors(cx, cy):
-            if (nx, ny) in seen:
-                continue
-            if (nx, ny) in occ and (nx, ny) != goal:
+class FlowField:
+    """
+    Champ de distances partagé par tous les stacks d'un camp.
+
+    Construit une fois par phase de déplacement : BFS multi-sources depuis
+    les cases adjacentes aux ennemis, en contournant les ennemis. Les cases
+    alliées reçoivent une distance mais ne propagent pas (on ne traverse pas
+    un allié) ; chaque stack connaît ainsi sa propre distance et descend vers
+    la voisine libre la plus basse. Quand un allié libère une case, la
+    distance se propage à nouveau depuis elle (mise à jour incrémentale).
+
+    Le BFS avance par couches de bitboards (une dilatation par distance) et
+    couvre tout le plateau : un stack à 90 cases de l'ennemi contourne les
+    obstacles comme un stack au contact. Sur les grands plateaux, seule la
+    propagation de `vacate` s'arrête à `board.flow_depth` (`truncated`) ;
+    un stack encore sans distance (enfermé par ses alliés à la
+    construction) s'approche alors en ligne droite (`approach`, heuristique
+    de Chebyshev) dès qu'une case se libère.
+    """
+
+    UNREACHABLE = 1 << 30
+    BLOCKED = -1  # case ennemie : ni traversée, ni relabellisée par `vacate`
+
+    def __init__(self, board: Board = DEFAULT_BOARD, profile: Optional["BattleProfile"] = None):
+        self.board = board
+        self.dist: List[int] = [self.UNREACHABLE] * board.cells
+        self.truncated = False
+        self.profile = profile
+
+    def build(self, enemy_bits: int, occ: Occupancy):
+        board = self.board
+        passable = board.mask & ~enemy_bits
+        free = passable & ~occ.bits
+        reached = board.dilate(enemy_bits) & passable
+        layers = [reached]
+        frontier = reached & free
+        while frontier:
+            labelled = board.dilate(frontier) & passable & ~reached
+            if not labelled:
+                break
+            layers.append(labelled)
+            reached |= labelled
+            frontier = labelled & free
+        dist = [self.UNREACHABLE] * board.cells
+        for d, layer in enumerate(layers):
+            for cell in _iter_bits(layer):
+                dist[cell] = d
+        for cell in _iter_bits(enemy_bits & board.mask):
+            dist[cell] = self.BLOCKED
+        self.dist = dist
+        self.truncated = board.flow_depth is not None
+        if self.profile is not None:
+            self.profile.counters["flow_builds"] += 1
+            self.profile.counters["flow_cells"] += sum(layer.bit_count() for layer in layers)
+
+    def vacate(self, cell: int, occ: Occupancy):
+        """La case vient d'être libérée : elle propage désormais sa distance."""
+        dist, neighbors, occupied = self.dist, self.board.neighbors, occ.cells
+        depth = self.board.flow_depth
+        queue = deque([cell])
+        if self.profile is not None:
+            self.profile.counters["flow_cells"] += 1
+        while queue:
+            current = queue.popleft()
+            step = dist[current] + 1
+            if depth is not None and step > depth:
                 continue
-            seen[(nx, ny)] = (cx, cy)
-            if (nx, ny) == goal:
-                # reconstruct first step
-                step = (nx, ny)
-                while seen[step] != start and seen[step] is not None:
-                    step = seen[step]
-                return step
-            q.append((nx, ny))
-    return None
-
-
-def _try_move(stack: StackState, enemies: List[StackState], allies: List[StackState], occ: Dict[Tuple[int, int], str], events: List[Dict], t: int, side: str):
-    target = _find_target(stack, enemies, in_range_only=False)
-    if not target or target.position_x is None or target.position_y is None:
+            for other in neighbors[current]:
+                if dist[other] > step:
+                    dist[other] = step
+                    if other not in occupied:
+                        queue.append(other)
+                        if self.profile is not None:
+                            self.profile.counters["flow_cells"] += 1
+
+    def next_step(self, cell: int, occ: Occupancy) -> Optional[int]:
+        """Première voisine libre (ordre de _neighbors) à distance d - 1, sinon None."""
+        if self.profile is not None:
+            self.profile.counters["path_steps"] += 1
+        dist = self.dist
+        d = dist[cell]
+        if d == 0 or d >= self.UNREACHABLE:
+            return None
+        for other in self.board.neighbors[cell]:
+            if dist[other] == d - 1 and other not in occ.cells:
+                return other
+        return None
+
+    def approach(self, cell: int, goal: Tuple[int, int], occ: Occupancy) -> Optional[int]:
+        """Stack sans distance : voisine libre qui rapproche le plus de `goal`, s'il y en a une."""
+        coords = self.board.coords
+        best, best_dist = None, _distance(coords[cell], goal)
+        for other in self.board.neighbors[cell]:
+            if self.dist[other] != self.BLOCKED and other not in occ.cells:
+                dist = _distance(coords[other], goal)
+                if dist < best_dist:
+                    best, best_dist = other, dist
+        return best
+
+
+def _next_cell(field: FlowField, cell: int, enemies: SpatialIndex, occ: Occupancy) -> Optional[int]:
+    step = field.next_step(cell, occ)
+    if step is None and field.truncated and field.dist[cell] >= FlowField.UNREACHABLE:
+        goal = enemies.nearest(field.board.coords[cell])
+        if goal is not None:
+            step = field.approach(cell, (goal.position_x, goal.position_y), occ)
+    return step
+
+
+def _try_move(
+    stack: StackState,
+    enemies: SpatialIndex,
+    allies: SpatialIndex,
+    field: FlowField,
+    occ: Occupancy,
+    events: Optional[List[Dict]],
+    t: int,
+    side: str,
+):
+    prev = (stack.position_x, stack.position_y)
+    if not enemies or enemies.any_within(prev, stack.range):
+        return False  # plus d'ennemi, ou déjà à portée
+    cell = field.board.index(prev)
+    if cell is None:
         return False
-    dist = _distance((stack.position_x, stack.position_y), (target.position_x, target.position_y))
-    if dist <= stack.range:
-        return False  # already in range
-    # find closest empty cell toward target
-    target_pos = (target.position_x, target.position_y)
-    # choose goal among neighbors of target within range
-    goals = []
-    for nx, ny in _neighbors(target_pos[0], target_pos[1]) + [target_pos]:
-        if (nx, ny) in occ:
-            continue
-        goals.append((nx, ny))
-    goals.sort(key=lambda c: _distance((stack.position_x, stack.position_y), c))
-    next_step = None
-    for cell in goals:
-        candidate = _bfs_next_step((stack.position_x, stack.position_y), cell, occ)
-        if candidate:
-            next_step = candidate
-            break
-    if next_step:
-        prev = (stack.position_x, stack.position_y)
-        occ.pop((stack.position_x, stack.position_y), None)
-        stack.position_x, stack.position_y = next_step
-        occ[next_step] = "ally"
-        events.append(
-            {
-                "t": t,
-                "type": "move",
-                "unit_id": stack.stack_id,
-                "unit_name": stack.unit_name,
-                "side": side,
-                "from": {"x": prev[0], "y": prev[1]},
-                "to": {"x": next_step[0], "y": next_step[1]},
-            }
-        )
+    step = _next_cell(field, cell, enemies, occ)
+    if step is None:
+        return False
+    next_step = field.board.coords[step]
+    occ.discard(cell)
+    occ.add(step)
+    stack.position_x, stack.position_y = next_step
+    allies.move(stack, prev, next_step)
+    field.vacate(cell, occ)
+    if events is None:
         return True
-    return False
+    events.append(
+        {
+            "t": t,
+            "type": "move",
+            "unit_id": stack.stack_id,
+            "unit_name": stack.unit_name,
+            "side": side,
+            "from": {"x": prev[0], "y": prev[1]},
+            "to": {"x": next_step[0], "y": next_step[1]},
+        }
+    )
+    return True
 
 
 def _apply_damage(target: StackState, dmg: float) -> Dict[str, float]:
     prev_pos = (target.position_x, target.position_y)
     prev_hp = target.current_hp
+    prev_units = target.units
     remaining = max(0.0, target.current_hp - dmg)
     target.current_hp = remaining
     killed = False
@@ -391,39 +1054,177 @@ def _apply_damage(target: StackState, dmg: float) -> Dict[str, float]:
         target.position_x = None
         target.position_y = None
         killed = True
+    units = target.units
     return {
         "killed": killed,
         "remaining_hp": remaining,
-        "last_unit_hp": remaining,
+        # groupe : PV de l'unité entamée, les autres sont intactes
+        "last_unit_hp": remaining - (units - 1) * target.health if units > 1 else remaining,
+        "losses": prev_units - units,
         "prev_pos": prev_pos,
         "taken": min(prev_hp, dmg),
     }
 
 
-def _perform_attack(attacker: StackState, defenders: List[StackState], occ: Dict[Tuple[int, int], str], events: List[Dict], t: int, side: str):
-    target = _find_target(attacker, defenders, in_range_only=True)
+_SIDES = ("attacker", "defender")
+
+# Compteurs par stack tenus par `BattleStats`, dans cet ordre.
+STAT_FIELDS = ("damage_dealt", "damage_taken", "kills", "attacks", "crits", "dodges")
+_DEALT, _TAKEN, _KILLS, _ATTACKS, _CRITS, _DODGES = range(len(STAT_FIELDS))
+
+
+class BattleStats:
+    """
+    Agrégats d'un combat, tenus à jour par les moteurs pendant la simulation
+    quel que soit le niveau de journal : une ligne de compteurs
+    (`STAT_FIELDS`) par stack, résumée en fin de combat par `summary`.
+    """
+
+    def __init__(self, attacker_stacks: List[StackState], defender_stacks: List[StackState]):
+        self.sides = (attacker_stacks, defender_stacks)
+        self.rows: Dict[int, List[float]] = {id(s): [0.0, 0.0, 0, 0, 0, 0] for side in self.sides for s in side}
+
+    def summary(self) -> Dict:
+        return _battle_summary(
+            (label, s.unit_name, s.count, s.units, self.rows[id(s)])
+            for label, stacks in zip(_SIDES, self.sides)
+            for s in stacks
+        )
+
+
+# Phases chronométrées par `BattleProfile` (secondes) et compteurs du chemin critique.
+PROFILE_PHASES = ("build", "placement", "movement", "attack", "logging", "total")
+PROFILE_COUNTERS = (
+    "flow_builds",  # champs de distances construits (FlowField.build)
+    "flow_cells",  # cases étiquetées ou repropagées par ces champs
+    "path_steps",  # pas demandés au champ (FlowField.next_step)
+    "target_searches",  # recherches de cible
+    "aoe_candidates",  # stacks examinés dans les zones d'effet
+    "events",  # événements émis
+)
+
+
+class BattleProfile:
+    """
+    Instrumentation d'un ou plusieurs combats (`simulate_battle(profile=True)`) :
+    temps par phase (`PROFILE_PHASES`) et compteurs (`PROFILE_COUNTERS`).
+
+    Chaque phase est mesurée là où son travail est fait : `logging` compte
+    la construction des images clés et des états de fin de tour, les
+    événements de déplacement et d'attaque étant construits dans leur phase.
+    Le temps passé par l'appelant entre deux tours (collecte du journal,
+    envoi au client) n'entre que dans `total`. Les moteurs ne touchent au
+    profil que s'il est fourni : sans lui, aucun surcoût.
+    """
+
+    def __init__(self):
+        self.battles = 0
+        self.timings = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.counters = dict.fromkeys(PROFILE_COUNTERS, 0)
+
+    def merge(self, other: "BattleProfile"):
+        self.battles += other.battles
+        for name, value in other.timings.items():
+            self.timings[name] += value
+        for name, value in other.counters.items():
+            self.counters[name] += value
+
+    def as_dict(self) -> Dict:
+        return {
+            "battles": self.battles,
+            "timings_ms": {name: round(value * 1000, 3) for name, value in self.timings.items()},
+            "counters": dict(self.counters),
+        }
+
+
+# Cumul des combats instrumentés du processus (cf. `process_profile`).
+_PROCESS_PROFILE = BattleProfile()
+
+
+def process_profile() -> Dict:
+    """Profil cumulé des combats instrumentés depuis le démarrage du processus (ou le dernier reset)."""
+    return _PROCESS_PROFILE.as_dict()
+
+
+def reset_process_profile():
+    global _PROCESS_PROFILE
+    _PROCESS_PROFILE = BattleProfile()
+
+
+def _battle_summary(rows: Iterable[Tuple[str, str, int, int, Sequence[float]]]) -> Dict:
+    """
+    Résumé d'un combat à partir de lignes (camp, type d'unité, unités
+    engagées, survivantes, compteurs `STAT_FIELDS`) : par camp, le total et
+    le détail par type d'unité.
+    """
+
+    def entry() -> Dict:
+        return {"engaged": 0, "survivors": 0, **dict.fromkeys(STAT_FIELDS, 0)}
+
+    summary = {side: {"total": entry(), "units": {}} for side in _SIDES}
+    for side, unit_name, engaged, survivors, counters in rows:
+        for bucket in (summary[side]["total"], summary[side]["units"].setdefault(unit_name, entry())):
+            bucket["engaged"] += engaged
+            bucket["survivors"] += survivors
+            for name, value in zip(STAT_FIELDS, counters):
+                bucket[name] += value
+    for side in _SIDES:
+        for bucket in (summary[side]["total"], *summary[side]["units"].values()):
+            bucket["damage_dealt"] = round(bucket["damage_dealt"], 2)
+            bucket["damage_taken"] = round(bucket["damage_taken"], 2)
+    return summary
+
+
+def _perform_attack(
+    attacker: StackState,
+    multipliers: Sequence[float],
+    defenders: SpatialIndex,
+    occ: Occupancy,
+    events: Optional[List[Dict]],
+    t: int,
+    side: str,
+    policy: int = _NEAREST,
+    rng: Optional[random.Random] = None,
+    stats: Optional[BattleStats] = None,
+    profile: Optional[BattleProfile] = None,
+) -> Optional[int]:
+    """
+    Résout une attaque et renvoie le nombre d'unités tuées (stacks simples ou
+    membres de groupes), None si aucune cible n'est à portée. `events` à None :
+    rien n'est journalisé ; `stats` reçoit dégâts, morts, critiques et esquives.
+    """
+    rng = rng if rng is not None else random
+    if profile is not None:
+        profile.counters["target_searches"] += 1
+    target = _choose_target(attacker, defenders, policy)
     if not target:
-        return
+        return None
     if target.position_x is None or target.position_y is None:
-        return
-    dmg_roll = random.uniform(attacker.damage_min, attacker.damage_max)
-    crit = random.random() < attacker.crit_chance
+        return None
+    dmg_roll = rng.uniform(attacker.damage_min, attacker.damage_max) * attacker.units
+    crit = rng.random() < attacker.crit_chance
     if crit:
         dmg_roll *= attacker.crit_multiplier
+    counters = stats.rows[id(attacker)] if stats is not None else None
+    if counters is not None:
+        counters[_ATTACKS] += 1
+        counters[_CRITS] += crit
 
-    impacted = []
+    impacted = [] if events is not None else None
+    kills = 0
     targets = [target]
     if attacker.aoe_radius > 0:
-        for other in defenders:
-            if not other.alive or other == target:
-                continue
-            if other.position_x is None or other.position_y is None:
-                continue
-            if _distance((target.position_x, target.position_y), (other.position_x, other.position_y)) <= attacker.aoe_radius:
-                targets.append(other)
+        splash = defenders.within((target.position_x, target.position_y), attacker.aoe_radius)
+        targets.extend(other for other in splash if other is not target)
+        if profile is not None:
+            profile.counters["aoe_candidates"] += len(splash)
 
     for tgt in targets:
-        if random.random() < tgt.dodge_chance:
+        if rng.random() < tgt.dodge_chance:
+            if counters is not None:
+                stats.rows[id(tgt)][_DODGES] += 1
+            if impacted is None:
+                continue
             impacted.append(
                 {
                     "defender": tgt.unit_name,
@@ -438,14 +1239,15 @@ def _perform_attack(attacker: StackState, defenders: List[StackState], occ: Dict
             )
             continue
 
-        dmg = dmg_roll
-        dmg *= _attack_vs_armor_multiplier(attacker.attack_type, tgt.armor_type)
-        dmg *= _armor_multiplier(tgt.defense)
-        dmg = max(0.0, dmg)
+        dmg = max(0.0, dmg_roll * multipliers[defenders.rank[id(tgt)]])
 
         result = _apply_damage(tgt, dmg)
-        impacted.append(
-            {
+        if counters is not None:
+            counters[_DEALT] += result["taken"]
+            counters[_KILLS] += result["losses"]
+            stats.rows[id(tgt)][_TAKEN] += result["taken"]
+        if impacted is not None:
+            hit = {
                 "defender": tgt.unit_name,
                 "defender_id": tgt.stack_id,
                 "killed": result["killed"],
@@ -455,12 +1257,22 @@ def _perform_attack(attacker: StackState, defenders: List[StackState], occ: Dict
                 "dodge": False,
                 "dmg": round(dmg, 2),
             }
-        )
+            if tgt.count > 1:
+                hit["units"] = tgt.units
+            impacted.append(hit)
+        kills += result["losses"]
         if not tgt.alive:
             prev_pos = result.get("prev_pos")
             if prev_pos:
-                occ.pop(prev_pos, None)
+                cell = defenders.board.index(prev_pos)
+                if cell is not None:
+                    occ.discard(cell)
+                defenders.discard(tgt, prev_pos)
+        elif result["taken"]:
+            defenders.damaged(tgt)
 
+    if events is None:
+        return kills
     events.append(
         {
             "t": t,
@@ -472,25 +1284,240 @@ def _perform_attack(attacker: StackState, defenders: List[StackState], occ: Dict
             "crit": crit,
         }
     )
+    return kills
 
 
-def simulate_battle(attacker: Army, defender: Army, max_rounds: int = 60) -> Dict:
-    attacker_preset = (
-        attacker.attack_presets.filter(name="__auto__").order_by("-created_at").first()
-    )
-    override = {}
-    if attacker_preset:
-        for p in attacker_preset.positions:
-            if p.get("army_unit_id") is not None:
-                override[int(p["army_unit_id"])] = (p.get("x"), p.get("y"))
-
-    attacker_stacks = build_stack_states(attacker, positions_override=override)
-    defender_stacks = build_stack_states(defender)
+@dataclass(frozen=True)
+class BattleEngine:
+    """
+    Moteur de combat enregistré (`register_engine`).
+
+    `rounds(attacker_stacks, defender_stacks, max_rounds, board, targeting,
+    seed, verbosity)` rend le générateur des tours (une liste d'événements
+    par tour, résumé en valeur de retour) ; `aggregate` dit si le moteur
+    gère les stacks agrégés. Combat instrumenté : `rounds` reçoit en plus
+    `profile=` (`BattleProfile`), seulement dans ce cas.
+
+    `validated` : le moteur passe `cross_validate_engines` contre la
+    référence (les tests le vérifient pour chaque moteur enregistré). Seul un
+    moteur validé peut servir de défaut (`settings.ARMIES_BATTLE_ENGINE`) ;
+    les autres ne se choisissent que par leur nom, pour être mis au point.
+
+    `version` s'incrémente quand un changement du moteur modifie le combat
+    joué par une graine donnée ; elle est notée dans `outcome["replay"]` et
+    un combat ne se rejoue qu'avec la version qui l'a joué (`replay_battle`).
+    Avant de l'incrémenter ou de retirer le moteur du registre,
+    `manage.py compact_battle_logs --freeze <moteur>`
+    enregistre le journal compact des combats stockés sans journal : ils
+    restent consultables, leur journal ne dépendant plus du moteur.
+
+    `min_stacks` : en dessous de ce nombre de stacks (deux camps), le moteur
+    choisi par défaut laisse la place à la référence, plus rapide sur les
+    petites armées ; nommé explicitement, il joue quelle que soit la taille.
+    """
+
+    name: str
+    rounds: Callable[..., Iterator[List[Dict]]]
+    aggregate: bool = True
+    validated: bool = False
+    version: int = 1
+    min_stacks: int = 0
+
+
+# Moteurs disponibles, par nom ; "python" est la référence des autres.
+BATTLE_ENGINES: Dict[str, BattleEngine] = {}
+REFERENCE_ENGINE = "python"
+
+# Niveaux de détail du journal (`verbosity`), du replay complet au seul résultat.
+# Les événements non journalisés ne sont pas construits du tout.
+LOG_FULL = "full"  # déplacements, attaques et états : de quoi rejouer le combat
+LOG_ATTACKS = "attacks"  # attaques seulement
+LOG_ROUNDS = "rounds"  # l'état (survivants par camp) à la fin de chaque tour
+LOG_NONE = "none"  # aucun événement, résultat seul
+LOG_LEVELS = (LOG_FULL, LOG_ATTACKS, LOG_ROUNDS, LOG_NONE)
+
+
+def _log_flags(verbosity: str) -> Tuple[bool, bool, bool]:
+    """Journaliser (déplacements, attaques, états) pour ce niveau de détail."""
+    return verbosity == LOG_FULL, verbosity in (LOG_FULL, LOG_ATTACKS), verbosity in (LOG_FULL, LOG_ROUNDS)
+
+
+# Écart (en tours) entre deux images clés du journal complet : l'état de
+# tous les stacks, pour que le replay saute à un tour sans tout rejouer.
+KEYFRAME_INTERVAL = 10
+
+
+def _keyframe_row(stack: StackState) -> Dict:
+    row = {"id": stack.stack_id, "x": stack.position_x, "y": stack.position_y, "hp": round(stack.current_hp, 2)}
+    if stack.count > 1:
+        row["units"] = stack.units
+    return row
+
+
+def _keyframe(t: float, indexes: Sequence[SpatialIndex]) -> Dict:
+    """Image clé : position et PV des stacks encore en jeu, dans l'ordre du roster."""
+    return {
+        "t": t,
+        "type": "keyframe",
+        "attacker": [_keyframe_row(s) for s in indexes[0].members.values()],
+        "defender": [_keyframe_row(s) for s in indexes[1].members.values()],
+    }
+
+
+def seek_log(log: List[Dict], t: float) -> Dict:
+    """
+    Ce qu'il faut pour afficher le combat à l'instant `t` : la dernière image
+    clé jusque-là (None : partir des positions initiales) et les événements
+    qui la suivent, jusqu'à `t` inclus. Le journal est trié par `t`.
+    """
+    end = bisect.bisect_right(log, t, key=lambda event: event["t"])
+    for start in range(end - 1, -1, -1):
+        if log[start]["type"] == "keyframe":
+            return {"keyframe": log[start], "log": log[start + 1 : end]}
+    return {"keyframe": None, "log": log[:end]}
+
+
+def battle_specs(
+    attacker: Union[Army, ArmySpec], defender: Union[Army, ArmySpec]
+) -> Tuple[ArmySpec, ArmySpec]:
+    """Specs des deux camps ; l'attaquant se déploie selon son dernier placement automatique."""
+    return _army_spec(attacker, preset="__auto__"), _army_spec(defender)
+
+
+def _build_battle_stacks(
+    attacker: Union[Army, ArmySpec], defender: Union[Army, ArmySpec]
+) -> Tuple[List[StackState], List[StackState]]:
+    attacker_spec, defender_spec = battle_specs(attacker, defender)
+    attacker_stacks = build_stack_states(attacker_spec)
+    defender_stacks = build_stack_states(defender_spec)
+    stacks = attacker_stacks + defender_stacks
+    next_id = max((s.stack_id for s in stacks if s.stack_id is not None), default=0) + 1
+    for stack in stacks:
+        if stack.stack_id is None:
+            stack.stack_id = next_id
+            next_id += 1
+    return attacker_stacks, defender_stacks
+
+
+def _fit_to_board(stacks: List[StackState], board: Board, shift: int):
+    """
+    Les placements sont enregistrés sur la grille standard : décale les
+    colonnes de `shift` (le défenseur reste collé au bord droit) et rend au
+    placement aléatoire les stacks qui tomberaient hors du plateau.
+    """
+    for s in stacks:
+        if s.position_x is None or s.position_y is None:
+            continue
+        s.position_x += shift
+        if board.index((s.position_x, s.position_y)) is None:
+            s.position_x = s.position_y = None
+
+
+def _place_battle_stacks(
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    board: Board = DEFAULT_BOARD,
+    rng: Optional[random.Random] = None,
+):
+    if board is not DEFAULT_BOARD:
+        _fit_to_board(attacker_stacks, board, 0)
+        _fit_to_board(defender_stacks, board, board.width - GRID_SIZE)
     # auto-place missing positions
-    _random_place(attacker_stacks, allowed_cols=[0, 1])
-    _random_place(defender_stacks, allowed_cols=[8, 9])
-    events: List[Dict] = []
-    initial_positions = {
+    _random_place(attacker_stacks, board.deployment_columns("attacker"), board, rng)
+    _random_place(defender_stacks, board.deployment_columns("defender"), board, rng)
+
+
+def _aggregation_key(stack: StackState) -> Tuple:
+    # stats compilées : même type d'unité et mêmes upgrades <=> même clé
+    return (
+        stack.unit_name,
+        stack.attack_code,
+        stack.armor_code,
+        stack.defense,
+        stack.health,
+        stack.attack_speed,
+        stack.move_speed,
+        stack.range,
+        stack.damage_min,
+        stack.damage_max,
+        stack.crit_chance,
+        stack.crit_multiplier,
+        stack.dodge_chance,
+        stack.aoe_radius,
+    )
+
+
+def aggregate_stacks(stacks: List[StackState], board: Board = DEFAULT_BOARD) -> List[StackState]:
+    """
+    Regroupe les unités identiques posées sur des cases adjacentes.
+
+    Chaque groupe devient un seul stack de `count` unités aux PV mis en
+    commun ; il garde l'identifiant et la case de son premier membre dans
+    l'ordre du roster. Les stacks morts ou non placés sont laissés tels quels.
+    """
+    by_cell: Dict[Tuple[int, int], StackState] = {}
+    for stack in stacks:
+        if stack.alive and stack.position_x is not None and stack.position_y is not None:
+            by_cell[(stack.position_x, stack.position_y)] = stack
+    grouped = set()
+    result: List[StackState] = []
+    for stack in stacks:
+        if id(stack) in grouped:
+            continue
+        position = (stack.position_x, stack.position_y)
+        if by_cell.get(position) is not stack:
+            result.append(stack)
+            continue
+        key = _aggregation_key(stack)
+        members = [stack]
+        grouped.add(id(stack))
+        queue = deque([position])
+        while queue:
+            for cell in _neighbors(*queue.popleft(), board.width, board.height):
+                other = by_cell.get(cell)
+                if other is not None and id(other) not in grouped and _aggregation_key(other) == key:
+                    grouped.add(id(other))
+                    members.append(other)
+                    queue.append(cell)
+        if len(members) == 1:
+            result.append(stack)
+        else:
+            result.append(
+                replace(
+                    stack,
+                    current_hp=sum(m.current_hp for m in members),
+                    count=sum(m.count for m in members),
+                )
+            )
+    return result
+
+
+def _prepare_battle_stacks(
+    attacker: Union[Army, ArmySpec],
+    defender: Union[Army, ArmySpec],
+    aggregate: bool = False,
+    board: Board = DEFAULT_BOARD,
+    rng: Optional[random.Random] = None,
+    profile: Optional[BattleProfile] = None,
+) -> Tuple[List[StackState], List[StackState]]:
+    started = time.perf_counter()
+    attacker_stacks, defender_stacks = _build_battle_stacks(attacker, defender)
+    built = time.perf_counter()
+    _place_battle_stacks(attacker_stacks, defender_stacks, board, rng)
+    if aggregate:
+        attacker_stacks = aggregate_stacks(attacker_stacks, board)
+        defender_stacks = aggregate_stacks(defender_stacks, board)
+    if profile is not None:
+        profile.timings["build"] += built - started
+        profile.timings["placement"] += time.perf_counter() - built
+    return attacker_stacks, defender_stacks
+
+
+def _initial_positions(
+    attacker_stacks: List[StackState], defender_stacks: List[StackState], board: Board = DEFAULT_BOARD
+) -> Dict:
+    return {
+        "board": {"width": board.width, "height": board.height},
         "attacker": [
             {
                 "id": s.stack_id,
@@ -500,8 +1527,9 @@ def simulate_battle(attacker: Army, defender: Army, max_rounds: int = 60) -> Dic
                 "y": s.position_y,
                 "range": s.range,
                 "army_unit_id": s.army_unit_id,
+                "count": s.count,
             }
-            for s_idx, s in enumerate(attacker_stacks)
+            for s in attacker_stacks
         ],
         "defender": [
             {
@@ -512,82 +1540,939 @@ def simulate_battle(attacker: Army, defender: Army, max_rounds: int = 60) -> Dic
                 "y": s.position_y,
                 "range": s.range,
                 "army_unit_id": s.army_unit_id,
+                "count": s.count,
             }
-            for s_idx, s in enumerate(defender_stacks)
+            for s in defender_stacks
         ],
     }
-    # ensure positions default to defense for defender; attacker may have positions set (attack preset)
-    for s in attacker_stacks + defender_stacks:
-        if s.position_x is None or s.position_y is None:
-            # spawn in reserve if no position, keep None
-            s.position_x = s.position_x
-    last_t = 0
-    for t in range(1, max_rounds + 1):
+
+
+def _battle_winner(atk_alive: int, def_alive: int) -> Optional[str]:
+    if atk_alive <= 0 and def_alive <= 0:
+        return None
+    if def_alive <= 0:
+        return "attacker"
+    if atk_alive <= 0:
+        return "defender"
+    return "attacker" if atk_alive > def_alive else "defender"
+
+
+# Raisons de fin d'un combat, reportées dans `outcome["end_reason"]`.
+END_ELIMINATION = "elimination"  # un camp (ou les deux) n'a plus de stack
+END_MAX_ROUNDS = "max_rounds"  # limite de temps atteinte
+END_NO_DAMAGE = "no_damage"  # aucun camp ne peut plus blesser l'autre (ex. magic vs divine)
+END_STALEMATE = "stalemate"  # personne ne peut ni attaquer ni avancer
+
+
+def _can_hurt(allies: SpatialIndex, enemies: SpatialIndex, matrix: Sequence[Sequence[float]]) -> bool:
+    """Un stack vivant de `allies` peut-il encore infliger des dégâts à un ennemi vivant ?"""
+    targets = list(enemies.members)
+    return any(
+        stack.attack_speed > 0 and stack.damage_max > 0 and any(matrix[slot][rank] > 0 for rank in targets)
+        for slot, stack in allies.members.items()
+    )
+
+
+def _no_damage_possible(indexes: Sequence[SpatialIndex], multipliers: Sequence[Sequence[Sequence[float]]]) -> bool:
+    return not _can_hurt(indexes[0], indexes[1], multipliers[0]) and not _can_hurt(
+        indexes[1], indexes[0], multipliers[1]
+    )
+
+
+def _battle_stalled(indexes: Sequence[SpatialIndex], occ: Occupancy) -> bool:
+    """
+    Aucun stack ne peut attaquer (rien à portée) ni se rapprocher (pas de
+    case libre plus proche) : l'état ne changera plus jusqu'à la fin.
+    """
+    field = FlowField(indexes[0].board)
+    for side, allies in enumerate(indexes):
+        enemies = indexes[1 - side]
+        field.build(enemies.bits, occ)
+        for stack in allies.members.values():
+            position = (stack.position_x, stack.position_y)
+            if enemies.any_within(position, stack.range):
+                if stack.attack_speed > 0:
+                    return False
+                continue
+            cell = field.board.index(position)
+            if stack.move_speed > 0 and cell is not None and _next_cell(field, cell, enemies, occ) is not None:
+                return False
+    return True
+
+
+def _end_reason(atk_alive: int, def_alive: int, decided: Optional[str]) -> str:
+    if decided:
+        return decided
+    if atk_alive <= 0 or def_alive <= 0:
+        return END_ELIMINATION
+    return END_MAX_ROUNDS
+
+
+def _collect_log(rounds: Iterator[List[Dict]]) -> Dict:
+    """Vide un générateur de tours (`_battle_rounds`...) : résultat complet, journal compris."""
+    log: List[Dict] = []
+    while True:
+        try:
+            log.extend(next(rounds))
+        except StopIteration as stop:
+            return {**stop.value, "log": log}
+
+
+def _run_battle(
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    max_rounds: int,
+    board: Board = DEFAULT_BOARD,
+    targeting: str = "nearest",
+    rng: Optional[random.Random] = None,
+    verbosity: str = LOG_FULL,
+) -> Dict:
+    return _collect_log(
+        _battle_rounds(attacker_stacks, defender_stacks, max_rounds, board, targeting, rng, verbosity)
+    )
+
+
+def _battle_rounds(
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    max_rounds: int,
+    board: Board = DEFAULT_BOARD,
+    targeting: str = "nearest",
+    rng: Optional[random.Random] = None,
+    verbosity: str = LOG_FULL,
+    start: int = 0,
+    indexes: Optional[Tuple[SpatialIndex, SpatialIndex]] = None,
+    profile: Optional[BattleProfile] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Moteur par tours, au fil de l'eau : produit les événements de chaque tour
+    dès qu'il est joué et renvoie le résultat (sans `log`) en fin de combat.
+
+    Reprise d'un combat (cf. `fork_battle`) : `start` est le dernier tour
+    déjà joué, `indexes` des index construits par l'appelant (cible
+    désignée comprise), qui peut aussi les relire une fois le générateur vidé.
+    `profile` reçoit les temps des phases et les compteurs (`BattleProfile`).
+    """
+    rng = rng if rng is not None else random.Random()
+    default_policy = _POLICY_CODES[targeting]
+    log_moves, log_attacks, log_status = _log_flags(verbosity)
+    events: List[Dict] = []
+    if indexes is None:
+        indexes = (SpatialIndex(attacker_stacks, board), SpatialIndex(defender_stacks, board))
+    attacker_index, defender_index = indexes
+    stats = BattleStats(attacker_stacks, defender_stacks)
+    field = FlowField(board, profile)
+    timings = profile.timings if profile is not None else None
+    attacker_multipliers = damage_multiplier_matrix(attacker_stacks, defender_stacks)
+    defender_multipliers = damage_multiplier_matrix(defender_stacks, attacker_stacks)
+    # Tenus à jour à chaque mort / déplacement plutôt que recalculés à chaque tour.
+    alive = {
+        "attacker": sum(s.units for s in attacker_stacks),
+        "defender": sum(s.units for s in defender_stacks),
+    }
+    occ = _grid_occupancy(attacker_index, defender_index)
+    multipliers = (attacker_multipliers, defender_multipliers)
+    decided = None
+    last_t = start
+    if alive["attacker"] and alive["defender"] and _no_damage_possible(indexes, multipliers):
+        # issue déjà fixée : inutile de jouer les tours
+        decided = END_NO_DAMAGE
+        if log_status:
+            events.append(
+                {
+                    "t": start,
+                    "type": "status",
+                    "attacker_alive": alive["attacker"],
+                    "defender_alive": alive["defender"],
+                }
+            )
+    for t in range(start + 1, max_rounds + 1):
+        if decided:
+            break
         last_t = t
-        if not any(s.alive for s in attacker_stacks) or not any(s.alive for s in defender_stacks):
+        if not alive["attacker"] or not alive["defender"]:
             break
-        occ_att = _grid_occupancy(attacker_stacks, defender_stacks)
-        occ_def = _grid_occupancy(defender_stacks, attacker_stacks)
+        if events:
+            yield events
+            events = []
+        survivors = alive["attacker"] + alive["defender"]
+        acted = False  # un déplacement ou une attaque ce tour-ci
+        moves = events if log_moves else None
+        hits = events if log_attacks else None
+        if timings is not None:
+            clock = time.perf_counter()
         # movement phase
-        for stack in attacker_stacks:
-            if not stack.alive or stack.position_x is None or stack.position_y is None:
-                continue
-            steps = int(stack.move_speed)
-            frac = stack.move_speed - steps
-            for _ in range(steps):
-                _try_move(stack, defender_stacks, attacker_stacks, occ_att, events, t, "attacker")
-            if random.random() < frac:
-                _try_move(stack, defender_stacks, attacker_stacks, occ_att, events, t, "attacker")
-        for stack in defender_stacks:
-            if not stack.alive or stack.position_x is None or stack.position_y is None:
-                continue
-            steps = int(stack.move_speed)
-            frac = stack.move_speed - steps
-            for _ in range(steps):
-                _try_move(stack, attacker_stacks, defender_stacks, occ_def, events, t, "defender")
-            if random.random() < frac:
-                _try_move(stack, attacker_stacks, defender_stacks, occ_def, events, t, "defender")
+        for allies, enemies, label in [
+            (attacker_index, defender_index, "attacker"),
+            (defender_index, attacker_index, "defender"),
+        ]:
+            # un champ par camp et par phase : les ennemis ne bougent pas pendant la nôtre
+            field.build(enemies.bits, occ)
+            # les stacks vivants et placés du camp, dans l'ordre du roster
+            for stack in allies.members.values():
+                steps = int(stack.move_speed)
+                frac = stack.move_speed - steps
+                for _ in range(steps):
+                    acted = _try_move(stack, enemies, allies, field, occ, moves, t, label) or acted
+                if rng.random() < frac:
+                    acted = _try_move(stack, enemies, allies, field, occ, moves, t, label) or acted
+        if timings is not None:
+            clock, started = time.perf_counter(), clock
+            timings["movement"] += clock - started
 
         # attack phase
-        for side, foes, occ, label in [
-            (attacker_stacks, defender_stacks, occ_att, "attacker"),
-            (defender_stacks, attacker_stacks, occ_def, "defender"),
+        for allies, foe_index, matrix, label, foe_label in [
+            (attacker_index, defender_index, attacker_multipliers, "attacker", "defender"),
+            (defender_index, attacker_index, defender_multipliers, "defender", "attacker"),
         ]:
-            for stack in side:
-                if not stack.alive or stack.position_x is None or stack.position_y is None:
-                    continue
+            for slot, stack in allies.members.items():
                 stack.attack_meter = min(4.0, stack.attack_meter + stack.attack_speed)
                 attacks = int(stack.attack_meter)
                 stack.attack_meter -= attacks
                 for _ in range(attacks):
-                    if not any(e.alive for e in foes):
+                    if not alive[foe_label]:
                         break
-                    _perform_attack(stack, foes, occ, events, t, label)
-        events.append(
-            {
-                "t": t,
-                "type": "status",
-                "attacker_alive": sum(1 for s in attacker_stacks if s.alive),
-                "defender_alive": sum(1 for s in defender_stacks if s.alive),
-            }
+                    policy = default_policy if stack.target_policy is None else stack.target_policy
+                    kills = _perform_attack(
+                        stack, matrix[slot], foe_index, occ, hits, t, label, policy, rng, stats, profile
+                    )
+                    if kills is not None:
+                        acted = True
+                        alive[foe_label] -= kills
+        if timings is not None:
+            clock, started = time.perf_counter(), clock
+            timings["attack"] += clock - started
+        if log_moves and t % KEYFRAME_INTERVAL == 0:
+            events.append(_keyframe(t, indexes))
+        if log_status:
+            events.append(
+                {
+                    "t": t,
+                    "type": "status",
+                    "attacker_alive": alive["attacker"],
+                    "defender_alive": alive["defender"],
+                }
+            )
+        if timings is not None:
+            timings["logging"] += time.perf_counter() - clock
+        if not alive["attacker"] or not alive["defender"]:
+            continue
+        # Les survivants ne changeront plus : on saute directement au résultat.
+        if alive["attacker"] + alive["defender"] < survivors and _no_damage_possible(indexes, multipliers):
+            decided = END_NO_DAMAGE
+        elif not acted and _battle_stalled(indexes, occ):
+            decided = END_STALEMATE
+
+    if events:
+        yield events
+    return {
+        "winner": _battle_winner(alive["attacker"], alive["defender"]),
+        "rounds": last_t,
+        "attacker_remaining": alive["attacker"],
+        "defender_remaining": alive["defender"],
+        "end_reason": _end_reason(alive["attacker"], alive["defender"], decided),
+        "summary": stats.summary(),
+    }
+
+
+# Champs d'un stack conservés dans l'instantané d'un combat (cf. snapshot_stacks).
+_LABEL_FIELDS = tuple(f.name for f in fields(StackLabel))
+_SNAPSHOT_FIELDS = _LABEL_FIELDS + tuple(f.name for f in fields(StackState) if f.name != "label")
+
+
+def snapshot_stacks(attacker_stacks: List[StackState], defender_stacks: List[StackState]) -> Dict:
+    """
+    Stats compilées des deux armées, placement compris, en lignes compactes
+    (une liste de valeurs par stack, noms de colonnes dans `fields`).
+    """
+    def rows(stacks: List[StackState]) -> List[list]:
+        return [[getattr(s.label if name in _LABEL_FIELDS else s, name) for name in _SNAPSHOT_FIELDS] for s in stacks]
+
+    return {"fields": list(_SNAPSHOT_FIELDS), "attacker": rows(attacker_stacks), "defender": rows(defender_stacks)}
+
+
+def restore_stacks(snapshot: Dict) -> Tuple[List[StackState], List[StackState]]:
+    """Inverse de `snapshot_stacks` ; les champs absents de l'instantané gardent leur défaut."""
+    names = snapshot["fields"]
+
+    def stacks(rows: List[list]) -> List[StackState]:
+        restored = []
+        for row in rows:
+            values = dict(zip(names, row))
+            label = StackLabel(**{name: values.pop(name) for name in _LABEL_FIELDS if name in values})
+            restored.append(StackState(label=label, **values))
+        return restored
+
+    return stacks(snapshot["attacker"]), stacks(snapshot["defender"])
+
+
+def _new_seed() -> int:
+    # 32 bits : reste un entier exact une fois passé en JSON côté navigateur
+    return random.SystemRandom().randrange(1 << 32)
+
+
+def register_engine(
+    name: str,
+    rounds: Callable[..., Iterator[List[Dict]]],
+    aggregate: bool = True,
+    validated: bool = False,
+    version: int = 1,
+    min_stacks: int = 0,
+) -> BattleEngine:
+    """
+    Enregistre (ou remplace) un moteur, sélectionnable ensuite par son nom.
+    `validated` ne se déclare qu'une fois `cross_validate_engines` passé.
+    """
+    engine = BattleEngine(name, rounds, aggregate, validated, version, min_stacks)
+    BATTLE_ENGINES[name] = engine
+    return engine
+
+
+def default_engine() -> str:
+    """
+    Moteur utilisé quand l'appel n'en précise pas : `settings.ARMIES_BATTLE_ENGINE`,
+    qui doit désigner un moteur enregistré et validé.
+    """
+    name = getattr(settings, "ARMIES_BATTLE_ENGINE", REFERENCE_ENGINE)
+    engine = BATTLE_ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Moteur de combat inconnu : {name}")
+    if not engine.validated:
+        raise ValueError(f"Moteur de combat non validé contre {REFERENCE_ENGINE} : {name}")
+    return name
+
+
+def _numpy_rounds(attacker_stacks, defender_stacks, max_rounds, board, targeting, seed, verbosity, profile=None):
+    import numpy as np
+
+    from .vectorized import vectorized_battle_rounds
+
+    return vectorized_battle_rounds(
+        attacker_stacks,
+        defender_stacks,
+        max_rounds=max_rounds,
+        rng=np.random.default_rng(seed),
+        board=board,
+        targeting=targeting,
+        verbosity=verbosity,
+        profile=profile,
+    )
+
+
+def _seeded(rounds: Callable[..., Iterator[List[Dict]]]) -> Callable[..., Iterator[List[Dict]]]:
+    """Adapte un moteur qui tire dans un `random.Random` à l'interface graine du registre."""
+
+    def engine(attacker_stacks, defender_stacks, max_rounds, board, targeting, seed, verbosity, profile=None):
+        return rounds(
+            attacker_stacks, defender_stacks, max_rounds, board, targeting, random.Random(seed), verbosity, profile=profile
         )
 
-    atk_alive = sum(1 for s in attacker_stacks if s.alive)
-    def_alive = sum(1 for s in defender_stacks if s.alive)
-    if atk_alive <= 0 and def_alive <= 0:
-        winner = None
-    elif def_alive <= 0:
-        winner = "attacker"
-    elif atk_alive <= 0:
-        winner = "defender"
-    else:
-        winner = "attacker" if atk_alive > def_alive else "defender"
+    return engine
+
+
+# `validated` : vérifié par EngineValidationTests (cross_validate_engines sur chaque moteur).
+# `version` 2 : attaques numpy résolues par vagues.
+register_engine("python", _seeded(_battle_rounds), validated=True)
+# numpy ne devance python qu'à partir de ~150 stacks par camp (`manage.py bench_battle`) ;
+# les armées du classement (pop_cap 30 par défaut) restent sur la référence.
+register_engine("numpy", _numpy_rounds, aggregate=False, validated=True, version=2, min_stacks=300)
+
+
+def _replay_engine(replay: Dict) -> BattleEngine:
+    """Moteur qui a joué `replay`, s'il le rejoue encore à l'identique (même version)."""
+    engine = BATTLE_ENGINES.get(replay["engine"])
+    if engine is None:
+        raise ValueError(f"Moteur de combat inconnu : {replay['engine']}")
+    # instantanés antérieurs aux versions : version 1
+    version = replay.get("engine_version", 1)
+    if version != engine.version:
+        raise ValueError(
+            f"Combat joué par le moteur {engine.name} version {version}, "
+            f"version actuelle {engine.version} : rejeu impossible"
+        )
+    return engine
+
+
+def _engine_rounds(
+    engine: str,
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    max_rounds: int,
+    board: Board,
+    targeting: str,
+    seed: int,
+    verbosity: str = LOG_FULL,
+    profile: Optional[BattleProfile] = None,
+) -> Iterator[List[Dict]]:
+    if engine not in BATTLE_ENGINES:
+        raise ValueError(f"Moteur de combat inconnu : {engine}")
+    extra = {"profile": profile} if profile is not None else {}
+    return BATTLE_ENGINES[engine].rounds(
+        attacker_stacks, defender_stacks, max_rounds, board, targeting, seed, verbosity, **extra
+    )
+
+
+class BattleStream:
+    """
+    Combat simulé au fil de l'eau (mêmes paramètres que `simulate_battle`).
+
+    Les armées sont lues et placées à la construction (`initial_positions`,
+    `replay` disponibles tout de suite) ; itérer joue le combat et produit
+    les événements de chaque tour dès qu'il est joué, sans garder le journal.
+    `outcome` (résultat sans `log`) est rempli à la fin de l'itération.
+
+    `profile` : instrumente le combat (`BattleProfile`, dans `outcome["profile"]`
+    et cumulé dans `process_profile()`) ; par défaut `settings.ARMIES_PROFILE_BATTLES`.
+    Le temps passé par l'appelant entre deux tours n'entre que dans `total`.
+    """
+
+    def __init__(
+        self,
+        attacker: Union[Army, ArmySpec],
+        defender: Union[Army, ArmySpec],
+        max_rounds: int = 60,
+        engine: Optional[str] = None,
+        aggregate: bool = False,
+        width: int = GRID_SIZE,
+        height: int = GRID_SIZE,
+        targeting: str = "nearest",
+        seed: Optional[int] = None,
+        verbosity: str = LOG_FULL,
+        profile: Optional[bool] = None,
+    ):
+        started = time.perf_counter()
+        if profile is None:
+            profile = getattr(settings, "ARMIES_PROFILE_BATTLES", False)
+        self.profile = BattleProfile() if profile else None
+        chosen = engine
+        engine = default_engine() if engine is None else engine
+        if engine not in BATTLE_ENGINES:
+            raise ValueError(f"Moteur de combat inconnu : {engine}")
+        if targeting not in TARGET_POLICIES:
+            raise ValueError(f"Politique de ciblage inconnue : {targeting}")
+        if verbosity not in LOG_LEVELS:
+            raise ValueError(f"Niveau de journal inconnu : {verbosity}")
+        seed = _new_seed() if seed is None else seed
+        board = board_for(width, height)
+        attacker_stacks, defender_stacks = _prepare_battle_stacks(
+            attacker, defender, aggregate=aggregate, board=board, rng=random.Random(seed), profile=self.profile
+        )
+        if chosen is None and len(attacker_stacks) + len(defender_stacks) < BATTLE_ENGINES[engine].min_stacks:
+            engine = REFERENCE_ENGINE  # petites armées : la référence va plus vite (`BattleEngine.min_stacks`)
+        if aggregate and not BATTLE_ENGINES[engine].aggregate:
+            raise ValueError(f"Le moteur {engine} ne gère pas les stacks agrégés")
+        self.initial_positions = _initial_positions(attacker_stacks, defender_stacks, board)
+        self.replay = {
+            "seed": seed,
+            "engine": engine,
+            "engine_version": BATTLE_ENGINES[engine].version,
+            "max_rounds": max_rounds,
+            "board": [board.width, board.height],
+            "targeting": targeting,
+            "stacks": snapshot_stacks(attacker_stacks, defender_stacks),
+        }
+        self.outcome: Optional[Dict] = None
+        # le combat repart de la graine : il ne dépend pas des tirages du placement
+        self._rounds = _engine_rounds(
+            engine, attacker_stacks, defender_stacks, max_rounds, board, targeting, seed, verbosity, self.profile
+        )
+        self._started = started
+
+    def __iter__(self) -> Iterator[List[Dict]]:
+        if self.profile is None:
+            summary = yield from self._rounds
+        else:
+            summary = yield from self._profiled_rounds(self.profile)
+        self.outcome = {**summary, "initial_positions": self.initial_positions, "replay": self.replay}
+        if self.profile is not None:
+            self.outcome["profile"] = self.profile.as_dict()
+
+    def _profiled_rounds(self, profile: BattleProfile):
+        rounds = self._rounds
+        while True:
+            try:
+                events = next(rounds)
+            except StopIteration as done:
+                summary = done.value
+                break
+            profile.counters["events"] += len(events)
+            yield events
+        profile.battles += 1
+        profile.timings["total"] += time.perf_counter() - self._started
+        _PROCESS_PROFILE.merge(profile)
+        return summary
 
+
+def simulate_battle(
+    attacker: Union[Army, ArmySpec],
+    defender: Union[Army, ArmySpec],
+    max_rounds: int = 60,
+    engine: Optional[str] = None,
+    aggregate: bool = False,
+    width: int = GRID_SIZE,
+    height: int = GRID_SIZE,
+    targeting: str = "nearest",
+    seed: Optional[int] = None,
+    verbosity: str = LOG_FULL,
+    profile: Optional[bool] = None,
+) -> Dict:
+    """
+    Simule un combat entre deux armées (`Army` ou `ArmySpec`).
+
+    `engine` choisit l'implémentation parmi `BATTLE_ENGINES` (par défaut
+    `settings.ARMIES_BATTLE_ENGINE`, sinon "python") : "python" (moteur de
+    référence, objets StackState) ou "numpy" (état en tableaux, attaques
+    résolues par vagues vectorisées ; plus rapide sur les grosses armées
+    seulement : choisi par défaut, il laisse la référence jouer les combats
+    de moins de `BattleEngine.min_stacks` stacks). `register_engine` en
+    ajoute d'autres ; `armies.validation.cross_validate_engines` les compare
+    à la référence.
+    Le résultat a la même forme quel que soit le moteur. Un combat dont
+    l'issue ne peut plus changer (aucun dégât possible, personne ne peut
+    attaquer ni avancer) s'arrête tout de suite ; `end_reason` dit pourquoi
+    il s'est terminé (voir les constantes `END_*`).
+
+    `aggregate` regroupe les unités identiques et adjacentes (`aggregate_stacks`) :
+    dégâts proportionnels au nombre d'unités debout, pertes appliquées au
+    groupe, compteurs de survivants en unités. Pour les grosses armées ;
+    moteur "python" uniquement.
+
+    `width` × `height` fixe la taille du champ de bataille (10 × 10 par
+    défaut) ; les zones de déploiement en dérivent (`Board.deployment_columns`)
+    et les placements enregistrés sont recalés sur les bords.
+
+    `targeting` est la politique de ciblage par défaut (`TARGET_POLICIES`) ;
+    `UnitType.target_policy`, quand il est renseigné, la remplace pour ce type.
+
+    Chaque combat tire ses aléas d'un générateur à lui, initialisé par `seed`
+    (tirée au hasard si absente). `outcome["replay"]` garde la graine, les
+    paramètres et l'instantané des stacks après placement : `replay_battle`
+    rejoue le même combat à l'identique sans relire les armées en base.
+
+    `verbosity` règle le détail du journal (`LOG_LEVELS`) : replay complet,
+    attaques seules, état par tour ou rien. Les tirages ne dépendent pas du
+    niveau choisi : un combat simulé sans journal se rejoue en entier.
+
+    Une `Army` est lue en base une seule fois (`ArmySpec.from_army`), avant
+    le placement ; avec des `ArmySpec`, la simulation ne touche pas à la base.
+
+    `profile=True` (ou `settings.ARMIES_PROFILE_BATTLES`) ajoute
+    `outcome["profile"]` : temps par phase (construction des stacks,
+    placement, déplacements, attaques, journal, total) et compteurs du chemin
+    critique (`PROFILE_COUNTERS`), cumulés aussi par processus
+    (`process_profile`).
+
+    Pour recevoir les événements tour par tour sans tout garder en mémoire,
+    voir `BattleStream`.
+    """
+    stream = BattleStream(
+        attacker, defender, max_rounds, engine, aggregate, width, height, targeting, seed, verbosity, profile
+    )
+    log = [event for events in stream for event in events]
+    return {**stream.outcome, "log": log}
+
+
+def replay_battle(replay: Dict, verbosity: str = LOG_FULL) -> Dict:
+    """
+    Rejoue un combat depuis `outcome["replay"]` : même résultat, même journal.
+    Lève ValueError si le moteur a changé de version depuis (cf. `BattleEngine`).
+    """
+    _replay_engine(replay)
+    attacker_stacks, defender_stacks = restore_stacks(replay["stacks"])
+    board = board_for(*replay["board"])
+    initial_positions = _initial_positions(attacker_stacks, defender_stacks, board)
+    rounds = _engine_rounds(
+        replay["engine"],
+        attacker_stacks,
+        defender_stacks,
+        replay["max_rounds"],
+        board,
+        replay["targeting"],
+        replay["seed"],
+        verbosity,
+    )
+    return {**_collect_log(rounds), "initial_positions": initial_positions}
+
+
+# Champs d'un stack qu'une variante (`fork_battle`) peut modifier.
+_FORKABLE_FIELDS = frozenset(f.name for f in fields(StackState)) - {"label", "stack_id", "army_unit_id", "army_id"}
+
+
+def battle_state_at(replay: Dict, t: int) -> Dict:
+    """
+    État complet du moteur à la fin du tour `t` d'un combat enregistré
+    (`outcome["replay"]`) : stacks, générateur aléatoire et cibles désignées
+    (focus_fire). Sérialisable en JSON ; point de départ de `fork_battle`.
+    Moteur "python" uniquement (tours entiers, état entièrement dans les stacks).
+    Lève ValueError si le combat est déjà joué jusqu'au bout au tour `t` :
+    il n'y a plus rien à reprendre.
+    """
+    if replay["engine"] != "python":
+        raise ValueError("Seul le moteur python sait reprendre un combat en cours")
+    _replay_engine(replay)
+    attacker_stacks, defender_stacks = restore_stacks(replay["stacks"])
+    board = board_for(*replay["board"])
+    rng = random.Random(replay["seed"])
+    indexes = (SpatialIndex(attacker_stacks, board), SpatialIndex(defender_stacks, board))
+    rounds = _battle_rounds(
+        attacker_stacks,
+        defender_stacks,
+        min(t, replay["max_rounds"]),
+        board,
+        replay["targeting"],
+        rng,
+        LOG_NONE,
+        indexes=indexes,
+    )
+    summary = _collect_log(rounds)
+    if summary["end_reason"] != END_MAX_ROUNDS or summary["rounds"] >= replay["max_rounds"]:
+        raise ValueError(f"Combat terminé au tour {summary['rounds']} ({summary['end_reason']}) : rien à reprendre")
+    version, internal, gauss = rng.getstate()
     return {
-        "winner": winner,
-        "rounds": last_t,
-        "log": events,
-        "attacker_remaining": atk_alive,
-        "defender_remaining": def_alive,
-        "initial_positions": initial_positions,
+        "t": summary["rounds"],
+        "max_rounds": replay["max_rounds"],
+        "board": replay["board"],
+        "targeting": replay["targeting"],
+        "stacks": snapshot_stacks(attacker_stacks, defender_stacks),
+        "focus": [index.focus.stack_id if index.focus is not None else None for index in indexes],
+        "rng": [version, list(internal), gauss],
     }
+
+
+def fork_battle(
+    state: Dict,
+    seed: Optional[int] = None,
+    remove: Iterable[int] = (),
+    changes: Optional[Dict[int, Dict]] = None,
+    verbosity: str = LOG_FULL,
+) -> Dict:
+    """
+    Reprend un combat depuis `battle_state_at`, avec des variantes :
+
+    - `seed` : autre suite de tirages ; par défaut celle du combat d'origine,
+      si bien que sans autre changement la suite est identique à l'original ;
+    - `remove` : stack_id retirés du champ de bataille ;
+    - `changes` : stack_id -> nouvelles valeurs de champs de `StackState`
+      (ex. stats après une amélioration).
+
+    Le journal ne contient que les tours joués après la reprise ;
+    `initial_positions` décrit l'état au tour de reprise (`forked_at`).
+    """
+    attacker_stacks, defender_stacks = restore_stacks(state["stacks"])
+    by_id = {s.stack_id: s for s in attacker_stacks + defender_stacks}
+    for stack_id in remove:
+        if stack_id not in by_id:
+            raise ValueError(f"Stack inconnu : {stack_id}")
+        stack = by_id[stack_id]
+        stack.alive = False
+        stack.position_x = stack.position_y = None
+    for stack_id, values in (changes or {}).items():
+        if stack_id not in by_id:
+            raise ValueError(f"Stack inconnu : {stack_id}")
+        unknown = set(values) - _FORKABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Champs non modifiables : {', '.join(sorted(unknown))}")
+        for name, value in values.items():
+            setattr(by_id[stack_id], name, value)
+    if seed is None:
+        version, internal, gauss = state["rng"]
+        rng = random.Random()
+        rng.setstate((version, tuple(internal), gauss))
+    else:
+        rng = random.Random(seed)
+
+    board = board_for(*state["board"])
+    # index construits après les changements : cibles et tas de ciblage à jour
+    indexes = (SpatialIndex(attacker_stacks, board), SpatialIndex(defender_stacks, board))
+    for index, stack_id in zip(indexes, state["focus"]):
+        index.focus = by_id.get(stack_id)
+    initial_positions = _initial_positions(attacker_stacks, defender_stacks, board)
+    rounds = _battle_rounds(
+        attacker_stacks,
+        defender_stacks,
+        state["max_rounds"],
+        board,
+        state["targeting"],
+        rng,
+        verbosity,
+        start=state["t"],
+        indexes=indexes,
+    )
+    return {**_collect_log(rounds), "initial_positions": initial_positions, "forked_at": state["t"]}
+
+
+def battle_metadata(outcome: Dict) -> Dict:
+    """
+    Ce qu'on garde d'un combat dans `Battle.metadata` : positions initiales,
+    de quoi le rejouer et, s'il a été instrumenté, son profil.
+    """
+    metadata = {**outcome.get("initial_positions", {}), "replay": outcome["replay"]}
+    if "profile" in outcome:
+        metadata["profile"] = outcome["profile"]
+    return metadata
+
+
+# Clés de `Battle.metadata` qui décrivent le déploiement (cf. `_initial_positions`).
+_POSITION_KEYS = ("board", "attacker", "defender")
+
+
+def battle_positions(metadata: Dict) -> Dict:
+    """Positions initiales seules d'un `Battle.metadata`, sans l'instantané de rejeu ni le profil."""
+    return {key: metadata[key] for key in _POSITION_KEYS if key in (metadata or {})}
+
+
+def battle_log(log, metadata: Dict) -> List[Dict]:
+    """
+    Journal d'un combat : celui enregistré (décodé s'il est compact, cf.
+    `encode_log`), sinon régénéré depuis `metadata["replay"]`.
+    """
+    if isinstance(log, dict):
+        return decode_log(log, metadata)
+    if log or not metadata or "replay" not in metadata:
+        return log
+    return replay_battle(metadata["replay"])["log"]
+
+
+# --- Journal compact -----------------------------------------------------------
+#
+# Format colonne par type d'événement, versionné (`LOG_FORMAT_VERSION`) :
+#   "types"     code de chaque événement (_EVENT_CODES), dans l'ordre du journal
+#   "dt"        écart de `t` avec l'événement précédent
+#   "move"      unit (index dans le dictionnaire), dir (pas codé, cf. _STEP_CODES),
+#               jump ([rang, x, y] quand le départ n'est pas la dernière case connue)
+#   "attack"    unit, crit, targets (nombre de cibles, détaillées dans "hit")
+#   "hit"       unit, flags (_HIT_FLAGS), hp (last_unit_hp), dmg, units (-1 : stack simple)
+#   "status"    attacker, defender (survivants)
+#   "keyframe"  sizes ([n attaquants, n défenseurs]), unit, x, y, hp, units
+# Le dictionnaire des unités est celui des positions initiales, déjà dans
+# `Battle.metadata` : index = rang dans attacker + defender.
+
+LOG_FORMAT_VERSION = 1
+_EVENT_TYPES = ("move", "attack", "status", "keyframe")
+_EVENT_CODES = {name: code for code, name in enumerate(_EVENT_TYPES)}
+_STEP_CODES = {(dx, dy): (dx + 1) * 3 + dy + 1 for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+_STEPS = {code: step for step, code in _STEP_CODES.items()}
+_HIT_FLAGS = ("killed", "remaining", "crit", "dodge")
+
+
+def _unit_dictionary(initial_positions: Dict) -> List[Tuple[str, Dict]]:
+    return [(side, unit) for side in _SIDES for unit in initial_positions.get(side, [])]
+
+
+def encode_log(log: List[Dict], initial_positions: Dict) -> Dict:
+    """
+    Encode un journal d'événements au format compact (voir plus haut).
+    `initial_positions` sert de dictionnaire des unités et de point de
+    départ des déplacements ; `decode_log` fait l'inverse.
+    """
+    units = _unit_dictionary(initial_positions)
+    index = {(side, unit["id"]): rank for rank, (side, unit) in enumerate(units)}
+    position = [(unit["x"], unit["y"]) for _, unit in units]
+    out = {
+        "v": LOG_FORMAT_VERSION,
+        "types": [],
+        "dt": [],
+        "move": {"unit": [], "dir": [], "jump": []},
+        "attack": {"unit": [], "crit": [], "targets": []},
+        "hit": {"unit": [], "flags": [], "hp": [], "dmg": [], "units": []},
+        "status": {"attacker": [], "defender": []},
+        "keyframe": {"sizes": [], "unit": [], "x": [], "y": [], "hp": [], "units": []},
+    }
+
+    def rank(side: str, stack_id: int) -> int:
+        if (side, stack_id) not in index:
+            raise ValueError(f"Unité absente des positions initiales : {side} {stack_id}")
+        return index[(side, stack_id)]
+
+    t = 0
+    for event in log:
+        kind = event["type"]
+        out["types"].append(_EVENT_CODES[kind])
+        out["dt"].append(round(event["t"] - t, 3))
+        t = event["t"]
+        if kind == "move":
+            unit = rank(event["side"], event["unit_id"])
+            start = (event["from"]["x"], event["from"]["y"])
+            end = (event["to"]["x"], event["to"]["y"])
+            if start != position[unit]:
+                out["move"]["jump"].append([len(out["move"]["unit"]), *start])
+            out["move"]["unit"].append(unit)
+            out["move"]["dir"].append(_STEP_CODES[(end[0] - start[0], end[1] - start[1])])
+            position[unit] = end
+        elif kind == "attack":
+            foe = _SIDES[1 - _SIDES.index(event["attacker_side"])]
+            out["attack"]["unit"].append(rank(event["attacker_side"], event["attacker_id"]))
+            out["attack"]["crit"].append(int(event["crit"]))
+            out["attack"]["targets"].append(len(event["targets"]))
+            for hit in event["targets"]:
+                out["hit"]["unit"].append(rank(foe, hit["defender_id"]))
+                out["hit"]["flags"].append(sum(1 << bit for bit, flag in enumerate(_HIT_FLAGS) if hit[flag]))
+                out["hit"]["hp"].append(hit["last_unit_hp"])
+                out["hit"]["dmg"].append(hit["dmg"])
+                out["hit"]["units"].append(hit.get("units", -1))
+        elif kind == "status":
+            out["status"]["attacker"].append(event["attacker_alive"])
+            out["status"]["defender"].append(event["defender_alive"])
+        else:
+            frame = out["keyframe"]
+            frame["sizes"].append([len(event["attacker"]), len(event["defender"])])
+            for side in _SIDES:
+                for row in event[side]:
+                    frame["unit"].append(rank(side, row["id"]))
+                    frame["x"].append(row["x"])
+                    frame["y"].append(row["y"])
+                    frame["hp"].append(row["hp"])
+                    frame["units"].append(row.get("units", -1))
+    return out
+
+
+def compact_battle_log(log, metadata: Dict):
+    """
+    Journal d'un combat à envoyer au navigateur : celui enregistré tel quel
+    (compact ou non), sinon régénéré depuis la graine et encodé. Pas de
+    contrôle décodage == original ici : `encode_log` est sans perte sur les
+    journaux des moteurs (vérifié par les tests) ; les journaux anciens ne
+    sont réécrits qu'après ce contrôle (commande compact_battle_logs).
+    """
+    if log:
+        return log
+    return encode_log(battle_log(log, metadata), metadata)
+
+
+def decode_log(encoded: Dict, initial_positions: Dict) -> List[Dict]:
+    """Journal d'événements complet à partir du format compact de `encode_log`."""
+    if encoded.get("v") != LOG_FORMAT_VERSION:
+        raise ValueError(f"Format de journal inconnu : {encoded.get('v')}")
+    units = _unit_dictionary(initial_positions)
+    position = [(unit["x"], unit["y"]) for _, unit in units]
+    moves, attacks, hits = encoded["move"], encoded["attack"], encoded["hit"]
+    statuses, frames = encoded["status"], encoded["keyframe"]
+    jumps = {rank: (x, y) for rank, x, y in moves["jump"]}
+    cursor = dict.fromkeys(_EVENT_TYPES, 0)
+    next_hit = next_row = 0
+    log: List[Dict] = []
+    t = 0
+    for code, dt in zip(encoded["types"], encoded["dt"]):
+        kind = _EVENT_TYPES[code]
+        i = cursor[kind]
+        cursor[kind] += 1
+        t = round(t + dt, 3) if isinstance(dt, float) or isinstance(t, float) else t + dt
+        if kind == "move":
+            unit = moves["unit"][i]
+            side, info = units[unit]
+            start = jumps.get(i, position[unit])
+            dx, dy = _STEPS[moves["dir"][i]]
+            end = (start[0] + dx, start[1] + dy)
+            position[unit] = end
+            log.append(
+                {
+                    "t": t,
+                    "type": "move",
+                    "unit_id": info["id"],
+                    "unit_name": info["unit_name"],
+                    "side": side,
+                    "from": {"x": start[0], "y": start[1]},
+                    "to": {"x": end[0], "y": end[1]},
+                }
+            )
+        elif kind == "attack":
+            side, info = units[attacks["unit"][i]]
+            targets = []
+            for k in range(next_hit, next_hit + attacks["targets"][i]):
+                flags = hits["flags"][k]
+                target = units[hits["unit"][k]][1]
+                hit = {
+                    "defender": target["unit_name"],
+                    "defender_id": target["id"],
+                    "killed": bool(flags & 1),
+                    "remaining": bool(flags & 2),
+                    "last_unit_hp": hits["hp"][k],
+                    "crit": bool(flags & 4),
+                    "dodge": bool(flags & 8),
+                    "dmg": hits["dmg"][k],
+                }
+                if hits["units"][k] >= 0:
+                    hit["units"] = hits["units"][k]
+                targets.append(hit)
+            next_hit += attacks["targets"][i]
+            log.append(
+                {
+                    "t": t,
+                    "type": "attack",
+                    "attacker": info["unit_name"],
+                    "attacker_id": info["id"],
+                    "attacker_side": side,
+                    "targets": targets,
+                    "crit": bool(attacks["crit"][i]),
+                }
+            )
+        elif kind == "status":
+            log.append(
+                {
+                    "t": t,
+                    "type": "status",
+                    "attacker_alive": statuses["attacker"][i],
+                    "defender_alive": statuses["defender"][i],
+                }
+            )
+        else:
+            frame = {"t": t, "type": "keyframe"}
+            for side, size in zip(_SIDES, frames["sizes"][i]):
+                rows = []
+                for k in range(next_row, next_row + size):
+                    unit = units[frames["unit"][k]][1]
+                    row = {"id": unit["id"], "x": frames["x"][k], "y": frames["y"][k], "hp": frames["hp"][k]}
+                    if frames["units"][k] >= 0:
+                        row["units"] = frames["units"][k]
+                    rows.append(row)
+                next_row += size
+                frame[side] = rows
+            log.append(frame)
+    return log
+
+
+def simulate_battle_batch(
+    matchups: Sequence[Tuple[Union[Army, ArmySpec], Union[Army, ArmySpec]]],
+    copies: int = 1,
+    max_rounds: int = 60,
+    summaries: bool = False,
+    width: int = GRID_SIZE,
+    height: int = GRID_SIZE,
+    seed: Optional[int] = None,
+) -> Dict:
+    """
+    Simule `copies` combats indépendants pour chaque couple (attaquant, défenseur).
+
+    Tous les combats avancent ensemble dans le noyau NumPy (dimension batch),
+    sans journal d'événements : pensé pour les estimations de probabilité de
+    victoire et les runs d'équilibrage. Les armées ne sont lues en base
+    qu'une fois par couple ; les unités sans position sont replacées au
+    hasard dans chaque exemplaire. Le noyau batch cible toujours l'ennemi
+    le plus proche (pas de `target_policy`).
+
+    Comme `simulate_battle`, le lot tire ses aléas (placements et noyau)
+    de `seed`, tirée au hasard si absente et rendue dans `result["seed"]` :
+    même graine, mêmes résultats.
+    """
+    import numpy as np
+
+    from .vectorized import run_battle_batch
+
+    seed = _new_seed() if seed is None else seed
+    rng = random.Random(seed)
+    board = board_for(width, height)
+    stack_pairs = []
+    for attacker, defender in matchups:
+        attacker_stacks, defender_stacks = _build_battle_stacks(attacker, defender)
+        for _ in range(copies):
+            attacker_copy = [replace(s) for s in attacker_stacks]
+            defender_copy = [replace(s) for s in defender_stacks]
+            _place_battle_stacks(attacker_copy, defender_copy, board, rng)
+            stack_pairs.append((attacker_copy, defender_copy))
+    result = run_battle_batch(
+        stack_pairs, max_rounds=max_rounds, rng=np.random.default_rng(seed), summaries=summaries, board=board
+    )
+    result["seed"] = seed
+    for idx, summary in enumerate(result.get("summaries", [])):
+        summary["matchup"] = idx // copies
+    return result
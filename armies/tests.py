@@ -1,3 +1,1003 @@
+import json
+from dataclasses import replace
+import os
+import random
+import tempfile
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Army, ArmyUnit, ArmyUpgrade, Battle, Commander, UnitType, Upgrade
+from .services import (
+    DEFAULT_BOARD,
+    FLOW_DEPTH_CAP,
+    GRID_SIZE,
+    BATTLE_ENGINES,
+    LOG_LEVELS,
+    PROFILE_COUNTERS,
+    PROFILE_PHASES,
+    REFERENCE_ENGINE,
+    ArmySpec,
+    BattleStream,
+    TARGET_POLICIES,
+    TYPE_MULTIPLIERS,
+    FlowField,
+    Occupancy,
+    SpatialIndex,
+    StackState,
+    _apply_damage,
+    _choose_target,
+    _multiplier_table,
+    _perform_attack,
+    _prepare_battle_stacks,
+    _random_place,
+    _run_battle,
+    aggregate_stacks,
+    battle_log,
+    battle_metadata,
+    battle_positions,
+    battle_specs,
+    battle_state_at,
+    board_for,
+    build_stack_states,
+    damage_multiplier_matrix,
+    decode_log,
+    encode_log,
+    fork_battle,
+    process_profile,
+    register_engine,
+    replay_battle,
+    reset_process_profile,
+    seek_log,
+    simulate_battle,
+    simulate_battle_batch,
+)
+from .bench import bench_board, bench_config, synthetic_army
+from .golden import explain_divergence, load_golden, run_golden_case
+from .validation import EngineDivergence, cross_validate_engines
+from .vectorized import run_vectorized_battle
+
+
+def make_stack(stack_id, x, y, **overrides):
+    values = dict(
+        stack_id=stack_id, army_unit_id=stack_id, army_id=1, army_name="Test", unit_name=f"U{stack_id}",
+        attack=10, defense=0, health=100, current_hp=100, speed=1, attack_speed=1.0, move_speed=1.0,
+        range=1, damage_min=10, damage_max=10, attack_type="normal", armor_type="unarmored",
+        crit_chance=0.0, crit_multiplier=2.0, dodge_chance=0.0, aoe_radius=0, position_x=x, position_y=y,
+    )
+    values.update(overrides)
+    return StackState.create(**values)
+
+
+class BattleEngineTestMixin:
+    def make_army(self, name, units, position_cols=None):
+        """Crée une armée ; `units` est une liste de (UnitType, nombre)."""
+        commander = Commander.objects.create(name=f"Cmd {name}")
+        army = Army.objects.create(commander=commander, name=name)
+        row = 0
+        for unit_type, count in units:
+            for _ in range(count):
+                x = y = None
+                if position_cols:
+                    x = position_cols[row % len(position_cols)]
+                    y = row // len(position_cols)
+                ArmyUnit.objects.create(army=army, unit_type=unit_type, position_x=x, position_y=y)
+                row += 1
+        return army
+
+    def setUp(self):
+        self.footman = UnitType.objects.create(
+            name="Footman", health=420, defense=2, damage_min=12, damage_max=13,
+            attack_speed=0.74, move_speed=1.0, range=1, armor_type="heavy",
+        )
+        self.archer = UnitType.objects.create(
+            name="Archer", health=310, defense=0, damage_min=17, damage_max=19,
+            attack_speed=0.67, move_speed=1.0, range=5, attack_type="piercing", armor_type="medium",
+        )
+        self.mortar = UnitType.objects.create(
+            name="Mortar", health=360, defense=0, damage_min=51, damage_max=60,
+            attack_speed=0.29, move_speed=0.5, range=8, aoe_radius=1, attack_type="siege",
+            armor_type="heavy",
+        )
+
+
+class MatchupTestMixin(BattleEngineTestMixin):
+    """Deux armées mixtes face à face, défenseurs placés en colonnes 8-9."""
+
+    def setUp(self):
+        super().setUp()
+        self.attacker = self.make_army("Nord", [(self.footman, 4), (self.archer, 2)])
+        self.defender = self.make_army("Sud", [(self.footman, 3), (self.mortar, 1)], position_cols=[8, 9])
+
+
+class SimulateBattleTests(MatchupTestMixin, TestCase):
+    def assert_outcome_shape(self, outcome):
+        self.assertIn(outcome["winner"], ("attacker", "defender", None))
+        self.assertEqual(len(outcome["initial_positions"]["attacker"]), 6)
+        self.assertEqual(len(outcome["initial_positions"]["defender"]), 4)
+        statuses = [ev for ev in outcome["log"] if ev["type"] == "status"]
+        self.assertEqual(statuses[-1]["attacker_alive"], outcome["attacker_remaining"])
+        self.assertEqual(statuses[-1]["defender_alive"], outcome["defender_remaining"])
+
+    def test_engines_share_outcome_shape(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine)
+                self.assert_outcome_shape(outcome)
+
+    def test_incremental_counters_match_final_state(self):
+        attackers, defenders = _prepare_battle_stacks(self.attacker, self.defender)
+        outcome = _run_battle(attackers, defenders, max_rounds=60)
+        self.assertEqual(outcome["attacker_remaining"], sum(s.alive for s in attackers))
+        self.assertEqual(outcome["defender_remaining"], sum(s.alive for s in defenders))
+        for stack in attackers + defenders:
+            self.assertEqual(stack.alive, stack.current_hp > 0)
+
+    def test_harmless_armies_end_without_playing_rounds(self):
+        sorcerer = UnitType.objects.create(
+            name="Sorceress", health=300, damage_min=10, damage_max=12, attack_speed=1.0, move_speed=1.0,
+            range=5, attack_type="magic", armor_type="divine",
+        )
+        attacker = self.make_army("Mages A", [(sorcerer, 2)])
+        defender = self.make_army("Mages B", [(sorcerer, 2)], position_cols=[8, 9])
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                outcome = simulate_battle(attacker, defender, engine=engine)
+                self.assertEqual(outcome["end_reason"], "no_damage")
+                self.assertEqual(outcome["rounds"], 0)
+                self.assertEqual(outcome["winner"], "defender")  # égalité de survivants
+                self.assertEqual([ev["type"] for ev in outcome["log"]], ["status"])
+
+    def test_stalled_battle_is_fast_forwarded(self):
+        tower = UnitType.objects.create(
+            name="Tower", health=500, damage_min=10, damage_max=12, attack_speed=1.0, move_speed=0.0, range=2,
+        )
+        attacker = self.make_army("Tours A", [(tower, 1)], position_cols=[0])
+        defender = self.make_army("Tours B", [(tower, 1)], position_cols=[9])
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                outcome = simulate_battle(attacker, defender, engine=engine)
+                self.assertEqual(outcome["end_reason"], "stalemate")
+                self.assertLess(outcome["rounds"], 60)
+
+    def test_large_board_moves_stacks_beyond_the_capped_field(self):
+        board = board_for(80, 20)
+        attackers = [make_stack(i, 0, i) for i in range(4)]
+        defenders = [make_stack(10 + i, 79, i) for i in range(4)]
+        outcome = _run_battle(attackers, defenders, max_rounds=120, board=board)
+        self.assertEqual(outcome["end_reason"], "elimination")
+        moves = [ev for ev in outcome["log"] if ev["type"] == "move"]
+        self.assertTrue(all(0 <= ev["to"]["x"] < 80 and 0 <= ev["to"]["y"] < 20 for ev in moves))
+
+    def test_large_board_routes_distant_stacks_around_a_wall(self):
+        # mur allié immobile en colonne 50, ouvert en bas : en ligne droite,
+        # le fantassin resterait collé au mur, à plus de FLOW_DEPTH_CAP cases
+        board = board_for(100, 20)
+        attackers = [make_stack(1, 0, 0)] + [make_stack(10 + y, 50, y, move_speed=0.0) for y in range(19)]
+        defenders = [make_stack(2, 99, 0, move_speed=0.0)]
+        runs = {
+            "python": lambda a, d: _run_battle(a, d, max_rounds=200, board=board),
+            "numpy": lambda a, d: run_vectorized_battle(a, d, max_rounds=200, board=board),
+        }
+        for engine, run in runs.items():
+            with self.subTest(engine=engine):
+                outcome = run([replace(s) for s in attackers], [replace(s) for s in defenders])
+                self.assertEqual(outcome["end_reason"], "elimination")
+                self.assertEqual(outcome["winner"], "attacker")
+
+    def test_board_size_is_a_battle_parameter(self):
+        outcome = simulate_battle(self.attacker, self.defender, width=30, height=12)
+        self.assertEqual(outcome["initial_positions"]["board"], {"width": 30, "height": 12})
+        # défenseurs enregistrés en colonnes 8-9 : recalés sur le bord droit
+        self.assertTrue(all(u["x"] >= 24 for u in outcome["initial_positions"]["defender"]))
+
+    def test_targeting_policies_run_on_every_engine(self):
+        self.footman.target_policy = "focus_fire"
+        self.footman.save()
+        attackers, _ = _prepare_battle_stacks(self.attacker, self.defender)
+        self.assertEqual({s.target_policy for s in attackers}, {TARGET_POLICIES.index("focus_fire"), None})
+        for engine in ("python", "numpy"):
+            for targeting in TARGET_POLICIES:
+                with self.subTest(engine=engine, targeting=targeting):
+                    outcome = simulate_battle(self.attacker, self.defender, engine=engine, targeting=targeting)
+                    self.assert_outcome_shape(outcome)
+        with self.assertRaises(ValueError):
+            simulate_battle(self.attacker, self.defender, targeting="random")
+
+    def test_unknown_engine_rejected(self):
+        with self.assertRaises(ValueError):
+            simulate_battle(self.attacker, self.defender, engine="cuda")
+
+    def test_vectorized_engine_is_reproducible_with_rng(self):
+        runs = []
+        for _ in range(2):
+            attackers = build_stack_states(self.attacker)
+            defenders = build_stack_states(self.defender)
+            for idx, stack in enumerate(attackers):
+                stack.position_x, stack.position_y = idx % 2, idx // 2
+            runs.append(run_vectorized_battle(attackers, defenders, rng=np.random.default_rng(7)))
+        self.assertEqual(runs[0]["log"], runs[1]["log"])
+        self.assertEqual(runs[0]["winner"], runs[1]["winner"])
+
+    def test_seed_makes_battles_reproducible(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                first = simulate_battle(self.attacker, self.defender, engine=engine, seed=42)
+                second = simulate_battle(self.attacker, self.defender, engine=engine, seed=42)
+                self.assertEqual(first["initial_positions"], second["initial_positions"])
+                self.assertEqual(first["log"], second["log"])
+                self.assertEqual(first["replay"]["seed"], 42)
+
+    def test_stream_yields_rounds_as_they_are_played(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                stream = BattleStream(self.attacker, self.defender, engine=engine, seed=3)
+                self.assertIsNone(stream.outcome)
+                rounds = list(stream)
+                # un tour par paquet, clos par son état
+                self.assertTrue(all(events[-1]["type"] == "status" for events in rounds))
+                self.assertEqual([events[-1]["t"] for events in rounds], list(range(1, len(rounds) + 1)))
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=3)
+                self.assertEqual([event for events in rounds for event in events], outcome["log"])
+                self.assertEqual(stream.outcome["winner"], outcome["winner"])
+
+    def test_verbosity_filters_the_log_without_changing_the_battle(self):
+        kinds = {
+            "full": {"move", "attack", "keyframe", "status"},
+            "attacks": {"attack"},
+            "rounds": {"status"},
+            "none": set(),
+        }
+        for engine in ("python", "numpy"):
+            full = simulate_battle(self.attacker, self.defender, engine=engine, seed=11)
+            for verbosity in LOG_LEVELS:
+                with self.subTest(engine=engine, verbosity=verbosity):
+                    outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=11, verbosity=verbosity)
+                    expected = [event for event in full["log"] if event["type"] in kinds[verbosity]]
+                    self.assertEqual(outcome["log"], expected)
+                    self.assertEqual(outcome["rounds"], full["rounds"])
+                    self.assertEqual(outcome["end_reason"], full["end_reason"])
+        with self.assertRaises(ValueError):
+            simulate_battle(self.attacker, self.defender, verbosity="debug")
+
+    def test_summary_matches_the_log(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=9)
+                summary = outcome["summary"]
+                attacks = [event for event in outcome["log"] if event["type"] == "attack"]
+                for side, foe in (("attacker", "defender"), ("defender", "attacker")):
+                    total = summary[side]["total"]
+                    own = [event for event in attacks if event["attacker_side"] == side]
+                    self.assertEqual(total["attacks"], len(own))
+                    self.assertEqual(total["crits"], sum(event["crit"] for event in own))
+                    self.assertEqual(
+                        summary[foe]["total"]["dodges"], sum(hit["dodge"] for event in own for hit in event["targets"])
+                    )
+                    self.assertEqual(total["kills"], summary[foe]["total"]["engaged"] - summary[foe]["total"]["survivors"])
+                    self.assertAlmostEqual(total["damage_dealt"], summary[foe]["total"]["damage_taken"], places=1)
+                    self.assertEqual(total["survivors"], outcome[f"{side}_remaining"])
+                self.assertEqual(sum(unit["engaged"] for unit in summary["attacker"]["units"].values()), 6)
+                quiet = simulate_battle(self.attacker, self.defender, engine=engine, seed=9, verbosity="none")
+                self.assertEqual(quiet["summary"], summary)
+
+    def test_army_specs_simulate_without_the_database(self):
+        forge = Upgrade.objects.create(name="Forge", attack_bonus=2, unit_type=self.footman)
+        ArmyUpgrade.objects.create(army=self.attacker, upgrade=forge, level=2)
+        spec = ArmySpec.from_army(self.attacker)
+        self.assertEqual(ArmySpec.from_dict(json.loads(json.dumps(spec.to_dict()))), spec)
+        footmen = [s for s in build_stack_states(spec) if s.unit_name == "Footman"]
+        self.assertEqual(footmen[0].damage_min, 16)
+
+        expected = simulate_battle(self.attacker, self.defender, seed=12)
+        attacker, defender = ArmySpec.from_army(self.attacker, "__auto__"), ArmySpec.from_army(self.defender)
+        with self.assertNumQueries(0):
+            outcome = simulate_battle(attacker, defender, seed=12)
+        self.assertEqual(outcome["log"], expected["log"])
+
+        # spec écrite à la main : unités sans id, numérotées au combat
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for data in (
+                {"name": "A", "unit_types": [{"name": "Grunt", "health": 50, "damage_min": 8, "damage_max": 9}],
+                 "units": [{"unit_type": "Grunt"}, {"unit_type": "Grunt"}]},
+                {"name": "B", "unit_types": [{"name": "Peon", "health": 20}], "units": [{"unit_type": "Peon"}]},
+            ):
+                paths.append(os.path.join(tmp, f"{data['name']}.json"))
+                with open(paths[-1], "w") as fh:
+                    json.dump(data, fh)
+            output = os.path.join(tmp, "outcome.json")
+            out = StringIO()
+            call_command("simulate_army_specs", *paths, "--seed", "3", "--output", output, stdout=out)
+            self.assertIn("Vainqueur: A", out.getvalue())
+            with open(output) as fh:
+                stored = json.load(fh)
+        ids = [u["id"] for side in ("attacker", "defender") for u in stored["initial_positions"][side]]
+        self.assertEqual(len(set(ids)), 3)
+
+
+class BattleReplayTests(MatchupTestMixin, TestCase):
+    def test_keyframes_match_the_events_before_them(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=5)
+                positions = {
+                    unit["id"]: (unit["x"], unit["y"])
+                    for side in ("attacker", "defender")
+                    for unit in outcome["initial_positions"][side]
+                }
+                keyframes = []
+                for event in outcome["log"]:
+                    if event["type"] == "move":
+                        positions[event["unit_id"]] = (event["to"]["x"], event["to"]["y"])
+                    elif event["type"] == "attack":
+                        for hit in event["targets"]:
+                            if hit["killed"]:
+                                del positions[hit["defender_id"]]
+                    elif event["type"] == "keyframe":
+                        keyframes.append(event)
+                        rows = event["attacker"] + event["defender"]
+                        self.assertEqual({row["id"]: (row["x"], row["y"]) for row in rows}, positions)
+                self.assertTrue(keyframes)
+
+                seek = seek_log(outcome["log"], 25)
+                self.assertIn(seek["keyframe"], keyframes)
+                self.assertTrue(all(seek["keyframe"]["t"] <= event["t"] <= 25 for event in seek["log"]))
+                self.assertEqual(seek["log"][-1], [ev for ev in outcome["log"] if ev["t"] <= 25][-1])
+                self.assertIsNone(seek_log(outcome["log"], 3)["keyframe"])
+
+    def test_fork_resumes_a_battle_from_a_snapshot(self):
+        outcome = simulate_battle(self.attacker, self.defender, targeting="focus_fire", seed=8)
+        state = json.loads(json.dumps(battle_state_at(outcome["replay"], 12)))
+        self.assertEqual(state["t"], 12)
+        # même graine, aucun changement : la suite de l'original
+        resumed = fork_battle(state)
+        self.assertEqual(resumed["log"], [event for event in outcome["log"] if event["t"] > 12])
+        self.assertEqual(resumed["winner"], outcome["winner"])
+        self.assertEqual(resumed["rounds"], outcome["rounds"])
+
+        defenders = [row[state["stacks"]["fields"].index("stack_id")] for row in state["stacks"]["defender"]]
+        self.assertEqual(fork_battle(state, remove=defenders)["winner"], "attacker")
+        tougher = fork_battle(state, seed=1, changes={stack_id: {"defense": 1000} for stack_id in defenders})
+        self.assertEqual(tougher["forked_at"], 12)
+        self.assertTrue(all(event["t"] > 12 for event in tougher["log"]))
+        with self.assertRaises(ValueError):
+            fork_battle(state, changes={defenders[0]: {"label": None}})
+
+    def test_fork_stops_at_the_end_of_the_battle(self):
+        tower = UnitType.objects.create(
+            name="Tower", health=500, damage_min=10, damage_max=12, attack_speed=1.0, move_speed=0.0, range=2,
+        )
+        stalled = (self.make_army("Tours A", [(tower, 1)], position_cols=[0]),
+                   self.make_army("Tours B", [(tower, 1)], position_cols=[9]))
+        for attacker, defender in ((self.attacker, self.defender), stalled):
+            outcome = simulate_battle(attacker, defender, engine="python", seed=8)
+            with self.subTest(end_reason=outcome["end_reason"]):
+                # combat joué jusqu'au bout : rien à reprendre
+                for t in (outcome["rounds"], outcome["rounds"] + 3):
+                    with self.assertRaises(ValueError):
+                        battle_state_at(outcome["replay"], t)
+                # dernier tour d'où reprendre : la suite et l'issue sont celles de l'original
+                t = outcome["rounds"] - 1
+                while True:
+                    try:
+                        state = battle_state_at(outcome["replay"], t)
+                        break
+                    except ValueError:
+                        t -= 1
+                self.assertGreaterEqual(t, outcome["rounds"] - 2)
+                resumed = fork_battle(state)
+                self.assertEqual(resumed["log"], [event for event in outcome["log"] if event["t"] > t])
+                for key in ("winner", "rounds", "end_reason"):
+                    self.assertEqual(resumed[key], outcome[key])
+
+    def test_log_is_regenerated_from_metadata(self):
+        outcome = simulate_battle(self.attacker, self.defender, engine="python", aggregate=True)
+        metadata = json.loads(json.dumps(battle_metadata(outcome)))
+        # plus besoin des armées en base : l'instantané suffit
+        ArmyUnit.objects.all().delete()
+        self.assertEqual(battle_log([], metadata), outcome["log"])
+        replayed = replay_battle(metadata["replay"])
+        self.assertEqual(replayed["winner"], outcome["winner"])
+        self.assertEqual(replayed["initial_positions"], outcome["initial_positions"])
+        self.assertEqual(battle_log([], {"attacker": []}), [])
+
+    def test_replay_requires_the_engine_version_that_played(self):
+        outcome = simulate_battle(self.attacker, self.defender, engine="numpy", seed=4)
+        replay = outcome["replay"]
+        self.assertEqual(replay["engine_version"], BATTLE_ENGINES["numpy"].version)
+        self.assertEqual(replay_battle(replay)["log"], outcome["log"])
+        for stale in ({**replay, "engine_version": replay["engine_version"] + 1}, {**replay, "engine": "retired"}):
+            with self.subTest(replay=stale["engine"]), self.assertRaises(ValueError):
+                replay_battle(stale)
+        # instantané d'avant les versions : version 1, que numpy a dépassée
+        legacy = {key: value for key, value in replay.items() if key != "engine_version"}
+        with self.assertRaises(ValueError):
+            battle_log([], {"replay": legacy})
+
+    def test_battle_positions_leave_out_replay_and_profile(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=2, profile=True)
+        metadata = battle_metadata(outcome)
+        self.assertEqual(battle_positions(metadata), outcome["initial_positions"])
+        self.assertEqual(battle_positions({}), {})
+
+
+class CompactLogTests(MatchupTestMixin, TestCase):
+    def test_compact_log_round_trips(self):
+        for engine, aggregate in (("python", False), ("numpy", False), ("python", True)):
+            with self.subTest(engine=engine, aggregate=aggregate):
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine, aggregate=aggregate, seed=4)
+                positions = outcome["initial_positions"]
+                encoded = json.loads(json.dumps(encode_log(outcome["log"], positions)))
+                self.assertEqual(decode_log(encoded, positions), outcome["log"])
+                self.assertEqual(battle_log(encoded, battle_metadata(outcome)), outcome["log"])
+                self.assertLess(len(json.dumps(encoded)), len(json.dumps(outcome["log"])) / 3)
+        with self.assertRaises(ValueError):
+            decode_log({**encoded, "v": 99}, positions)
+
+    def test_stored_logs_are_compacted_when_lossless(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=6)
+        kept = Battle.objects.create(attacker=self.attacker, defender=self.defender, log=[{"t": 1, "type": "legacy"}])
+        battle = Battle.objects.create(
+            attacker=self.attacker, defender=self.defender, log=outcome["log"], metadata=battle_metadata(outcome)
+        )
+        call_command("compact_battle_logs", stdout=StringIO())
+        battle.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual(battle.log["v"], 1)
+        self.assertEqual(battle_log(battle.log, battle.metadata), outcome["log"])
+        self.assertEqual(kept.log, [{"t": 1, "type": "legacy"}])
+
+    def test_frozen_logs_survive_an_engine_version_bump(self):
+        battles = {}
+        for engine in ("python", "numpy"):
+            outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=6)
+            battles[engine] = (outcome, Battle.objects.create(
+                attacker=self.attacker, defender=self.defender, log=[], metadata=battle_metadata(outcome)
+            ))
+        out = StringIO()
+        call_command("compact_battle_logs", "--freeze", "python", stdout=out)
+        self.assertIn("figés: 1", out.getvalue())
+        bumped = {name: replace(engine, version=engine.version + 1) for name, engine in BATTLE_ENGINES.items()}
+        with mock.patch.dict(BATTLE_ENGINES, bumped):
+            outcome, battle = battles["python"]
+            battle.refresh_from_db()
+            self.assertEqual(battle_log(battle.log, battle.metadata), outcome["log"])
+            # non figé : ne se rejoue plus avec la nouvelle version
+            outcome, battle = battles["numpy"]
+            battle.refresh_from_db()
+            self.assertEqual(battle.log, [])
+            with self.assertRaises(ValueError):
+                battle_log(battle.log, battle.metadata)
+
+
+class BattleProfilingTests(MatchupTestMixin, TestCase):
+    def test_bench_measures_synthetic_armies(self):
+        board = bench_board(200)
+        self.assertGreaterEqual(len(board_for(*board).deployment_columns("attacker")) * board[1], 300)
+        outcome = simulate_battle(
+            synthetic_army("A", 40, "mixed", "formation", "attacker", board),
+            synthetic_army("D", 40, "mixed", "formation", "defender", board),
+            width=board[0], height=board[1], seed=1,
+        )
+        for side in ("attacker", "defender"):
+            columns = board_for(*board).deployment_columns(side)
+            self.assertTrue(all(u["x"] in columns for u in outcome["initial_positions"][side]))
+        result = bench_config(5, "mixed", "random", "python", battles=2)
+        self.assertEqual(result["battles"], 2)
+        self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p95"])
+        self.assertGreater(result["events_per_sec"], 0)
+        self.assertGreater(result["peak_memory_kb"], 0)
+        # échelle guerre : plateau imposé, stacks déployés à plus de FLOW_DEPTH_CAP cases
+        war = bench_config(4, "melee", "formation", "python", battles=1, max_rounds=10, board=(100, 100))
+        self.assertEqual(war["board"], [100, 100])
+        self.assertGreater(war["counters"]["path_steps"], 0)
+
+    def test_profile_times_phases_and_counts_hot_paths(self):
+        for engine in ("python", "numpy"):
+            with self.subTest(engine=engine):
+                reset_process_profile()
+                plain = simulate_battle(self.attacker, self.defender, engine=engine, seed=5, profile=False)
+                outcome = simulate_battle(self.attacker, self.defender, engine=engine, seed=5, profile=True)
+                self.assertNotIn("profile", plain)
+                profile = outcome.pop("profile")
+                self.assertEqual(outcome, plain)  # l'instrumentation ne change rien au combat
+                self.assertEqual(profile["battles"], 1)
+                self.assertEqual(set(profile["timings_ms"]), set(PROFILE_PHASES))
+                self.assertEqual(set(profile["counters"]), set(PROFILE_COUNTERS))
+                timings = profile["timings_ms"]
+                self.assertGreater(timings["movement"], 0)
+                self.assertGreater(timings["attack"], 0)
+                # chaque phase mesurée là où elle travaille : aucune ne déborde du total
+                self.assertLessEqual(sum(v for k, v in timings.items() if k != "total"), timings["total"] + 0.01)
+                self.assertEqual(profile["counters"]["events"], len(outcome["log"]))
+                self.assertGreater(profile["counters"]["path_steps"], 0)
+                attacks = sum(outcome["summary"][side]["total"]["attacks"] for side in ("attacker", "defender"))
+                self.assertGreaterEqual(profile["counters"]["target_searches"], attacks)
+                self.assertEqual(battle_metadata(outcome | {"profile": profile})["profile"], profile)
+                self.assertEqual(process_profile(), profile)
+
+
+class BattleViewTests(MatchupTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # journaux régénérés gardés en cache par id de combat, réutilisé d'un test à l'autre
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def store_battle(self, outcome, log):
+        return Battle.objects.create(
+            attacker=self.attacker, defender=self.defender, rounds=outcome["rounds"], log=log,
+            metadata=battle_metadata(outcome), status=Battle.STATUS_RESOLVED,
+        )
+
+    def test_replay_page_serves_the_stored_log(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=3)
+        encoded = encode_log(outcome["log"], outcome["initial_positions"])
+        for log in (encoded, outcome["log"]):
+            battle = self.store_battle(outcome, log)
+            with self.subTest(compact=isinstance(log, dict)), mock.patch("armies.services.replay_battle") as replay:
+                response = self.client.get(f"/replay/{battle.id}/")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["log"], log)  # ni rejoué ni réencodé
+                replay.assert_not_called()
+                self.assertEqual(response.context["initial_positions"], outcome["initial_positions"])
+
+    def test_replay_page_encodes_a_log_regenerated_from_the_seed(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=3)
+        battle = self.store_battle(outcome, [])
+        with mock.patch("armies.services.decode_log") as decode:
+            response = self.client.get(f"/replay/{battle.id}/")
+        decode.assert_not_called()
+        self.assertEqual(decode_log(response.context["log"], outcome["initial_positions"]), outcome["log"])
+        stale = {**battle.metadata, "replay": {**battle.metadata["replay"], "engine_version": 0}}
+        Battle.objects.filter(id=battle.id).update(metadata=stale)
+        cache.clear()
+        self.assertEqual(self.client.get(f"/replay/{battle.id}/").status_code, 409)
+
+    def test_regenerated_log_is_replayed_once_for_successive_seeks(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=5)
+        battle = self.store_battle(outcome, [])
+        with mock.patch("armies.services.replay_battle", wraps=replay_battle) as replay:
+            seeks = [self.client.get(f"/siege/battles/{battle.id}/", {"t": t}).json() for t in (10, 25, 40)]
+            self.client.get(f"/replay/{battle.id}/")
+        self.assertEqual(replay.call_count, 1)
+        for t, seek in zip((10, 25, 40), seeks):
+            self.assertEqual((seek["keyframe"], seek["log"]), tuple(seek_log(outcome["log"], t).values()))
+
+    def test_battle_detail_seeks_to_the_requested_time(self):
+        outcome = simulate_battle(self.attacker, self.defender, seed=5)
+        battle = self.store_battle(outcome, encode_log(outcome["log"], outcome["initial_positions"]))
+        data = self.client.get(f"/siege/battles/{battle.id}/").json()
+        self.assertEqual(data["log"], outcome["log"])
+        self.assertEqual(data["initial_positions"], outcome["initial_positions"])
+        self.assertNotIn("keyframe", data)
+        seek = self.client.get(f"/siege/battles/{battle.id}/", {"t": 25}).json()
+        self.assertEqual((seek["keyframe"], seek["log"]), tuple(seek_log(outcome["log"], 25).values()))
+        self.assertIsNotNone(seek["keyframe"])
+        self.assertEqual(self.client.get(f"/siege/battles/{battle.id}/", {"t": "fin"}).status_code, 400)
+
+    def challenge(self, path):
+        user = User.objects.create_user("Nord")
+        Commander.objects.filter(id=self.attacker.commander_id).update(user=user)
+        self.client.force_login(user)
+        return self.client.post(path, json.dumps({"defender_id": self.defender.id}), content_type="application/json")
+
+    def test_challenge_settles_the_battle_and_blocks_a_rematch(self):
+        response = self.challenge("/siege/challenges/")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        battle = Battle.objects.get(id=data["battle_id"])
+        self.assertEqual(battle.status, Battle.STATUS_RESOLVED)
+        self.assertEqual(battle_log(battle.log, battle.metadata), data["log"])
+        rematch = self.client.post(
+            "/siege/challenges/", json.dumps({"defender_id": self.defender.id}), content_type="application/json"
+        )
+        self.assertEqual(rematch.status_code, 400)
+
+    def test_stream_settles_the_battle_then_plays_it_lazily(self):
+        played = []
+
+        class TracedStream(BattleStream):
+            def __iter__(self):
+                for events in super().__iter__():
+                    played.append(events)
+                    yield events
+
+        with mock.patch("armies.views.BattleStream", TracedStream):
+            response = self.challenge("/siege/challenges/stream/")
+        self.assertEqual(response.status_code, 200)
+        # flux pas encore lu (client parti) : le combat est déjà réglé, aucun tour rejoué
+        battle = Battle.objects.get()
+        self.assertEqual(battle.status, Battle.STATUS_RESOLVED)
+        self.assertEqual(played, [])
+        rematch = self.client.post(
+            "/siege/challenges/stream/", json.dumps({"defender_id": self.defender.id}), content_type="application/json"
+        )
+        self.assertEqual(rematch.status_code, 400)
+
+        chunks = iter(response.streaming_content)
+        start = json.loads(next(chunks))
+        first_round = next(chunks)
+        self.assertEqual(len(played), 1)  # un tour joué par paquet envoyé
+        lines = [json.loads(line) for line in (first_round + b"".join(chunks)).decode().splitlines()]
+        events, end = lines[:-1], lines[-1]
+        self.assertEqual(start["type"], "start")
+        self.assertEqual(start["initial_positions"], battle_positions(battle.metadata))
+        self.assertEqual(events, battle_log(battle.log, battle.metadata))
+        self.assertEqual((end["type"], end["battle_id"], end["rounds"]), ("end", battle.id, battle.rounds))
+
+    def test_live_replay_page_reads_the_stream(self):
+        user = User.objects.create_user("Nord")
+        self.client.force_login(user)
+        response = self.client.get("/replay/live/", {"defender": self.defender.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["live"])
+        self.assertEqual(response.context["defender_id"], self.defender.id)
+        self.assertContains(response, "/siege/challenges/stream/")
+        self.assertEqual(self.client.get("/replay/live/", {"defender": "x"}).status_code, 400)
+
+
+class EngineValidationTests(MatchupTestMixin, TestCase):
+    def test_engine_registry_and_cross_validation(self):
+        with self.settings(ARMIES_BATTLE_ENGINE="numpy"):
+            # 10 stacks : sous le seuil de numpy, la référence joue ; nommé, numpy joue quand même
+            self.assertEqual(simulate_battle(self.attacker, self.defender, seed=1)["replay"]["engine"], "python")
+            outcome = simulate_battle(self.attacker, self.defender, seed=1, engine="numpy")
+            self.assertEqual(outcome["replay"]["engine"], "numpy")
+            with mock.patch.dict(BATTLE_ENGINES, numpy=replace(BATTLE_ENGINES["numpy"], min_stacks=10)):
+                self.assertEqual(simulate_battle(self.attacker, self.defender, seed=1)["replay"], outcome["replay"])
+        report = cross_validate_engines(self.attacker, self.defender, "numpy", battles=60)
+        self.assertEqual(set(report), {"winner", "rounds", "attacker_remaining", "defender_remaining"})
+
+        # défenseurs trois fois plus forts : l'issue doit changer
+        def biased(attackers, defenders, *args):
+            for stack in defenders:
+                stack.damage_min *= 3
+                stack.damage_max *= 3
+            return BATTLE_ENGINES["python"].rounds(attackers, defenders, *args)
+
+        register_engine("biased", biased)
+        self.addCleanup(BATTLE_ENGINES.pop, "biased")
+        with self.assertRaises(EngineDivergence) as caught:
+            cross_validate_engines(self.attacker, self.defender, "biased", battles=60)
+        self.assertTrue(caught.exception.report["winner"]["diverges"])
+        with self.assertRaises(CommandError):
+            call_command(
+                "cross_validate_engines", "biased", "--armies", self.attacker.id, self.defender.id,
+                "--battles", "30", stdout=StringIO(),
+            )
+
+    def test_registered_engines_match_the_reference(self):
+        for name, engine in BATTLE_ENGINES.items():
+            if name == REFERENCE_ENGINE:
+                continue
+            with self.subTest(engine=name):
+                self.assertTrue(engine.validated)
+                cross_validate_engines(self.attacker, self.defender, name, battles=40)
+
+    def test_default_engine_must_be_validated(self):
+        register_engine("draft", BATTLE_ENGINES[REFERENCE_ENGINE].rounds)
+        self.addCleanup(BATTLE_ENGINES.pop, "draft")
+        for name in ("draft", "missing"):
+            with self.subTest(engine=name), self.settings(ARMIES_BATTLE_ENGINE=name):
+                with self.assertRaises(ValueError):
+                    simulate_battle(self.attacker, self.defender, seed=1)
+        # nommé explicitement, un moteur non validé reste utilisable (mise au point)
+        outcome = simulate_battle(self.attacker, self.defender, seed=1, engine="draft")
+        self.assertEqual(outcome["replay"]["engine"], "draft")
+
+
+class GoldenBattleTests(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        self.golden = load_golden()
+
+    def test_golden_battles_are_unchanged(self):
+        for case in self.golden["cases"]:
+            with self.subTest(case=case["name"]):
+                rounds, outcome = run_golden_case(case, self.golden["matchups"][case["matchup"]])
+                explanation = explain_divergence(case, rounds, outcome)
+                self.assertIsNone(explanation, explanation)
+
+    def test_sample_matchup_comes_from_the_fixture(self):
+        specs = battle_specs(Army.objects.get(pk=1), Army.objects.get(pk=2))
+        matchup = self.golden["matchups"]["sample"]
+        self.assertEqual(json.loads(json.dumps([s.to_dict() for s in specs])), [matchup["attacker"], matchup["defender"]])
+
+    def test_first_divergent_event_is_reported(self):
+        case = self.golden["cases"][0]
+        rounds, outcome = run_golden_case(case, self.golden["matchups"][case["matchup"]])
+        tampered = list(case["expected"]["events"])
+        tampered[1] = "00000000 " + tampered[1].split(" ", 1)[1]
+        explanation = explain_divergence({**case, "expected": {**case["expected"], "events": tampered}}, rounds, outcome)
+        self.assertIn("tour 2, événement 1", explanation)
+        self.assertIn(repr(rounds[1][0]), explanation)
+
+
+class StackStateTests(TestCase):
+    def test_types_are_coded_and_names_live_in_label(self):
+        stack = make_stack(1, 0, 0, attack_type="Magic", armor_type="divine", unit_name="Sorcière", speed=3)
+        self.assertFalse(hasattr(stack, "__dict__"))
+        self.assertEqual(TYPE_MULTIPLIERS[stack.attack_code][stack.armor_code], 0.0)
+        self.assertEqual((stack.unit_name, stack.attack_type, stack.speed), ("Sorcière", "Magic", 3))
+        copy = replace(stack, current_hp=1)
+        self.assertIs(copy.label, stack.label)
+
+    def test_unknown_types_are_neutral(self):
+        stack = make_stack(1, 0, 0, attack_type="laser", armor_type="")
+        self.assertEqual(TYPE_MULTIPLIERS[stack.attack_code][stack.armor_code], 1.0)
+
+
+class AggregationTests(BattleEngineTestMixin, TestCase):
+    def test_adjacent_identical_units_are_pooled(self):
+        stacks = [
+            make_stack(1, 0, 0, unit_name="Grunt"),
+            make_stack(2, 0, 1, unit_name="Grunt"),
+            make_stack(3, 1, 2, unit_name="Grunt"),
+            make_stack(4, 0, 5, unit_name="Grunt"),  # trop loin
+            make_stack(5, 1, 1, unit_name="Grunt", health=50, current_hp=50),
+        ]
+        groups = aggregate_stacks(stacks)
+        self.assertEqual([(g.stack_id, g.count) for g in groups], [(1, 3), (4, 1), (5, 1)])
+        self.assertEqual(groups[0].current_hp, 300)
+        self.assertEqual(groups[0].units, 3)
+
+    def test_group_loses_units_as_pooled_hp_drops(self):
+        group = aggregate_stacks([make_stack(i, i, 0, unit_name="Grunt") for i in range(3)])[0]
+        result = _apply_damage(group, 150)
+        self.assertEqual((result["losses"], group.units), (1, 2))
+        self.assertEqual(result["last_unit_hp"], 50)
+        self.assertFalse(result["killed"])
+        result = _apply_damage(group, 500)
+        self.assertEqual((result["losses"], group.units), (2, 0))
+        self.assertTrue(result["killed"])
+
+    def test_aggregated_battle_counts_units(self):
+        attacker = self.make_army("Nord", [(self.footman, 6)], position_cols=[0, 1])
+        defender = self.make_army("Sud", [(self.archer, 4)], position_cols=[8, 9])
+        outcome = simulate_battle(attacker, defender, engine="python", aggregate=True)
+        self.assertEqual([u["count"] for u in outcome["initial_positions"]["attacker"]], [6])
+        self.assertEqual([u["count"] for u in outcome["initial_positions"]["defender"]], [4])
+        statuses = [ev for ev in outcome["log"] if ev["type"] == "status"]
+        self.assertEqual(statuses[-1]["attacker_alive"], outcome["attacker_remaining"])
+        self.assertLessEqual(outcome["attacker_remaining"], 6)
+        with self.assertRaises(ValueError):
+            simulate_battle(attacker, defender, engine="numpy", aggregate=True)
+
+
+class DamageMultiplierTests(TestCase):
+    def test_matrix_combines_type_and_armor_and_is_cached(self):
+        attackers = [
+            make_stack(1, 0, 0, attack_type="piercing"),
+            make_stack(2, 0, 1, attack_type="magic"),
+            make_stack(5, 0, 2, attack_type="piercing"),
+        ]
+        defenders = [make_stack(3, 9, 0, armor_type="light", defense=5), make_stack(4, 9, 1, armor_type="divine")]
+        matrix = damage_multiplier_matrix(attackers, defenders)
+        self.assertAlmostEqual(matrix[0][0], 2.0 * (1 - 0.3 / 1.3))
+        self.assertEqual(matrix[1][1], 0.0)
+        self.assertIs(matrix[2], matrix[0])  # même type d'attaque, même ligne
+        # le cache ne garde que les types et profils d'armure distincts, pas la matrice par stack
+        table = _multiplier_table.cache_info()
+        again = damage_multiplier_matrix([replace(s) for s in attackers], [replace(s) for s in defenders])
+        self.assertEqual(again, matrix)
+        self.assertEqual(_multiplier_table.cache_info().hits, table.hits + 1)
+
+
+class VectorizedAttackTests(TestCase):
+    def make_battle(self):
+        """Sans aléa (dégâts fixes, ni critique ni esquive) : les deux moteurs doivent jouer le même combat."""
+        attackers = [
+            make_stack(1, 0, 0, range=9, attack_speed=2.0, damage_min=35, damage_max=35),
+            make_stack(2, 0, 1, range=9, attack_speed=1.5, damage_min=20, damage_max=20, target_policy=1),
+            make_stack(3, 0, 2, range=9, damage_min=30, damage_max=30, aoe_radius=1),
+            make_stack(4, 0, 3, range=9, attack_speed=2.0, damage_min=15, damage_max=15, target_policy=3),
+            make_stack(5, 1, 4, range=9, damage_min=25, damage_max=25, target_policy=2, attack_type="piercing"),
+        ]
+        defenders = [
+            make_stack(10 + i, 6 + i % 2, i, current_hp=hp, health=100, range=1, armor_type=armor)
+            for i, (hp, armor) in enumerate([(30, "light"), (100, "heavy"), (55, "unarmored"), (12, "medium"), (80, "light")])
+        ]
+        return attackers, defenders
+
+    def test_waves_resolve_attacks_in_roster_order(self):
+        reference = _run_battle(*self.make_battle(), max_rounds=20, rng=random.Random(0))
+        vectorized = run_vectorized_battle(*self.make_battle(), max_rounds=20, rng=np.random.default_rng(0))
+        self.assertEqual(vectorized["log"], reference["log"])
+        self.assertEqual(vectorized["summary"], reference["summary"])
+        # pas de coups perdus : une fois la cible morte, les attaques suivantes en changent
+        first = [ev for ev in reference["log"] if ev["type"] == "attack" and ev["t"] == 1]
+        self.assertTrue(any(target["killed"] for ev in first for target in ev["targets"]))
+
+
+class BattleBatchTests(BattleEngineTestMixin, TestCase):
+    def test_batch_counts_add_up(self):
+        strong = self.make_army("Fort", [(self.footman, 6), (self.archer, 3)])
+        weak = self.make_army("Faible", [(self.footman, 1)], position_cols=[9])
+        result = simulate_battle_batch([(strong, weak), (weak, strong)], copies=20, summaries=True)
+        self.assertEqual(result["battles"], 40)
+        self.assertEqual(result["wins"]["attacker"] + result["wins"]["defender"] + result["draws"], 40)
+        self.assertEqual(sum(result["rounds"]["histogram"].values()), 40)
+        self.assertEqual(len(result["summaries"]), 40)
+        first, second = result["summaries"][:20], result["summaries"][20:]
+        self.assertTrue(all(s["matchup"] == 0 and s["winner"] == "attacker" for s in first))
+        self.assertTrue(all(s["matchup"] == 1 and s["winner"] == "defender" for s in second))
+        self.assertNotIn("log", result["summaries"][0])
+
+    def test_batch_without_summaries(self):
+        army = self.make_army("Seul", [(self.archer, 2)])
+        other = self.make_army("Autre", [(self.archer, 2)], position_cols=[8])
+        result = simulate_battle_batch([(army, other)], copies=5)
+        self.assertNotIn("summaries", result)
+        self.assertEqual(result["battles"], 5)
+
+    def test_batch_is_reproducible_from_its_seed(self):
+        army = self.make_army("Seul", [(self.footman, 3), (self.archer, 2)])
+        other = self.make_army("Autre", [(self.footman, 3), (self.mortar, 1)])
+        result = simulate_battle_batch([(army, other)], copies=10, summaries=True)
+        again = simulate_battle_batch([(army, other)], copies=10, summaries=True, seed=result["seed"])
+        self.assertEqual(again, result)
+
+
+class SpatialIndexTests(TestCase):
+    def setUp(self):
+        # Plusieurs stacks par case pour vérifier le départage par ordre du roster.
+        self.stacks = [make_stack(i, 9 - (i % 3), i % 10) for i in range(12)]
+        self.index = SpatialIndex(self.stacks)
+
+    def brute_nearest(self, origin, max_distance=None):
+        best = None
+        for stack in self.stacks:
+            if not stack.alive:
+                continue
+            dist = max(abs(stack.position_x - origin[0]), abs(stack.position_y - origin[1]))
+            if max_distance is not None and dist > max_distance:
+                continue
+            if best is None or dist < best[0]:
+                best = (dist, stack)
+        return best[1] if best else None
+
+    def test_nearest_matches_roster_order_tie_break(self):
+        for origin in [(0, 0), (0, 5), (5, 5), (9, 9)]:
+            for max_distance in (None, 1, 4):
+                with self.subTest(origin=origin, max_distance=max_distance):
+                    self.assertIs(self.index.nearest(origin, max_distance), self.brute_nearest(origin, max_distance))
+
+    def test_within_follows_roster_order_and_tracks_moves_and_deaths(self):
+        origin = (8, 4)
+        expected = [s for s in self.stacks if max(abs(s.position_x - 8), abs(s.position_y - 4)) <= 1]
+        self.assertEqual(self.index.within(origin, 1), expected)
+
+        mover = expected[0]
+        self.index.move(mover, (mover.position_x, mover.position_y), (0, 0))
+        mover.position_x, mover.position_y = 0, 0
+        self.assertNotIn(mover, self.index.within(origin, 1))
+        self.assertIs(self.index.nearest((0, 1)), mover)
+
+        self.index.discard(mover, (0, 0))
+        mover.alive = False
+        self.assertIsNot(self.index.nearest((0, 1)), mover)
+        self.assertEqual(len(self.index), len(self.stacks) - 1)
+        self.assertFalse(self.index.any_within((0, 1), 3))
+        self.assertTrue(self.index.any_within((0, 1), 7))
+
+
+def cell(x, y):
+    return y * GRID_SIZE + x
+
+
+def bit(x, y):
+    return 1 << cell(x, y)
+
+
+class TargetingPolicyTests(TestCase):
+    def setUp(self):
+        self.archer = make_stack(0, 0, 0, range=3)
+        self.enemies = [
+            make_stack(1, 1, 0, current_hp=90),
+            make_stack(2, 3, 0, current_hp=40, damage_min=30, damage_max=30),
+            make_stack(3, 2, 1, current_hp=40),
+            make_stack(4, 8, 0, current_hp=5),  # hors de portée
+        ]
+        self.index = SpatialIndex(self.enemies)
+
+    def choose(self, policy):
+        return _choose_target(self.archer, self.index, TARGET_POLICIES.index(policy))
+
+    def test_policies_pick_among_targets_in_range(self):
+        self.assertIs(self.choose("nearest"), self.enemies[0])
+        # PV égaux : premier du roster ; la cible la plus faible (4) est hors de portée
+        self.assertIs(self.choose("lowest_hp"), self.enemies[1])
+        self.assertIs(self.choose("highest_threat"), self.enemies[1])
+
+    def test_heap_follows_damage_and_deaths(self):
+        self.assertIs(self.choose("lowest_hp"), self.enemies[1])
+        self.enemies[2].current_hp = 10
+        self.index.damaged(self.enemies[2])
+        self.assertIs(self.choose("lowest_hp"), self.enemies[2])
+        occ = Occupancy()
+        multipliers = [1.0] * len(self.enemies)
+        policy = TARGET_POLICIES.index("lowest_hp")
+        for _ in range(2):
+            _perform_attack(self.archer, multipliers, self.index, occ, [], 1, "attacker", policy)
+        self.assertFalse(self.enemies[2].alive)
+        self.assertIs(self.choose("lowest_hp"), self.enemies[1])
+
+    def test_focus_fire_keeps_the_designated_target(self):
+        self.assertIs(self.choose("focus_fire"), self.enemies[0])
+        other = make_stack(9, 2, 0, range=3)
+        self.assertIs(_choose_target(other, self.index, TARGET_POLICIES.index("focus_fire")), self.enemies[0])
+
+
+class BitboardTests(TestCase):
+    def test_dilation_does_not_wrap_across_rows(self):
+        self.assertEqual(DEFAULT_BOARD.dilate(bit(9, 4)), bit(8, 3) | bit(9, 3) | bit(8, 4) | bit(9, 4) | bit(8, 5) | bit(9, 5))
+        self.assertEqual(DEFAULT_BOARD.dilate(bit(0, 0)), bit(0, 0) | bit(1, 0) | bit(0, 1) | bit(1, 1))
+        self.assertEqual(DEFAULT_BOARD.dilate(bit(5, 5)), DEFAULT_BOARD.range_mask(cell(5, 5), 1))
+
+    def test_range_masks_match_chebyshev_distance_on_any_board(self):
+        board = board_for(13, 7)
+        for origin in (0, 20, board.cells - 1):
+            ox, oy = board.coords[origin]
+            for radius in range(4):
+                expected = sum(
+                    1 << c for c, (x, y) in enumerate(board.coords) if max(abs(x - ox), abs(y - oy)) <= radius
+                )
+                self.assertEqual(board.range_mask(origin, radius), expected)
+        self.assertEqual(board.deployment_columns("attacker"), [0, 1])
+        self.assertEqual(board_for(100, 100).deployment_columns("defender"), list(range(80, 100)))
+
+    def test_random_place_fills_free_cells_of_the_zone(self):
+        stacks = [make_stack(i, None, None) for i in range(GRID_SIZE * 2 + 1)]
+        stacks[0].position_x, stacks[0].position_y = 0, 0
+        _random_place(stacks, [0, 1])
+        placed = [(s.position_x, s.position_y) for s in stacks if s.position_x is not None]
+        self.assertEqual(len(placed), GRID_SIZE * 2)
+        self.assertEqual(len(set(placed)), GRID_SIZE * 2)
+        self.assertTrue(all(x in (0, 1) for x, _ in placed))
+
+
+class FlowFieldTests(TestCase):
+    def test_distances_lead_to_cells_next_to_enemies(self):
+        field = FlowField()
+        occ = Occupancy(bit(5, 5) | bit(0, 5))
+        field.build(bit(5, 5), occ)
+        self.assertEqual(field.dist[cell(4, 5)], 0)
+        self.assertEqual(field.dist[cell(2, 5)], 2)
+        # la case alliée est étiquetée (le stack connaît sa distance) sans être traversée
+        self.assertEqual(field.dist[cell(0, 5)], 4)
+        self.assertEqual(field.dist[cell(5, 5)], FlowField.BLOCKED)
+        self.assertEqual(field.next_step(cell(0, 5), occ), cell(1, 4))
+
+    def test_large_board_field_covers_the_whole_board(self):
+        board = board_for(100, 20)
+        field = FlowField(board)
+        wall = sum(1 << (y * 100 + 50) for y in range(19))
+        occ = Occupancy(wall | 1)
+        field.build(1 << 99, occ)
+        # contournement du mur par la case (50, 19) : bien au-delà de FLOW_DEPTH_CAP
+        self.assertGreater(field.dist[0], FLOW_DEPTH_CAP)
+        self.assertLess(field.dist[0], FlowField.UNREACHABLE)
+        self.assertEqual(field.dist[field.next_step(0, occ)], field.dist[0] - 1)
+
+    def test_ally_wall_blocks_until_a_cell_is_vacated(self):
+        field = FlowField()
+        occ = Occupancy(DEFAULT_BOARD.column_masks[5] | bit(9, 5) | bit(0, 5))
+        field.build(bit(9, 5), occ)
+        self.assertEqual(field.dist[cell(5, 5)], 3)
+        self.assertEqual(field.dist[cell(4, 5)], FlowField.UNREACHABLE)
+        self.assertIsNone(field.next_step(cell(0, 5), occ))
+
+        # un allié du mur s'en va : la distance se propage depuis sa case
+        occ.discard(cell(5, 5))
+        field.vacate(cell(5, 5), occ)
+        self.assertEqual(field.dist[cell(4, 5)], 4)
+        self.assertEqual(field.dist[cell(0, 5)], 8)
+        self.assertEqual(field.next_step(cell(0, 5), occ), cell(1, 4))
@@ -12,6 +12,7 @@ urlpatterns = [
     path("armies/<int:army_id>/purchase-upgrade/", views.purchase_upgrade),
     path("armies/<int:army_id>/place-unit/", views.place_unit),
     path("challenges/", views.create_challenge),
+    path("challenges/stream/", views.stream_challenge),
     path("armies/<int:army_id>/placement/", views.placement_data),
     path("armies/<int:army_id>/attack-presets/", views.attack_presets),
     path("battles/<int:battle_id>/", views.battle_detail),
@@ -0,0 +1,116 @@
+"""
+Validation croisée des moteurs de combat (`services.BATTLE_ENGINES`).
+
+Deux moteurs ne tirent pas leurs aléas de la même façon : on ne compare
+pas les combats un à un mais la distribution des issues sur N combats
+semés (mêmes graines, donc mêmes déploiements des deux côtés).
+"""
+
+import bisect
+import math
+from typing import Dict, List, Sequence, Union
+
+from .models import Army
+from .services import LOG_NONE, REFERENCE_ENGINE, ArmySpec, battle_specs, simulate_battle
+
+# Mesures comparées : vainqueur (catégoriel), durée et survivants (numériques).
+METRICS = ("winner", "rounds", "attacker_remaining", "defender_remaining")
+
+
+class EngineDivergence(AssertionError):
+    """Un moteur s'écarte de la référence ; `report` détaille chaque mesure."""
+
+    def __init__(self, message: str, report: Dict):
+        super().__init__(message)
+        self.report = report
+
+
+def _chi2_sf(x: float, df: int) -> float:
+    # trois issues au plus (attaquant, défenseur, nul) : df vaut 1 ou 2
+    if df == 1:
+        return math.erfc(math.sqrt(x / 2))
+    return math.exp(-x / 2)
+
+
+def _chi_square_pvalue(a: Sequence, b: Sequence) -> float:
+    """Test d'homogénéité du χ² entre deux échantillons catégoriels."""
+    categories = set(a) | set(b)
+    if len(categories) < 2:
+        return 1.0
+    stat = 0.0
+    for category in categories:
+        total = a.count(category) + b.count(category)
+        for sample in (a, b):
+            expected = total * len(sample) / (len(a) + len(b))
+            stat += (sample.count(category) - expected) ** 2 / expected
+    return _chi2_sf(stat, len(categories) - 1)
+
+
+def _ks_pvalue(a: Sequence[float], b: Sequence[float]) -> float:
+    """Test de Kolmogorov-Smirnov à deux échantillons (loi asymptotique)."""
+    a, b = sorted(a), sorted(b)
+    d = max(
+        abs(bisect.bisect_right(a, x) / len(a) - bisect.bisect_right(b, x) / len(b)) for x in set(a) | set(b)
+    )
+    ne = len(a) * len(b) / (len(a) + len(b))
+    lam = (math.sqrt(ne) + 0.12 + 0.11 / math.sqrt(ne)) * d
+    if lam < 0.3:  # la série converge mal ; Q(0.3) vaut 1 à 1e-9 près
+        return 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return min(1.0, max(0.0, p))
+
+
+def _describe(metric: str, values: List) -> Dict:
+    if metric == "winner":
+        return {str(key): values.count(key) / len(values) for key in ("attacker", "defender", None)}
+    return {"mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+
+
+def _engine_samples(engine: str, attacker: ArmySpec, defender: ArmySpec, battles: int, seed: int, options: Dict):
+    samples: Dict[str, List] = {metric: [] for metric in METRICS}
+    for idx in range(battles):
+        outcome = simulate_battle(attacker, defender, engine=engine, seed=seed + idx, verbosity=LOG_NONE, **options)
+        for metric in METRICS:
+            samples[metric].append(outcome[metric])
+    return samples
+
+
+def cross_validate_engines(
+    attacker: Union[Army, ArmySpec],
+    defender: Union[Army, ArmySpec],
+    engine: str,
+    reference: str = REFERENCE_ENGINE,
+    battles: int = 200,
+    seed: int = 0,
+    alpha: float = 0.001,
+    **options,
+) -> Dict:
+    """
+    Joue `battles` combats semés (graines `seed`, `seed + 1`, …) sur `engine`
+    et sur `reference`, puis compare les distributions de `METRICS` : χ² pour
+    le vainqueur, Kolmogorov-Smirnov pour les durées et les survivants.
+
+    `alpha` est le risque global (corrigé de Bonferroni sur les mesures).
+    Lève `EngineDivergence` si une mesure diverge ; sinon rend le rapport
+    (par mesure : résumé des deux moteurs et p-valeur). `options` est passé
+    tel quel à `simulate_battle` (max_rounds, targeting, width, height…).
+    """
+    attacker, defender = battle_specs(attacker, defender)
+    expected = _engine_samples(reference, attacker, defender, battles, seed, options)
+    observed = _engine_samples(engine, attacker, defender, battles, seed, options)
+    threshold = alpha / len(METRICS)
+    report = {}
+    for metric in METRICS:
+        test = _chi_square_pvalue if metric == "winner" else _ks_pvalue
+        p_value = test(expected[metric], observed[metric])
+        report[metric] = {
+            "reference": _describe(metric, expected[metric]),
+            "candidate": _describe(metric, observed[metric]),
+            "p_value": p_value,
+            "diverges": p_value < threshold,
+        }
+    diverging = [metric for metric in METRICS if report[metric]["diverges"]]
+    if diverging:
+        details = ", ".join(f"{metric} (p={report[metric]['p_value']:.2g})" for metric in diverging)
+        raise EngineDivergence(f"Le moteur {engine} diverge de {reference} sur {battles} combats : {details}", report)
+    return report
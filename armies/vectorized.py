@@ -0,0 +1,895 @@
+"""
+Moteur de combat vectorisé (NumPy).
+
+L'état des stacks est stocké en tableaux (struct-of-arrays) plutôt qu'en
+objets : PV, positions, plages de dégâts, crit/esquive et types
+d'attaque/armure codés en entiers. Le ciblage, les jets de dégâts et les
+morts sont calculés par opérations sur tableaux ; le champ de distances
+du déplacement (`services.FlowField`) est partagé par camp et par phase.
+
+Les règles sont celles de `services._run_battle` (mêmes phases, même ordre
+des stacks, même ciblage « plus proche d'abord »), mais les tirages
+aléatoires viennent d'un `numpy.random.Generator` : les résultats sont
+statistiquement équivalents, pas identiques tirage pour tirage.
+
+Chaque phase d'attaque paie un coût fixe en opérations NumPy : le moteur
+ne devance le moteur "python" que sur les grosses armées (de l'ordre de
+150 stacks par camp et au-delà, cf. `manage.py bench_battle`) ; en deçà,
+un combat sans moteur explicite est joué par la référence (`min_stacks`
+de son enregistrement).
+"""
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .services import (
+    DEFAULT_BOARD,
+    END_NO_DAMAGE,
+    END_STALEMATE,
+    KEYFRAME_INTERVAL,
+    LOG_FULL,
+    STAT_FIELDS,
+    Board,
+    BattleProfile,
+    FlowField,
+    Occupancy,
+    StackState,
+    TYPE_MULTIPLIERS,
+    _ATTACKS,
+    _CRITS,
+    _DEALT,
+    _DODGES,
+    _FOCUS_FIRE,
+    _HIGHEST_THREAT,
+    _KILLS,
+    _LOWEST_HP,
+    _NEAREST,
+    _POLICY_CODES,
+    _TAKEN,
+    _armor_multiplier,
+    _battle_summary,
+    _battle_winner,
+    _collect_log,
+    _end_reason,
+    _log_flags,
+)
+
+
+SIDES = ("attacker", "defender")
+_FAR = np.iinfo(np.int64).max
+
+# Codes d'attaque/armure de `StackState` ; dernière ligne/colonne = type inconnu.
+_TYPE_MULTIPLIERS = np.array(TYPE_MULTIPLIERS, dtype=np.float64)
+
+
+# Même ordre que services._neighbors : départage des égalités identique.
+NEIGHBOR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+_DX = np.array([dx for dx, _ in NEIGHBOR_OFFSETS], dtype=np.int64)
+_DY = np.array([dy for _, dy in NEIGHBOR_OFFSETS], dtype=np.int64)
+
+
+def _dilate(cells: np.ndarray) -> np.ndarray:
+    """Étend chaque case vraie à ses 8 voisines (grilles (K, H, W)), en deux passes séparables."""
+    rows = cells.copy()
+    rows[:, :, 1:] |= cells[:, :, :-1]
+    rows[:, :, :-1] |= cells[:, :, 1:]
+    grown = rows.copy()
+    grown[:, 1:, :] |= rows[:, :-1, :]
+    grown[:, :-1, :] |= rows[:, 1:, :]
+    return grown
+
+
+def _around(grid: np.ndarray, sx: np.ndarray, sy: np.ndarray, fill) -> np.ndarray:
+    """Valeurs des 8 voisines de (sx, sy) dans chaque grille, forme (K, 8)."""
+    k, height, width = grid.shape
+    padded = np.full((k, height + 2, width + 2), fill, dtype=grid.dtype)
+    padded[:, 1:-1, 1:-1] = grid
+    return padded[np.arange(k)[:, None], sy[:, None] + 1 + _DY, sx[:, None] + 1 + _DX]
+
+
+def _flow_fields(enemies: np.ndarray, occ: np.ndarray) -> np.ndarray:
+    """
+    Équivalent tableau de `services.FlowField.build` pour K grilles.
+
+    Distance de chaque case à la case adjacente à un ennemi la plus proche,
+    en contournant les ennemis ; les cases occupées reçoivent une distance
+    sans la propager. `FlowField.UNREACHABLE` pour les cases hors d'atteinte.
+    Les cases libérées en cours de phase ne repropagent pas (approximation
+    propre au noyau batch).
+    """
+    far = FlowField.UNREACHABLE
+    free = ~occ
+    passable = ~enemies
+    reached = _dilate(enemies) & passable
+    dist = np.where(reached, 0, far)
+    frontier = reached & free
+    for d in range(1, far):
+        labelled = _dilate(frontier) & passable & ~reached
+        if not labelled.any():
+            break
+        dist[labelled] = d
+        reached |= labelled
+        frontier = labelled & free
+    return dist
+
+
+class StackArrays:
+    """État d'un combat : une entrée par stack, attaquants puis défenseurs."""
+
+    def __init__(
+        self, attacker_stacks: List[StackState], defender_stacks: List[StackState], board: Board = DEFAULT_BOARD
+    ):
+        stacks = list(attacker_stacks) + list(defender_stacks)
+        n = len(stacks)
+        self.board = board
+        self.n_attackers = len(attacker_stacks)
+        self.side = np.array([0] * len(attacker_stacks) + [1] * len(defender_stacks), dtype=np.int8)
+        self.stack_id = [s.stack_id for s in stacks]
+        self.unit_name = [s.unit_name for s in stacks]
+        self.hp = np.array([s.current_hp for s in stacks], dtype=np.float64)
+        self.x = np.array([-1 if s.position_x is None else s.position_x for s in stacks], dtype=np.int64)
+        self.y = np.array([-1 if s.position_y is None else s.position_y for s in stacks], dtype=np.int64)
+        self.alive = np.array([s.alive for s in stacks], dtype=bool)
+        self.placed = (self.x >= 0) & (self.y >= 0)
+        self.damage_min = np.array([s.damage_min for s in stacks], dtype=np.float64)
+        self.damage_max = np.array([s.damage_max for s in stacks], dtype=np.float64)
+        self.crit_chance = np.array([s.crit_chance for s in stacks], dtype=np.float64)
+        self.crit_multiplier = np.array([s.crit_multiplier for s in stacks], dtype=np.float64)
+        self.dodge_chance = np.array([s.dodge_chance for s in stacks], dtype=np.float64)
+        self.attack_code = np.array([s.attack_code for s in stacks], dtype=np.int64)
+        self.armor_code = np.array([s.armor_code for s in stacks], dtype=np.int64)
+        self.armor_factor = np.array([_armor_multiplier(s.defense) for s in stacks], dtype=np.float64)
+        # Multiplicateurs attaquant × cible précalculés depuis les codes (zéro entre alliés).
+        na = self.n_attackers
+        self.multipliers = _TYPE_MULTIPLIERS[np.ix_(self.attack_code, self.armor_code)] * self.armor_factor
+        self.multipliers[:na, :na] = 0.0
+        self.multipliers[na:, na:] = 0.0
+        self.range = np.array([s.range for s in stacks], dtype=np.int64)
+        self.aoe_radius = np.array([s.aoe_radius for s in stacks], dtype=np.int64)
+        self.attack_speed = np.array([s.attack_speed for s in stacks], dtype=np.float64)
+        self.move_speed = np.array([s.move_speed for s in stacks], dtype=np.float64)
+        self.attack_meter = np.array([s.attack_meter for s in stacks], dtype=np.float64)
+        # Ciblage : code de politique (-1 = défaut du combat), menace, cible désignée par camp (indice, -1 = aucune).
+        self.policy = np.array([-1 if s.target_policy is None else s.target_policy for s in stacks], dtype=np.int64)
+        self.threat = np.array([s.threat for s in stacks], dtype=np.float64)
+        self.focus = [-1, -1]
+        self.indices = np.arange(n)
+        # Tenus à jour à chaque mort / déplacement (cf. services._run_battle).
+        self.alive_total = [int(self.alive[: self.n_attackers].sum()), int(self.alive[self.n_attackers :].sum())]
+        self.occ = self.occupancy()
+        # Compteurs `services.STAT_FIELDS`, une ligne par stack.
+        self.stats = np.zeros((n, len(STAT_FIELDS)), dtype=np.float64)
+
+    def summary(self) -> Dict:
+        """Équivalent de `services.BattleStats.summary` (pas de groupes : une unité par stack)."""
+        return _battle_summary(
+            (SIDES[side], name, 1, int(alive), [dealt, taken, *map(int, counts)])
+            for side, name, alive, (dealt, taken, *counts) in zip(
+                self.side.tolist(), self.unit_name, self.alive.tolist(), self.stats.tolist()
+            )
+        )
+
+    def side_indices(self, side: int) -> np.ndarray:
+        if side == 0:
+            return self.indices[: self.n_attackers]
+        return self.indices[self.n_attackers :]
+
+    def side_slice(self, side: int) -> slice:
+        if side == 0:
+            return slice(0, self.n_attackers)
+        return slice(self.n_attackers, len(self.side))
+
+    def active(self) -> np.ndarray:
+        return self.alive & self.placed
+
+    def alive_count(self, side: int) -> int:
+        return self.alive_total[side]
+
+    def cell_bits(self, rows: np.ndarray) -> int:
+        """Bitboard (cf. `services.Occupancy`) des cases des stacks `rows`."""
+        bits = 0
+        for cell in (self.y[rows] * self.board.width + self.x[rows]).tolist():
+            bits |= 1 << cell
+        return bits
+
+    def occupancy(self) -> Occupancy:
+        return Occupancy(self.cell_bits(np.flatnonzero(self.active())))
+
+    def distances(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Distances de Chebyshev entre les stacks `rows` et `cols`."""
+        dx = np.abs(self.x[rows][:, None] - self.x[cols][None, :])
+        dy = np.abs(self.y[rows][:, None] - self.y[cols][None, :])
+        return np.maximum(dx, dy)
+
+
+def _nearest_enemy_distance(state: StackArrays, i: int, foes: np.ndarray) -> Optional[int]:
+    candidates = foes[state.active()[foes]]
+    if candidates.size == 0:
+        return None
+    dist = np.maximum(np.abs(state.x[candidates] - state.x[i]), np.abs(state.y[candidates] - state.y[i]))
+    return int(dist.min())
+
+
+def _next_cell(state: StackArrays, cell: int, foes: np.ndarray, field: FlowField, occ: Occupancy) -> Optional[int]:
+    """Comme `services._next_cell` : pente du champ, sinon ligne droite hors du champ tronqué."""
+    step = field.next_step(cell, occ)
+    if step is None and field.truncated and field.dist[cell] >= FlowField.UNREACHABLE:
+        x, y = state.board.coords[cell]
+        live = foes[state.active()[foes]]
+        near = live[np.argmin(np.maximum(np.abs(state.x[live] - x), np.abs(state.y[live] - y)))]
+        step = field.approach(cell, (int(state.x[near]), int(state.y[near])), occ)
+    return step
+
+
+def _movement_phase(
+    state: StackArrays,
+    side: int,
+    field: FlowField,
+    occ: Occupancy,
+    events: Optional[List[Dict]],
+    t: int,
+    rng: np.random.Generator,
+) -> int:
+    """
+    Déplacements d'un camp ; renvoie le nombre de pas faits. Les ennemis ne
+    bougent pas pendant notre phase : portée testée sur leur bitboard, cases
+    des stacks tenues en entiers et recopiées dans les tableaux à la fin.
+    """
+    moved = 0
+    board = state.board
+    movers = state.side_indices(side)
+    foes = state.side_indices(1 - side)
+    steps = np.floor(state.move_speed[movers]).astype(np.int64)
+    extra = rng.random(movers.size) < (state.move_speed[movers] - steps)
+    steps = steps + extra
+    foe_bits = state.cell_bits(foes[state.active()[foes]])
+    field.build(foe_bits, occ)
+    if not foe_bits:
+        return 0
+    active = state.active()[movers]
+    cells = np.where(active, state.y[movers] * board.width + state.x[movers], -1).tolist()
+    label = SIDES[side]
+    for row, (i, count, reach) in enumerate(zip(movers.tolist(), steps.tolist(), state.range[movers].tolist())):
+        cell = cells[row]
+        if cell < 0:
+            continue
+        for _ in range(count):
+            if foe_bits & board.range_mask(cell, reach):
+                break  # déjà à portée
+            step = _next_cell(state, cell, foes, field, occ)
+            if step is None:
+                # l'état n'a pas changé : les pas suivants échoueraient aussi
+                break
+            occ.discard(cell)
+            occ.add(step)
+            field.vacate(cell, occ)
+            moved += 1
+            if events is not None:
+                (x, y), (nx, ny) = board.coords[cell], board.coords[step]
+                events.append(
+                    {
+                        "t": t,
+                        "type": "move",
+                        "unit_id": state.stack_id[i],
+                        "unit_name": state.unit_name[i],
+                        "side": label,
+                        "from": {"x": x, "y": y},
+                        "to": {"x": nx, "y": ny},
+                    }
+                )
+            cell = step
+        cells[row] = cell
+    cells = np.array(cells)
+    state.x[movers] = np.where(active, cells % board.width, state.x[movers])
+    state.y[movers] = np.where(active, cells // board.width, state.y[movers])
+    return moved
+
+
+def _attack_phase(
+    state: StackArrays,
+    side: int,
+    events: Optional[List[Dict]],
+    t: int,
+    rng: np.random.Generator,
+    profile: Optional[BattleProfile] = None,
+) -> int:
+    """
+    Attaques d'un camp ; renvoie le nombre d'attaques portées.
+
+    Une ligne par attaque (stacks dans l'ordre du roster, répétés autant de
+    fois qu'ils frappent), jets tirés d'un coup pour toute la phase, puis
+    résolution par vagues (`_attack_wave`) : même résultat qu'attaque par
+    attaque, en autant de vagues que de morts.
+    """
+    attackers = state.side_slice(side)
+    foes = state.side_slice(1 - side)
+    ready = state.active()[attackers]
+    meters = np.minimum(4.0, state.attack_meter[attackers] + state.attack_speed[attackers])
+    counts = np.where(ready, np.floor(meters), 0).astype(np.int64)
+    state.attack_meter[attackers] = np.where(ready, meters - counts, state.attack_meter[attackers])
+    if not counts.any():
+        return 0
+    phase = AttackRows(state, np.repeat(state.indices[attackers], counts), state.indices[foes], rng)
+    if profile is not None:
+        profile.counters["target_searches"] += int(counts.sum()) - phase.rows.size
+    rows = phase.rows
+    if not rows.size:
+        return 0
+    start = 0
+    while start < rows.size and phase.live.any():
+        start += _attack_wave(state, side, phase, start, events, t, profile)
+
+    aimed = phase.aimed
+    stats = state.stats
+    stats[:, _ATTACKS] += np.bincount(rows, weights=aimed, minlength=len(stats))
+    stats[:, _CRITS] += np.bincount(rows, weights=aimed & phase.crit, minlength=len(stats))
+    stats[:, _DEALT] += np.bincount(rows, weights=phase.dealt, minlength=len(stats))
+    stats[:, _KILLS] += np.bincount(rows, weights=phase.kills, minlength=len(stats))
+    stats[phase.foes, _TAKEN] += phase.taken
+    stats[phase.foes, _DODGES] += phase.dodges
+    return int(aimed.sum())
+
+
+class AttackRows:
+    """
+    Attaques d'une phase, une ligne par attaque, colonnes = ennemis vivants.
+    Les positions ne bougent pas pendant la phase d'attaque : portées, zones
+    et jets sont calculés une fois, et les attaques sans ennemi à portée
+    écartées d'emblée (les morts n'en rapprochent aucun). Les cumuls des
+    vagues alimentent les stats.
+    """
+
+    def __init__(self, state: StackArrays, rows: np.ndarray, foes: np.ndarray, rng: np.random.Generator):
+        foes = foes[state.active()[foes]]
+        dist = np.maximum(np.abs(state.x[rows][:, None] - state.x[foes]), np.abs(state.y[rows][:, None] - state.y[foes]))
+        in_range = dist <= state.range[rows][:, None]
+        keep = in_range.any(axis=1)
+        rows, dist, in_range = rows[keep], dist[keep], in_range[keep]
+        self.rows = rows
+        if not rows.size:
+            return
+        rolls = rng.random((rows.size, 2 + foes.size))
+        self.foes = foes
+        self.dist = dist
+        self.in_range = in_range
+        self.policy = state.policy[rows]
+        self.radius = state.aoe_radius[rows]
+        self.crit = rolls[:, 1] < state.crit_chance[rows]
+        roll = state.damage_min[rows] + (state.damage_max[rows] - state.damage_min[rows]) * rolls[:, 0]
+        roll = np.where(self.crit, roll * state.crit_multiplier[rows], roll)
+        self.damage = np.maximum(0.0, roll[:, None] * state.multipliers[rows[:, None], foes])
+        self.dodge = rolls[:, 2:] < state.dodge_chance[foes]
+        self.between_foes = state.distances(foes, foes) if self.radius.any() else None
+        self.live = np.ones(foes.size, dtype=bool)
+        self.special = bool((self.policy != _NEAREST).any())
+        self.aimed = np.zeros(rows.size, dtype=bool)
+        self.dealt = np.zeros(rows.size)
+        self.kills = np.zeros(rows.size)
+        self.taken = np.zeros(foes.size)
+        self.dodges = np.zeros(foes.size)
+
+
+def _pick_targets(state: StackArrays, phase: AttackRows, start: int, reachable: np.ndarray) -> np.ndarray:
+    """Colonne (dans les ennemis) de la cible de chaque attaque, -1 sans cible ; cf. `services._choose_target`."""
+    target = np.argmin(np.where(reachable, phase.dist[start:], _FAR), axis=1)
+    if phase.special:
+        policy = phase.policy[start:]
+        for code, key in ((_LOWEST_HP, state.hp[phase.foes]), (_HIGHEST_THREAT, -state.threat[phase.foes])):
+            chosen = policy == code
+            if chosen.any():
+                target[chosen] = np.argmin(np.where(reachable[chosen], key, np.inf), axis=1)
+    return np.where(reachable.any(axis=1), target, -1)
+
+
+def _attack_wave(
+    state: StackArrays,
+    side: int,
+    phase: AttackRows,
+    start: int,
+    events: Optional[List[Dict]],
+    t: int,
+    profile: Optional[BattleProfile] = None,
+) -> int:
+    """
+    Résout d'un bloc les attaques `phase.rows[start:]` sur l'état courant
+    (cibles, zone, dégâts cumulés par ennemi), jusqu'à la première qui
+    change la donne pour les suivantes : une mort (incluse), une nouvelle
+    cible commune focus_fire (incluse), une attaque lowest_hp dont la cible
+    a changé avec les coups précédents (exclue). Renvoie le nombre
+    d'attaques résolues.
+    """
+    foes, live = phase.foes, phase.live
+    reachable = phase.in_range[start:] & live
+    target = _pick_targets(state, phase, start, reachable)
+    aimed = target >= 0
+    cut = target.size
+
+    refocus = None
+    if phase.special:
+        policy = phase.policy[start:]
+        focused = np.flatnonzero((policy == _FOCUS_FIRE) & aimed)
+        if focused.size:
+            focus = np.flatnonzero(foes == state.focus[side])
+            focus = int(focus[0]) if focus.size else -1
+            keeps = reachable[focused, focus] if focus >= 0 else np.zeros(focused.size, dtype=bool)
+            target[focused[keeps]] = focus
+            if not keeps.all():
+                refocus = int(focused[~keeps][0])
+                cut = refocus + 1
+
+    # touchés : la cible, plus les ennemis vivants dans la zone
+    aimed_rows = np.flatnonzero(aimed)
+    hit = np.zeros(reachable.shape, dtype=bool)
+    hit[aimed_rows, target[aimed_rows]] = True
+    splashing = aimed_rows[phase.radius[start:][aimed_rows] > 0]
+    if splashing.size:
+        radius = phase.radius[start:][splashing]
+        hit[splashing] |= (phase.between_foes[target[splashing]] <= radius[:, None]) & live
+    dodged = hit & phase.dodge[start:]
+    dealt = np.where(hit & ~dodged, phase.damage[start:], 0.0)
+    left = state.hp[foes] - (np.cumsum(dealt, axis=0) - dealt)  # PV de chaque ennemi avant chaque attaque
+
+    if phase.special:
+        lowest = np.flatnonzero((policy == _LOWEST_HP) & aimed)
+        if lowest.size:
+            current = np.argmin(np.where(reachable[lowest], left[lowest], np.inf), axis=1)
+            stale = lowest[current != target[lowest]]
+            if stale.size:
+                cut = min(cut, int(stale[0]))
+    killing = np.flatnonzero(((dealt > 0) & (left <= dealt)).any(axis=1))
+    if killing.size:
+        cut = min(cut, int(killing[0]) + 1)
+    if refocus is not None and cut > refocus:
+        state.focus[side] = int(foes[target[refocus]])
+
+    target, aimed, hit, dodged, dealt, left = target[:cut], aimed[:cut], hit[:cut], dodged[:cut], dealt[:cut], left[:cut]
+    taken = np.minimum(left, dealt)
+    after = left - taken
+    killed = (dealt > 0) & (after <= 0)
+    state.hp[foes] = after[-1]
+    done = slice(start, start + cut)
+    phase.aimed[done] = aimed
+    phase.dealt[done] = taken.sum(axis=1)
+    phase.taken += taken.sum(axis=0)
+    phase.dodges += dodged.sum(axis=0)
+    dead = np.flatnonzero(killed[-1])  # une mort ne peut être que la dernière attaque de la vague
+    if dead.size:
+        phase.kills[start + cut - 1] = dead.size
+        live[dead] = False
+        dead = foes[dead]
+        state.alive_total[1 - side] -= int(dead.size)
+        state.occ.discard_bits(state.cell_bits(dead))
+        state.alive[dead] = False
+        state.placed[dead] = False
+        state.x[dead] = -1
+        state.y[dead] = -1
+    if profile is not None:
+        profile.counters["target_searches"] += cut
+        profile.counters["aoe_candidates"] += int(hit[phase.radius[done] > 0].sum())
+    if events is not None:
+        _attack_events(state, side, phase, done, target, hit, dodged, dealt, after, killed, events, t)
+    return cut
+
+
+def _attack_events(state, side, phase, done, target, hit, dodged, dealt, after, killed, events, t):
+    """Événements `attack` d'une vague, comme `services._perform_attack` : la cible d'abord, puis la zone."""
+    foes = phase.foes.tolist()
+    hit_rows, hit_cols = np.nonzero(hit)
+    impacted: Dict[int, List[Tuple]] = {}
+    for r, *touched in zip(
+        hit_rows.tolist(),
+        hit_cols.tolist(),
+        dodged[hit_rows, hit_cols].tolist(),
+        dealt[hit_rows, hit_cols].tolist(),
+        after[hit_rows, hit_cols].tolist(),
+        killed[hit_rows, hit_cols].tolist(),
+    ):
+        impacted.setdefault(r, []).append(touched)
+    label = SIDES[side]
+    for r, (i, col, is_crit) in enumerate(zip(phase.rows[done].tolist(), target.tolist(), phase.crit[done].tolist())):
+        if col < 0:
+            continue
+        events.append(
+            {
+                "t": t,
+                "type": "attack",
+                "attacker": state.unit_name[i],
+                "attacker_id": state.stack_id[i],
+                "attacker_side": label,
+                "targets": [
+                    {
+                        "defender": state.unit_name[foes[c]],
+                        "defender_id": state.stack_id[foes[c]],
+                        "killed": death,
+                        "remaining": not death,
+                        "last_unit_hp": round(hp, 2),
+                        "crit": False if dodge else is_crit,
+                        "dodge": dodge,
+                        "dmg": round(dmg, 2),
+                    }
+                    # la cible d'abord, puis la zone dans l'ordre du roster
+                    for c, dodge, dmg, hp, death in sorted(impacted[r], key=lambda touched: touched[0] != col)
+                ],
+                "crit": is_crit,
+            }
+        )
+
+
+def _keyframe(state: StackArrays, t: int) -> Dict:
+    """Équivalent tableau de `services._keyframe`."""
+    active = state.active()
+    frame = {"t": t, "type": "keyframe"}
+    for side, label in enumerate(SIDES):
+        own = state.side_indices(side)
+        frame[label] = [
+            {"id": state.stack_id[i], "x": int(state.x[i]), "y": int(state.y[i]), "hp": round(float(state.hp[i]), 2)}
+            for i in own[active[own]].tolist()
+        ]
+    return frame
+
+
+def _can_hurt(state: StackArrays, side: int) -> bool:
+    """Équivalent tableau de `services._can_hurt`."""
+    active = state.active()
+    own = state.side_indices(side)
+    foes = state.side_indices(1 - side)
+    own = own[active[own] & (state.attack_speed[own] > 0) & (state.damage_max[own] > 0)]
+    foes = foes[active[foes]]
+    return bool((state.multipliers[np.ix_(own, foes)] > 0).any())
+
+
+def _stalled(state: StackArrays) -> bool:
+    """Équivalent tableau de `services._battle_stalled`."""
+    field = FlowField(state.board)
+    active = state.active()
+    for side in (0, 1):
+        own = state.side_indices(side)
+        foes = state.side_indices(1 - side)
+        field.build(state.cell_bits(foes[active[foes]]), state.occ)
+        for i in own[active[own]].tolist():
+            gap = _nearest_enemy_distance(state, i, foes)
+            if gap is not None and gap <= state.range[i]:
+                if state.attack_speed[i] > 0:
+                    return False
+                continue
+            cell = state.board.index((int(state.x[i]), int(state.y[i])))
+            if state.move_speed[i] > 0 and field.next_step(cell, state.occ) is not None:
+                return False
+            if state.move_speed[i] > 0 and field.truncated and field.dist[cell] >= FlowField.UNREACHABLE:
+                return False  # pourrait encore approcher en ligne droite
+    return True
+
+
+def run_vectorized_battle(
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    max_rounds: int = 60,
+    rng: Optional[np.random.Generator] = None,
+    board: Board = DEFAULT_BOARD,
+    targeting: str = "nearest",
+    verbosity: str = LOG_FULL,
+) -> Dict:
+    """Équivalent vectorisé de `services._run_battle` (même forme de résultat)."""
+    return _collect_log(
+        vectorized_battle_rounds(attacker_stacks, defender_stacks, max_rounds, rng, board, targeting, verbosity)
+    )
+
+
+def vectorized_battle_rounds(
+    attacker_stacks: List[StackState],
+    defender_stacks: List[StackState],
+    max_rounds: int = 60,
+    rng: Optional[np.random.Generator] = None,
+    board: Board = DEFAULT_BOARD,
+    targeting: str = "nearest",
+    verbosity: str = LOG_FULL,
+    profile: Optional[BattleProfile] = None,
+) -> Iterator[List[Dict]]:
+    """Événements tour par tour, comme `services._battle_rounds` (`profile` compris)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    state = StackArrays(attacker_stacks, defender_stacks, board)
+    state.policy[state.policy < 0] = _POLICY_CODES[targeting]
+    log_moves, log_attacks, log_status = _log_flags(verbosity)
+    field = FlowField(board, profile)
+    timings = profile.timings if profile is not None else None
+    events: List[Dict] = []
+    decided = None
+    last_t = 0
+    if state.alive_count(0) and state.alive_count(1) and not (_can_hurt(state, 0) or _can_hurt(state, 1)):
+        decided = END_NO_DAMAGE
+        if log_status:
+            events.append(
+                {
+                    "t": 0,
+                    "type": "status",
+                    "attacker_alive": state.alive_count(0),
+                    "defender_alive": state.alive_count(1),
+                }
+            )
+    for t in range(1, max_rounds + 1):
+        if decided:
+            break
+        last_t = t
+        if state.alive_count(0) == 0 or state.alive_count(1) == 0:
+            break
+        if events:
+            yield events
+            events = []
+        survivors = state.alive_count(0) + state.alive_count(1)
+        moves = events if log_moves else None
+        hits = events if log_attacks else None
+        if timings is not None:
+            clock = time.perf_counter()
+        acted = _movement_phase(state, 0, field, state.occ, moves, t, rng)
+        acted += _movement_phase(state, 1, field, state.occ, moves, t, rng)
+        if timings is not None:
+            clock, started = time.perf_counter(), clock
+            timings["movement"] += clock - started
+        acted += _attack_phase(state, 0, hits, t, rng, profile)
+        acted += _attack_phase(state, 1, hits, t, rng, profile)
+        if timings is not None:
+            clock, started = time.perf_counter(), clock
+            timings["attack"] += clock - started
+        if log_moves and t % KEYFRAME_INTERVAL == 0:
+            events.append(_keyframe(state, t))
+        if log_status:
+            events.append(
+                {
+                    "t": t,
+                    "type": "status",
+                    "attacker_alive": state.alive_count(0),
+                    "defender_alive": state.alive_count(1),
+                }
+            )
+        if timings is not None:
+            timings["logging"] += time.perf_counter() - clock
+        if state.alive_count(0) == 0 or state.alive_count(1) == 0:
+            continue
+        if state.alive_count(0) + state.alive_count(1) < survivors and not (_can_hurt(state, 0) or _can_hurt(state, 1)):
+            decided = END_NO_DAMAGE
+        elif not acted and _stalled(state):
+            decided = END_STALEMATE
+
+    if events:
+        yield events
+    atk_alive = state.alive_count(0)
+    def_alive = state.alive_count(1)
+    return {
+        "winner": _battle_winner(atk_alive, def_alive),
+        "rounds": last_t,
+        "attacker_remaining": atk_alive,
+        "defender_remaining": def_alive,
+        "end_reason": _end_reason(atk_alive, def_alive, decided),
+        "summary": state.summary(),
+    }
+
+
+# --- Noyau multi-combats (Monte Carlo) ---------------------------------------
+
+_STACK_FIELDS = (
+    "hp",
+    "x",
+    "y",
+    "alive",
+    "placed",
+    "damage_min",
+    "damage_max",
+    "crit_chance",
+    "crit_multiplier",
+    "dodge_chance",
+    "attack_code",
+    "armor_code",
+    "armor_factor",
+    "range",
+    "aoe_radius",
+    "attack_speed",
+    "move_speed",
+    "attack_meter",
+)
+_PADDING = {"x": -1, "y": -1, "alive": False, "placed": False, "armor_factor": 1.0}
+
+
+class BatchArrays:
+    """
+    État de K combats indépendants, dimension (K, N).
+
+    Les colonnes `[0, n_attackers)` sont les attaquants, les suivantes les
+    défenseurs ; les combats plus petits sont complétés par des stacks morts.
+    """
+
+    def __init__(self, stack_pairs: List[Tuple[List[StackState], List[StackState]]], board: Board = DEFAULT_BOARD):
+        self.board = board
+        self.k = len(stack_pairs)
+        self.n_attackers = max((len(a) for a, _ in stack_pairs), default=0)
+        n_defenders = max((len(d) for _, d in stack_pairs), default=0)
+        self.n = self.n_attackers + n_defenders
+        rows = [StackArrays(a, d, board) for a, d in stack_pairs]
+        for name in _STACK_FIELDS:
+            sample = getattr(rows[0], name) if rows else np.zeros(0)
+            batch = np.full((self.k, self.n), _PADDING.get(name, 0), dtype=sample.dtype)
+            for b, (row, (atk, _)) in enumerate(zip(rows, stack_pairs)):
+                values = getattr(row, name)
+                batch[b, : len(atk)] = values[: len(atk)]
+                batch[b, self.n_attackers : self.n_attackers + len(values) - len(atk)] = values[len(atk) :]
+            setattr(self, name, batch)
+        self.batch = np.arange(self.k)
+
+    def columns(self, side: int) -> range:
+        if side == 0:
+            return range(0, self.n_attackers)
+        return range(self.n_attackers, self.n)
+
+    def active(self) -> np.ndarray:
+        return self.alive & self.placed
+
+    def alive_count(self, side: int) -> np.ndarray:
+        cols = self.columns(side)
+        return self.alive[:, cols.start : cols.stop].sum(axis=1)
+
+    def occupancy(self) -> np.ndarray:
+        occ = np.zeros((self.k, self.board.height, self.board.width), dtype=bool)
+        kk, cols = np.nonzero(self.active())
+        occ[kk, self.y[kk, cols], self.x[kk, cols]] = True
+        return occ
+
+    def distances_from(self, col: int, cols: range) -> np.ndarray:
+        dx = np.abs(self.x[:, cols.start : cols.stop] - self.x[:, col : col + 1])
+        dy = np.abs(self.y[:, cols.start : cols.stop] - self.y[:, col : col + 1])
+        return np.maximum(dx, dy)
+
+
+def _batch_movement(state: BatchArrays, side: int, occ: np.ndarray, running: np.ndarray, rng: np.random.Generator):
+    foes = state.columns(1 - side)
+    fs = slice(foes.start, foes.stop)
+    rows = state.batch
+    enemies = np.zeros_like(occ)
+    kk, cols = np.nonzero(state.active()[:, fs])
+    enemies[kk, state.y[:, fs][kk, cols], state.x[:, fs][kk, cols]] = True
+    field = _flow_fields(enemies, occ)
+    for col in state.columns(side):
+        movers = running & state.active()[:, col]
+        if not movers.any():
+            continue
+        speed = state.move_speed[:, col]
+        steps = np.floor(speed).astype(np.int64)
+        steps += rng.random(state.k) < (speed - steps)
+        for step in range(int(steps[movers].max())):
+            movers &= steps > step
+            dist = np.where(state.active()[:, fs], state.distances_from(col, foes), _FAR)
+            gap = dist.min(axis=1) if dist.size else np.full(state.k, _FAR)
+            movers &= (gap != _FAR) & (gap > state.range[:, col])
+            if not movers.any():
+                break
+            sx = state.x[:, col].copy()
+            sy = state.y[:, col].copy()
+            here = field[rows, sy, sx]
+            around = _around(field, sx, sy, FlowField.UNREACHABLE)
+            around = np.where(_around(occ, sx, sy, True) | (around >= here[:, None]), FlowField.UNREACHABLE, around)
+            best = np.argmin(around, axis=1)
+            ok = movers & (around[rows, best] < FlowField.UNREACHABLE)
+            nx, ny = sx + _DX[best], sy + _DY[best]
+            moved = rows[ok]
+            occ[moved, sy[ok], sx[ok]] = False
+            occ[moved, ny[ok], nx[ok]] = True
+            state.x[moved, col] = nx[ok]
+            state.y[moved, col] = ny[ok]
+            # un déplacement impossible le reste tant que l'état ne change pas
+            movers &= ok
+
+
+def _batch_attacks(state: BatchArrays, side: int, running: np.ndarray, rng: np.random.Generator):
+    own = state.columns(side)
+    foes = state.columns(1 - side)
+    ss = slice(own.start, own.stop)
+    fs = slice(foes.start, foes.stop)
+    rows = state.batch
+    ready = running[:, None] & state.active()[:, ss]
+    meters = np.minimum(4.0, state.attack_meter[:, ss] + state.attack_speed[:, ss])
+    counts = np.where(ready, np.floor(meters), 0).astype(np.int64)
+    state.attack_meter[:, ss] = np.where(ready, meters - counts, state.attack_meter[:, ss])
+    if not counts.any():
+        return
+    # Positions figées pendant la phase d'attaque : distances calculées une fois.
+    to_foes = np.maximum(
+        np.abs(state.x[:, ss, None] - state.x[:, None, fs]), np.abs(state.y[:, ss, None] - state.y[:, None, fs])
+    )
+    between_foes = np.maximum(
+        np.abs(state.x[:, fs, None] - state.x[:, None, fs]), np.abs(state.y[:, fs, None] - state.y[:, None, fs])
+    )
+    armor_codes = state.armor_code[:, fs]
+    armor_factor = state.armor_factor[:, fs]
+    for j, col in enumerate(own):
+        for attempt in range(int(counts[:, j].max())):
+            foe_active = state.active()[:, fs]
+            in_reach = foe_active & (to_foes[:, j] <= state.range[:, col, None])
+            act = (counts[:, j] > attempt) & in_reach.any(axis=1)
+            if not act.any():
+                break
+            target = np.argmin(np.where(in_reach, to_foes[:, j], _FAR), axis=1)
+            hit = np.zeros_like(in_reach)
+            hit[rows, target] = True
+            aoe = state.aoe_radius[:, col]
+            if (aoe[act] > 0).any():
+                hit |= foe_active & (aoe[:, None] > 0) & (between_foes[rows, target] <= aoe[:, None])
+            hit &= act[:, None]
+
+            rolls = rng.random((state.k, 2))
+            dmg_roll = state.damage_min[:, col] + (state.damage_max[:, col] - state.damage_min[:, col]) * rolls[:, 0]
+            dmg_roll = np.where(rolls[:, 1] < state.crit_chance[:, col], dmg_roll * state.crit_multiplier[:, col], dmg_roll)
+            dodged = rng.random(hit.shape) < state.dodge_chance[:, fs]
+            mult = _TYPE_MULTIPLIERS[state.attack_code[:, col, None], armor_codes] * armor_factor
+            dmg = np.maximum(0.0, dmg_roll[:, None] * mult)
+            landed = hit & ~dodged
+            hp = np.where(landed, np.maximum(0.0, state.hp[:, fs] - dmg), state.hp[:, fs])
+            state.hp[:, fs] = hp
+            killed = landed & (hp <= 0)
+            if killed.any():
+                state.alive[:, fs] &= ~killed
+                state.placed[:, fs] &= ~killed
+                state.x[:, fs][killed] = -1
+                state.y[:, fs][killed] = -1
+
+
+def run_battle_batch(
+    stack_pairs: List[Tuple[List[StackState], List[StackState]]],
+    max_rounds: int = 60,
+    rng: Optional[np.random.Generator] = None,
+    summaries: bool = False,
+    board: Board = DEFAULT_BOARD,
+) -> Dict:
+    """
+    Simule K combats d'un coup, sans construire de journal d'événements.
+
+    `stack_pairs` contient un couple (attaquants, défenseurs) déjà placés par
+    combat. Renvoie les victoires/égalités, la distribution des rounds et,
+    si `summaries`, un résumé par combat (mêmes clés que `simulate_battle`,
+    sans `log` ni agrégats `summary`).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    state = BatchArrays(stack_pairs, board)
+    rounds = np.zeros(state.k, dtype=np.int64)
+    finished = np.zeros(state.k, dtype=bool)
+    for t in range(1, max_rounds + 1):
+        running = ~finished
+        rounds[running] = t
+        finished |= running & ((state.alive_count(0) == 0) | (state.alive_count(1) == 0))
+        running = ~finished
+        if not running.any():
+            break
+        occ = state.occupancy()
+        _batch_movement(state, 0, occ, running, rng)
+        _batch_movement(state, 1, occ, running, rng)
+        _batch_attacks(state, 0, running, rng)
+        _batch_attacks(state, 1, running, rng)
+
+    atk_alive = state.alive_count(0)
+    def_alive = state.alive_count(1)
+    draws = (atk_alive <= 0) & (def_alive <= 0)
+    attacker_wins = ~draws & ((def_alive <= 0) | ((atk_alive > 0) & (atk_alive > def_alive)))
+    values, occurrences = np.unique(rounds, return_counts=True)
+    result = {
+        "battles": state.k,
+        "wins": {
+            "attacker": int(attacker_wins.sum()),
+            "defender": int((~draws & ~attacker_wins).sum()),
+        },
+        "draws": int(draws.sum()),
+        "rounds": {
+            "mean": float(rounds.mean()) if state.k else 0.0,
+            "min": int(rounds.min()) if state.k else 0,
+            "max": int(rounds.max()) if state.k else 0,
+            "histogram": {int(v): int(c) for v, c in zip(values, occurrences)},
+        },
+    }
+    if summaries:
+        result["summaries"] = [
+            {
+                "winner": _battle_winner(int(a), int(d)),
+                "rounds": int(r),
+                "attacker_remaining": int(a),
+                "defender_remaining": int(d),
+            }
+            for a, d, r in zip(atk_alive, def_alive, rounds)
+        ]
+    return result
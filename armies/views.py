@@ -3,7 +3,8 @@ import math
 from datetime import timedelta
 from typing import Any, Dict, Optional
 
-from django.http import HttpRequest, JsonResponse
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.db.models import Q, Exists, OuterRef
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
@@ -21,7 +22,22 @@ from .models import (
     Upgrade,
     Faction,
 )
-from .services import army_value, army_population, simulate_battle, upgrade_purchase_cost
+from .services import (
+    DEFAULT_BOARD,
+    LOG_NONE,
+    BattleStream,
+    Board,
+    army_population,
+    army_value,
+    battle_log,
+    battle_metadata,
+    battle_positions,
+    battle_specs,
+    compact_battle_log,
+    seek_log,
+    simulate_battle,
+    upgrade_purchase_cost,
+)
 
 
 def _json_body(request) -> Dict[str, Any]:
@@ -392,16 +408,16 @@ def place_unit(request, army_id: int):
     return JsonResponse({"army": _army_payload(army)})
 
 
-@csrf_exempt
-def create_challenge(request):
+def _challenge_armies(request):
+    """Valide une demande de combat : (attaquant, défenseur, None) ou (None, None, réponse d'erreur)."""
     if request.method != "POST":
-        return JsonResponse({"error": "Méthode non supportée"}, status=405)
+        return None, None, JsonResponse({"error": "Méthode non supportée"}, status=405)
 
     if not request.user.is_authenticated:
-        return JsonResponse({"error": "Authentification requise"}, status=401)
+        return None, None, JsonResponse({"error": "Authentification requise"}, status=401)
     commander = _commander_for_user(request.user)
     if not commander:
-        return JsonResponse({"error": "Commander manquant"}, status=400)
+        return None, None, JsonResponse({"error": "Commander manquant"}, status=400)
     attacker, _ = _ensure_default_army(commander, request.user)
     data = _json_body(request)
     attacker_input = data.get("attacker_id")
@@ -409,20 +425,26 @@ def create_challenge(request):
         try:
             attacker_id = int(attacker_input)
         except (TypeError, ValueError):
-            return JsonResponse({"error": "Identifiant d'armée invalide"}, status=400)
+            return None, None, JsonResponse({"error": "Identifiant d'armée invalide"}, status=400)
         if attacker_id != attacker.id:
-            return JsonResponse({"error": "Une seule armée est autorisée, nommée comme votre compte."}, status=400)
+            return None, None, JsonResponse(
+                {"error": "Une seule armée est autorisée, nommée comme votre compte."}, status=400
+            )
     defender_id = data.get("defender_id")
     if not defender_id:
-        return JsonResponse({"error": "defender_id requis"}, status=400)
+        return None, None, JsonResponse({"error": "defender_id requis"}, status=400)
     defender = get_object_or_404(Army, id=defender_id)
     if attacker.id == defender.id:
-        return JsonResponse({"error": "Choisir deux armées distinctes"}, status=400)
+        return None, None, JsonResponse({"error": "Choisir deux armées distinctes"}, status=400)
     if _has_recent_battle(attacker, defender):
-        return JsonResponse({"error": "Vous avez déjà attaqué cette armée il y a moins d'une heure."}, status=400)
+        return None, None, JsonResponse(
+            {"error": "Vous avez déjà attaqué cette armée il y a moins d'une heure."}, status=400
+        )
+    return attacker, defender, None
 
-    battle = Battle.objects.create(attacker=attacker, defender=defender)
-    outcome = simulate_battle(attacker, defender)
+
+def _settle_battle(battle: Battle, attacker: Army, defender: Army, outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """Enregistre l'issue d'un combat (récompenses, Elo) et renvoie le résumé envoyé au client."""
     winner_field = outcome["winner"]
     winner_army = attacker if winner_field == "attacker" else defender if winner_field == "defender" else None
 
@@ -438,11 +460,14 @@ def create_challenge(request):
         loser_reward = round(defender_value * 0.1)
     battle.winner = winner_army
     battle.rounds = outcome["rounds"]
-    battle.log = outcome["log"]
+    # journal régénéré à la demande depuis la graine (battle_log) ; figé par
+    # compact_battle_logs --freeze avant tout changement de version du moteur
+    battle.log = []
     battle.status = Battle.STATUS_RESOLVED
     battle.resolved_at = timezone.now()
     battle.reward = winner_reward
-    battle.metadata = outcome.get("initial_positions", {})
+    battle.metadata = battle_metadata(outcome)
+    battle.summary = outcome["summary"]
     battle.save()
     _apply_elo(attacker, defender, winner_army)
 
@@ -454,18 +479,63 @@ def create_challenge(request):
         loser_commander.gold += loser_reward
         loser_commander.save(update_fields=["gold"])
 
-    return JsonResponse(
-        {
-            "battle_id": battle.id,
-            "winner": winner_field,
-            "winner_reward": winner_reward if winner_army else 0,
-            "loser_reward": loser_reward if winner_army else 0,
-            "rounds": outcome["rounds"],
-            "log": outcome["log"],
-            "attacker_remaining": outcome["attacker_remaining"],
-            "defender_remaining": outcome["defender_remaining"],
-        }
-    )
+    return {
+        "battle_id": battle.id,
+        "winner": winner_field,
+        "winner_reward": winner_reward if winner_army else 0,
+        "loser_reward": loser_reward if winner_army else 0,
+        "rounds": outcome["rounds"],
+        "attacker_remaining": outcome["attacker_remaining"],
+        "defender_remaining": outcome["defender_remaining"],
+        "end_reason": outcome["end_reason"],
+    }
+
+
+@csrf_exempt
+def create_challenge(request):
+    attacker, defender, error = _challenge_armies(request)
+    if error:
+        return error
+
+    battle = Battle.objects.create(attacker=attacker, defender=defender)
+    outcome = simulate_battle(attacker, defender)
+    return JsonResponse({**_settle_battle(battle, attacker, defender, outcome), "log": outcome["log"]})
+
+
+def _ndjson(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload) + "\n"
+
+
+@csrf_exempt
+def stream_challenge(request):
+    """
+    Comme `create_challenge`, mais la réponse est du JSON délimité par des
+    retours à la ligne, envoyé tour par tour pendant la simulation : une
+    ligne `start` (positions initiales), les événements du journal, puis une
+    ligne `end` avec le résumé de `create_challenge` (sans le journal).
+
+    Le combat est d'abord joué sans journal et réglé avant la réponse : un
+    flux abandonné ne laisse pas de combat `pending`, que `_has_recent_battle`
+    ignorerait. Le flux le rejoue ensuite à l'identique (mêmes specs, même
+    graine), sans garder le journal en mémoire.
+    """
+    attacker, defender, error = _challenge_armies(request)
+    if error:
+        return error
+
+    battle = Battle.objects.create(attacker=attacker, defender=defender)
+    specs = battle_specs(attacker, defender)
+    outcome = simulate_battle(*specs, verbosity=LOG_NONE)
+    summary = _settle_battle(battle, attacker, defender, outcome)
+    stream = BattleStream(*specs, engine=outcome["replay"]["engine"], seed=outcome["replay"]["seed"], profile=False)
+
+    def lines():
+        yield _ndjson({"type": "start", "battle_id": battle.id, "initial_positions": stream.initial_positions})
+        for events in stream:
+            yield "".join(_ndjson(event) for event in events)
+        yield _ndjson({"type": "end", **summary})
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
 
 
 def placement_page(request: HttpRequest):
@@ -502,18 +572,20 @@ def placement_page(request: HttpRequest):
 )
 
 
-def _validate_positions(positions, mode: str):
+def _validate_positions(positions, mode: str, board: Board = DEFAULT_BOARD):
+    zones = {"defense": board.deployment_columns("defender"), "attack": board.deployment_columns("attacker")}
     for pos in positions:
         x = pos.get("x")
         y = pos.get("y")
         if x is None or y is None:
             raise ValueError("x et y requis")
-        if not (0 <= int(x) < 10 and 0 <= int(y) < 10):
+        if board.index((int(x), int(y))) is None:
             raise ValueError("Coordonnées hors grille")
-        if mode == "defense" and int(x) not in (8, 9):
-            raise ValueError("Défense limitée aux colonnes 8 et 9")
-        if mode == "attack" and int(x) not in (0, 1):
-            raise ValueError("Attaque limitée aux colonnes 0 et 1")
+        columns = zones.get(mode)
+        if columns and int(x) not in columns:
+            label = "Défense" if mode == "defense" else "Attaque"
+            span = f"{columns[0]} et {columns[-1]}" if len(columns) == 2 else f"{columns[0]} à {columns[-1]}"
+            raise ValueError(f"{label} limitée aux colonnes {span}")
 
 
 def _positions_for_army_units(army: Army, preset: AttackPreset | None = None):
@@ -632,25 +704,58 @@ def attack_presets(request, army_id: int):
     return JsonResponse({"error": "Méthode non supportée"}, status=405)
 
 
+# Journaux régénérés depuis la graine gardés en cache (forme compacte) : un
+# combat n'est rejoué qu'une fois pour une série de `battle_detail?t=`.
+BATTLE_LOG_CACHE_SECONDS = 60 * 60
+
+
+def _stored_battle_log(battle: Battle):
+    """Journal enregistré d'un combat, sinon régénéré (compact) une fois puis lu dans le cache."""
+    if battle.log:
+        return battle.log
+    key = f"armies:battle-log:{battle.id}"
+    log = cache.get(key)
+    if log is None:
+        log = compact_battle_log(battle.log, battle.metadata)
+        cache.set(key, log, BATTLE_LOG_CACHE_SECONDS)
+    return log
+
+
 def battle_detail(request, battle_id: int):
+    """Détail d'un combat ; avec `?t=`, seulement l'image clé la plus proche et les événements jusqu'à `t`."""
     battle = get_object_or_404(Battle.objects.select_related("attacker", "defender", "winner"), id=battle_id)
-    return JsonResponse(
-        {
-            "id": battle.id,
-            "attacker": battle.attacker.name,
-            "defender": battle.defender.name,
-            "winner": battle.winner.name if battle.winner else None,
-            "reward": battle.reward,
-            "rounds": battle.rounds,
-            "log": battle.log,
-            "initial_positions": battle.metadata,
-            "created_at": battle.created_at,
-        }
-    )
+    try:
+        log = battle_log(_stored_battle_log(battle), battle.metadata)
+    except ValueError as exc:  # moteur modifié sans --freeze : le combat ne se rejoue plus
+        return JsonResponse({"error": str(exc)}, status=409)
+    payload = {
+        "id": battle.id,
+        "attacker": battle.attacker.name,
+        "defender": battle.defender.name,
+        "winner": battle.winner.name if battle.winner else None,
+        "reward": battle.reward,
+        "rounds": battle.rounds,
+        "log": log,
+        "initial_positions": battle_positions(battle.metadata),
+        "summary": battle.summary,
+        "created_at": battle.created_at,
+    }
+    if "t" in request.GET:
+        try:
+            t = float(request.GET["t"])
+        except ValueError:
+            return JsonResponse({"error": "t invalide"}, status=400)
+        payload.update(seek_log(payload["log"], t))
+    return JsonResponse(payload)
 
 
 def replay_page(request: HttpRequest, battle_id: int):
     battle = get_object_or_404(Battle.objects.select_related("attacker", "defender", "winner"), id=battle_id)
+    try:
+        # décodé côté navigateur (decodeLog) s'il est compact
+        log = _stored_battle_log(battle)
+    except ValueError as exc:  # moteur modifié sans --freeze : le combat ne se rejoue plus
+        return HttpResponse(str(exc), status=409, content_type="text/plain; charset=utf-8")
     return render(
         request,
         "armies/replay.html",
@@ -661,8 +766,32 @@ def replay_page(request: HttpRequest, battle_id: int):
             "winner": battle.winner.name if battle.winner else None,
             "reward": battle.reward,
             "rounds": battle.rounds,
-            "log": battle.log,
-            "initial_positions": battle.metadata,
+            "log": log,
+            "initial_positions": battle_positions(battle.metadata),
+        },
+    )
+
+
+@login_required
+def live_replay_page(request: HttpRequest):
+    """Replay d'un défi joué en direct : la page lance `stream_challenge` et anime les tours à leur arrivée."""
+    try:
+        defender_id = int(request.GET.get("defender", ""))
+    except ValueError:
+        return HttpResponse("Armée à défier invalide", status=400, content_type="text/plain; charset=utf-8")
+    defender = get_object_or_404(Army, id=defender_id)
+    commander = _commander_for_user(request.user)
+    return render(
+        request,
+        "armies/replay.html",
+        {
+            "live": True,
+            "defender_id": defender.id,
+            "attacker": _default_army_name(request.user, commander),
+            "defender": defender.name,
+            "rounds": 0,
+            "log": [],
+            "initial_positions": {},
         },
     )
 
@@ -749,7 +878,8 @@ def home(request: HttpRequest):
                                 message = "Vous avez déjà attaqué cette armée il y a moins d'une heure."
                             else:
                                 battle = Battle.objects.create(attacker=default_army, defender=defender)
-                                outcome = simulate_battle(default_army, defender)
+                                # journal régénéré à la demande : inutile de le construire ici
+                                outcome = simulate_battle(default_army, defender, verbosity=LOG_NONE)
                                 winner_field = outcome["winner"]
                                 winner_army = (
                                     default_army
@@ -771,10 +901,12 @@ def home(request: HttpRequest):
 
                                 battle.winner = winner_army
                                 battle.rounds = outcome["rounds"]
-                                battle.log = outcome["log"]
+                                battle.log = []
                                 battle.status = Battle.STATUS_RESOLVED
                                 battle.resolved_at = timezone.now()
                                 battle.reward = winner_reward
+                                battle.metadata = battle_metadata(outcome)
+                                battle.summary = outcome["summary"]
                                 battle.save()
 
                                 if winner_reward and winner_army:
@@ -886,7 +1018,7 @@ def home(request: HttpRequest):
         recent_battles = (
             Battle.objects.filter(attacker__commander=current_commander)
             | Battle.objects.filter(defender__commander=current_commander)
-        ).select_related("attacker", "defender", "winner")[:10]
+        ).select_related("attacker", "defender", "winner").defer("log", "metadata")[:10]
 
     unit_qs = UnitType.objects.all()
     if commander_ready:
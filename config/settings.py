@@ -136,6 +136,11 @@ STATIC_ROOT = BASE_DIR / 'static_collected'
 # Base URL utilisée lors de la génération d'URL absolues (ex: QR codes)
 SITE_BASE_URL = os.environ.get('SITE_BASE_URL', 'http://localhost:8000').rstrip('/')
 
+# Moteur de combat par défaut : un moteur validé de armies.services.BATTLE_ENGINES
+ARMIES_BATTLE_ENGINE = os.environ.get('ARMIES_BATTLE_ENGINE', 'python')
+# Instrumente chaque combat (temps par phase, compteurs) : armies.services.BattleProfile
+ARMIES_PROFILE_BATTLES = os.environ.get('ARMIES_PROFILE_BATTLES', '') == '1'
+
 # Security settings
 # Set these to True in production
 SECURE_SSL_REDIRECT = False
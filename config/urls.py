@@ -28,6 +28,7 @@ urlpatterns = [
     path('siege/', include('armies.urls')),
     path('placement/', armies_views.placement_page, name='placement'),
     path('replay/<int:battle_id>/', armies_views.replay_page, name='replay'),
+    path('replay/live/', armies_views.live_replay_page, name='live-replay'),
     # Alias API pour les appels JS du front (placement/attaques)
     path('api/armies/<int:army_id>/placement/', armies_views.placement_data),
     path('api/armies/<int:army_id>/attack-presets/', armies_views.attack_presets),